@@ -1,5 +1,5 @@
 import sys, os, shutil, time
-import sqlite3, json
+import sqlite3
 from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QLabel
 from PyQt5.QtWidgets import QComboBox
 from PyQt5.QtWidgets import QHBoxLayout
@@ -9,26 +9,20 @@ from PyQt5.QtWidgets import QGroupBox, QSizePolicy
 from PyQt5.QtWidgets import QScrollArea
 from PyQt5.QtWidgets import QPushButton, QSpinBox, QCheckBox, QDoubleSpinBox, QFileDialog, QDialog, QDialogButtonBox, QMessageBox
 from PyQt5.QtCore import Qt, QTimer, QPointF, QSettings, QStandardPaths
-from PyQt5.QtGui import QPainter, QPen, QColor, QFont, QIcon
+from PyQt5.QtGui import QPainter, QPen, QColor, QFont, QIcon, QPixmap, QPolygonF
 from functools import partial
 from datetime import datetime
-import csv
 import threading
+from realtime_store import RecordWriter, SampleStore, ensure_db, export_line
+from plot_data import MinMaxDecimator, RenderScheduler, RingBuffer, SlidingMinMax, polyline_xy
+import modbus_bus
+import modbus_discovery
+from modbus_async import crc16, with_crc
 try:
     from PyQt5.QtSerialPort import QSerialPortInfo, QSerialPort
 except Exception:
     QSerialPortInfo = None
     QSerialPort = None
-try:
-    import serial
-except Exception:
-    serial = None
-try:
-    import modbus_tk
-    from modbus_tk import modbus_rtu
-except Exception:
-    modbus_tk = None
-    modbus_rtu = None
 class BlandPage(QWidget):
     def __init__(self):
         super().__init__()
@@ -57,7 +51,16 @@ class BlandPage(QWidget):
             pass
         self.db_path = os.path.join(self.var_dir, 'ems.db')
         self.recording_flag_path = os.path.join(self.var_dir, 'recording.lock')
-        self.db_conn = None
+        # 各從站的暫存器位置與換算（取代固定的 /10.0）
+        self.register_map = modbus_bus.RegisterMap.load(os.path.join(base_dir, 'real_time_monitoring', 'register_map.json'))
+        # 匯流排鮑率；掃描結果快取以 (串口, 鮑率, 地址) 為鍵，跨次啟動保留
+        self.bus_baud = 9600
+        self.discovery_cache = modbus_discovery.DiscoveryCache(os.path.join(base_dir, 'real_time_monitoring', 'discovery_cache.json'))
+        # 每條生產線在記憶體中保留的樣本數（1 秒取樣約 10 小時）
+        self.sample_capacity = 36000
+        self.db_writer = None
+        # 關閉程序開始後不再建立寫入執行緒
+        self._closing = False
         self._init_db()
 
         controls_group = QGroupBox("顯示設定")
@@ -72,8 +75,17 @@ class BlandPage(QWidget):
         self.interval_spin.setRange(50, 5000)
         self.interval_spin.setValue(500)
         self.points_spin = QSpinBox()
-        self.points_spin.setRange(30, 1000)
+        self.points_spin.setRange(30, 200000)
         self.points_spin.setValue(120)
+        # 畫面更新率上限，與取樣頻率分開：各生產線只標記 dirty，統一由 render_timer 重繪
+        self.render = RenderScheduler(int(self.settings.value('render_fps', 20)))
+        self.fps_spin = QSpinBox()
+        self.fps_spin.setRange(1, 60)
+        self.fps_spin.setValue(self.render.fps)
+        self.render_timer = QTimer(self)
+        self.render_timer.setInterval(self.render.interval_ms)
+        self.render_timer.timeout.connect(self.render.flush)
+        self.render_timer.start()
         self.autoscale_check = QCheckBox()
         self.autoscale_check.setChecked(True)
         self.min_spin = QDoubleSpinBox()
@@ -93,6 +105,11 @@ class BlandPage(QWidget):
             self.shared_port_combo.addItem("空白")
             self.shared_port_combo.addItem("未偵測到串口")
         self.refresh_ports_btn = QPushButton("刷新串口")
+        # 掃描範圍與鮑率清單，例如 1-32,100-110 / 9600,19200
+        self.scan_addr_edit = QLineEdit(str(self.settings.value('scan_addresses', modbus_discovery.DEFAULT_ADDRESSES)))
+        self.scan_baud_edit = QLineEdit(str(self.settings.value('scan_bauds', modbus_discovery.DEFAULT_BAUDS)))
+        self.scan_addr_edit.setMaximumWidth(120)
+        self.scan_baud_edit.setMaximumWidth(120)
         h_layout = QHBoxLayout()
         h_layout.setSpacing(8)  # 减少控件间距，压缩高度
         h_layout.setContentsMargins(0, 2, 0, 2)  # 减少上下边距
@@ -101,6 +118,8 @@ class BlandPage(QWidget):
         h_layout.addWidget(self.refresh_ports_btn)
         h_layout.addWidget(QLabel("更新頻率(ms):"))
         h_layout.addWidget(self.interval_spin)
+        h_layout.addWidget(QLabel("畫面更新(FPS):"))
+        h_layout.addWidget(self.fps_spin)
         h_layout.addWidget(QLabel("顯示點數:"))
         h_layout.addWidget(self.points_spin)
         h_layout.addWidget(QLabel("自動縮放:"))
@@ -124,8 +143,24 @@ class BlandPage(QWidget):
         save_layout.addWidget(self.save_format_label)
         save_layout.addStretch()
         controls_form.addRow(save_layout)
+        scan_layout = QHBoxLayout()
+        scan_layout.setSpacing(8)
+        scan_layout.setContentsMargins(0, 2, 0, 2)
+        scan_layout.addWidget(QLabel('掃描地址:'))
+        scan_layout.addWidget(self.scan_addr_edit)
+        scan_layout.addWidget(QLabel('鮑率:'))
+        scan_layout.addWidget(self.scan_baud_edit)
+        scan_layout.addStretch()
+        controls_form.addRow(scan_layout)
         self.port_scan_label = QLabel('設備掃描: 未執行')
         controls_form.addRow(self.port_scan_label)
+        self.db_stats_label = QLabel('資料庫寫入: --')
+        self.db_stats_label.setStyleSheet("font-size: 11px; color: #6c757d;")
+        controls_form.addRow(self.db_stats_label)
+        self.db_stats_timer = QTimer(self)
+        self.db_stats_timer.setInterval(1000)
+        self.db_stats_timer.timeout.connect(self._update_db_stats)
+        self.db_stats_timer.start()
         controls_group.setLayout(controls_form)
         controls_group.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
 
@@ -166,10 +201,14 @@ class BlandPage(QWidget):
         self.add_btn.clicked.connect(self._add_section)
         self.remove_btn.clicked.connect(self._remove_section)
         self.refresh_ports_btn.clicked.connect(self._refresh_ports)
+        self.shared_port_combo.currentTextChanged.connect(lambda _: self._fill_all_addr_combos_from_cache())
         self.change_save_btn.clicked.connect(self._change_storage_settings)
+        self.scan_addr_edit.editingFinished.connect(self._save_scan_settings)
+        self.scan_baud_edit.editingFinished.connect(self._save_scan_settings)
         
         self.interval_spin.valueChanged.connect(self._update_interval)
         self.points_spin.valueChanged.connect(self._update_points)
+        self.fps_spin.valueChanged.connect(self._update_fps)
         self.autoscale_check.toggled.connect(self._toggle_autoscale)
         self.min_spin.valueChanged.connect(self._update_fixed_range)
         self.max_spin.valueChanged.connect(self._update_fixed_range)
@@ -200,6 +239,8 @@ class BlandPage(QWidget):
                 return ports
             for pat in patterns:
                 ports.extend(glob.glob(pat))
+        # 額外串口（例如 modbus_sim.py 建立的虛擬 pty），以 os.pathsep 分隔
+        ports.extend(p for p in os.environ.get('EMS_EXTRA_PORTS', '').split(os.pathsep) if p)
         return sorted(set(ports))
 
     def create_box(self, title):
@@ -296,6 +337,7 @@ class BlandPage(QWidget):
         chart_group = QGroupBox("時序圖")
         dual_plot = DualLinePlot(color1=QColor(220,20,60), color2=QColor(30,144,255), parent=chart_group)
         dual_plot.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        dual_plot.scheduler = self.render
         chart_group.setStyleSheet(
             "QGroupBox { "
             "  font-weight: bold; "
@@ -414,18 +456,21 @@ class BlandPage(QWidget):
             'data_source_label': data_source_label,
             'timer': QTimer(self),
             'start_time': None,
-            'records': [],
+            'records': None,
+            'export_since': None,
             'box': box,
             'mode': 'idle',
-            'master': None,
+            'bus': None,
+            'subs': [],
             'port': None,
             'latest_temp': None,
             'latest_current': None,
-            'reader_thread': None,
-            'reader_stop': None,
             'temp_addr_value': None,
-            'current_addr_value': None
+            'current_addr_value': None,
+            'scanned': set()  # 手動掃描過的地址選單（'temp'/'current'），快取不覆蓋
         }
+        # 樣本緩衝固定容量，超過時整塊寫到暫存目錄，匯出時再依序讀回
+        s['records'] = SampleStore(self.sample_capacity, os.path.join(self.var_dir, f"samples_{id(s)}.bin"))
         s['timer'].setInterval(int(self.interval_spin.value()))
         s['timer'].timeout.connect(partial(self._tick_section, s))
         # 延遲初始化圖表高度，等待主窗口完成佈局
@@ -451,6 +496,7 @@ class BlandPage(QWidget):
 
     def _add_section(self):
         box = self.create_box(f"生產線{len(self.sections)+1}")
+        self._fill_addr_combos_from_cache(self.sections[-1])
         self._refresh_grid()
         self._update_interval(self.interval_spin.value())
         self._update_points(self.points_spin.value())
@@ -459,21 +505,18 @@ class BlandPage(QWidget):
     def _remove_section(self):
         if not self.sections:
             return
-        s = self.sections.pop()
-        if s['timer'].isActive():
-            s['timer'].stop()
-        w = s['box']
-        self.section_grid.removeWidget(w)
-        w.deleteLater()
-        self._refresh_grid()
+        self._remove_section_box(self.sections[-1])
 
     def _remove_section_box(self, s):
         if s in self.sections:
             if s['timer'].isActive():
                 s['timer'].stop()
+            self.render.forget(*self._section_render_widgets(s))
             w = s['box']
             self.section_grid.removeWidget(w)
             w.deleteLater()
+            self._release_section_bus(s)
+            s['records'].clear()
             self.sections.remove(s)
             self._refresh_grid()
 
@@ -509,55 +552,49 @@ class BlandPage(QWidget):
         except Exception:
             pass
 
-    def _mb_crc(self, data):
-        crc = 0xFFFF
-        for b in data:
-            crc ^= b
-            for _ in range(8):
-                if crc & 1:
-                    crc = (crc >> 1) ^ 0xA001
-                else:
-                    crc >>= 1
-        return crc
-
     def _mb_build_report_slave_id(self, addr):
-        base = bytes([addr, 0x11])
-        crc = self._mb_crc(base)
-        return base + bytes([crc & 0xFF, (crc >> 8) & 0xFF])
+        return with_crc(bytes([addr, 0x11]))
+
+    def _scan_settings(self):
+        try:
+            addrs = modbus_discovery.parse_addresses(self.scan_addr_edit.text())
+        except Exception:
+            addrs = []
+        try:
+            bauds = modbus_discovery.parse_bauds(self.scan_baud_edit.text())
+        except Exception:
+            bauds = []
+        return (addrs or modbus_discovery.parse_addresses(modbus_discovery.DEFAULT_ADDRESSES),
+                bauds or modbus_discovery.parse_bauds(modbus_discovery.DEFAULT_BAUDS))
 
-    def _scan_addresses(self, port_name, baud=9600, max_addr=32, timeout_ms=150):
+    def _save_scan_settings(self):
+        self.settings.setValue('scan_addresses', self.scan_addr_edit.text().strip())
+        self.settings.setValue('scan_bauds', self.scan_baud_edit.text().strip())
+
+    def _scan_addresses(self, port_name, baud=9600, addresses=None, timeout_ms=300, on_found=None):
+        """掃描串口上的從站地址；on_found(addr) 在背景執行緒中逐一回報"""
         found = []
-        if modbus_rtu is not None and serial is not None:
-            try:
-                ser = serial.Serial(port_name, baudrate=baud, bytesize=8, parity='N', stopbits=1, timeout=timeout_ms/1000.0)
-            except Exception:
-                return found
-            try:
-                master = modbus_rtu.RtuMaster(ser)
-                master.set_timeout(timeout_ms/1000.0)
-                master.set_verbose(False)
-            except Exception:
+        if addresses is None:
+            addresses = range(1, 33)
+        def report(addr):
+            found.append(addr)
+            if on_found:
+                on_found(addr)
+        bus = modbus_bus.get_bus(port_name)
+        if bus is not None:
+            # 串口已被匯流排占用時，掃描請求插隊送出，不另開串口
+            for addr in addresses:
                 try:
-                    ser.close()
-                except Exception:
-                    pass
-                return found
-            for addr in range(1, max_addr+1):
-                try:
-                    # 只接受回應長度=2（1 暫存器）的設備，降低誤判
-                    rr = master.execute(addr, 3, 0, 1)
+                    rr = bus.call(addr, 3, 0, 1)
                     if rr and len(rr) == 1:
-                        found.append(addr)
+                        report(addr)
                 except Exception:
                     pass
-            try:
-                master.close()
-            except Exception:
-                pass
-            try:
-                ser.close()
-            except Exception:
-                pass
+            return found
+        if modbus_bus.rtu_available():
+            # 依實測回應時間調整逾時，無回應的地址只花一個短逾時
+            modbus_discovery.scan_port(port_name, list(addresses), [baud], on_found=lambda p, b, a: report(a),
+                                       max_timeout=timeout_ms/1000.0)
             return found
         if QSerialPort is not None:
             sp = QSerialPort(port_name)
@@ -567,7 +604,7 @@ class BlandPage(QWidget):
             sp.setStopBits(QSerialPort.OneStop)
             if not sp.open(QSerialPort.ReadWrite):
                 return found
-            for addr in range(1, max_addr+1):
+            for addr in addresses:
                 req = self._mb_build_report_slave_id(addr)
                 sp.write(req)
                 sp.waitForBytesWritten(timeout_ms)
@@ -576,50 +613,43 @@ class BlandPage(QWidget):
                     if len(resp) >= 4 and resp[0] == addr:
                         d = resp[:-2]
                         crc = resp[-2] | (resp[-1] << 8)
-                        if self._mb_crc(d) == crc:
-                            found.append(addr)
+                        if crc16(d) == crc:
+                            report(addr)
             sp.close()
             return found
-        if serial is not None:
-            try:
-                ser = serial.Serial(port_name, baudrate=baud, bytesize=8, parity='N', stopbits=1, timeout=timeout_ms/1000.0)
-            except Exception:
-                return found
-            for addr in range(1, max_addr+1):
-                req = self._mb_build_report_slave_id(addr)
-                try:
-                    ser.write(req)
-                    resp = ser.read(64)
-                except Exception:
-                    resp = b''
-                if len(resp) >= 4 and resp[0] == addr:
-                    d = resp[:-2]
-                    crc = resp[-2] | (resp[-1] << 8)
-                    if self._mb_crc(d) == crc:
-                        found.append(addr)
-            try:
-                ser.close()
-            except Exception:
-                pass
-            return found
         return found
 
     def _scan_addresses_for_section(self, s, which):
         """掃描後讓使用者可選「空白」跳過，不強制接受掃描結果"""
-        if which == 'temp':
-            port = self._selected_port()
-            combo = s['temp_addr']
-        else:
-            port = self._selected_port()
-            combo = s['current_addr']
-        addrs = self._scan_addresses(port)
+        port = self._selected_port()
+        combo = s['temp_addr'] if which == 'temp' else s['current_addr']
+        addresses, _ = self._scan_settings()
         combo.clear()
         # 永遠保留「空白」選項（電流）或「未偵測到」
         combo.addItem("空白")
-        if addrs:
-            combo.addItems([str(a) for a in addrs])
-        else:
-            combo.addItem("未偵測到")
+        combo.addItem("掃描中...")
+        # 背景掃描，找到的地址立即加入下拉選單
+        def add(addr):
+            if combo.findText(str(addr)) < 0:
+                combo.insertItem(combo.count() - 1, str(addr))
+        def finish(addrs):
+            idx = combo.findText("掃描中...")
+            if idx >= 0:
+                combo.removeItem(idx)
+            if not addrs:
+                combo.addItem("未偵測到")
+        s['scanned'].add(which)
+        def worker():
+            try:
+                addrs = self._scan_addresses(port, baud=self.bus_baud, addresses=addresses,
+                                             on_found=lambda a: QTimer.singleShot(0, partial(add, a)))
+            except Exception:
+                addrs = []
+            if port:
+                self.discovery_cache.replace_scan(port, self.bus_baud, addresses, addrs)
+                self.discovery_cache.save()
+            QTimer.singleShot(0, partial(finish, addrs))
+        threading.Thread(target=worker, daemon=True).start()
 
     def _refresh_ports(self):
         ports = self.list_serial_ports()
@@ -639,54 +669,43 @@ class BlandPage(QWidget):
             s['start_btn'].setEnabled(False)
             s['timer'].start()
             self._set_recording_active(True)
-            if ok and s.get('master'):
-                stop_event = threading.Event()
-                s['reader_stop'] = stop_event
-                def run():
-                    self._reader_loop(s)
-                t = threading.Thread(target=run, daemon=True)
-                s['reader_thread'] = t
-                t.start()
+            if ok:
+                self._subscribe_section(s)
 
     def _tick_section(self, s):
         t = (datetime.now() - s['start_time']).total_seconds() if s['start_time'] else 0
         temp = s.get('latest_temp')
         current = s.get('latest_current')
+        render = self.render
         if temp is not None:
-            s['temp_label'].setText(f"溫度: {temp:.1f} °C")
+            render.set_text(s['temp_label'], f"溫度: {temp:.1f} °C")
         else:
-            s['temp_label'].setText("溫度: -- °C")
+            render.set_text(s['temp_label'], "溫度: -- °C")
         if current is None and (s['current_addr'].currentText() == "空白"):
-            s['current_label'].setText("電流: 未安裝")
-            s['current_label'].setStyleSheet("color: gray;")
+            render.set_text(s['current_label'], "電流: 未安裝", "color: gray;")
         elif current is not None:
-            s['current_label'].setStyleSheet("")
-            s['current_label'].setText(f"電流: {current:.2f} A")
+            render.set_text(s['current_label'], f"電流: {current:.2f} A", "")
         else:
-            s['current_label'].setText("電流: -- A")
+            render.set_text(s['current_label'], "電流: -- A")
         hh = int(t // 3600)
         mm = int((t % 3600) // 60)
         ss = int(t % 60)
-        s['duration_label'].setText(f"運行時長: {hh:02d}:{mm:02d}:{ss:02d}")
+        render.set_text(s['duration_label'], f"運行時長: {hh:02d}:{mm:02d}:{ss:02d}")
         s['plot'].append(temp if temp is not None else 0.0, current if current is not None else 0.0)
-        s['records'].append({
-            'line': s['name'],
-            'shift': s['shift'].currentText(),
-            'work_order': s['material'].text(),
-            'time': datetime.now().isoformat(timespec='seconds'),
-            'temperature': round(temp if temp is not None else 0.0, 3),
-            'current': round(current if current is not None else 0.0, 3)
-        })
-        r = s['records'][-1]
+        now = time.time()
+        shift = s['shift'].currentText()
+        work_order = s['material'].text()
+        temp_v = round(temp if temp is not None else 0.0, 3)
+        current_v = round(current if current is not None else 0.0, 3)
+        if s['export_since'] is None:
+            s['export_since'] = now
+        try:
+            s['records'].append(now, s['name'], shift, work_order, temp_v, current_v)
+        except OSError as e:
+            # 暫存檔寫入失敗（例如磁碟滿）只丟掉這個區塊，取樣與資料庫寫入照常
+            print(f"樣本暫存檔寫入失敗 ({s['name']}): {e}")
         try:
-            data = {
-                'line': r['line'],
-                'shift': r['shift'],
-                'work_order': r['work_order'],
-                'temperature': r['temperature'],
-                'current': r['current']
-            }
-            self._insert_record(r['time'], json.dumps(data, ensure_ascii=False))
+            self._insert_record(now, s['name'], shift, work_order, temp_v, current_v)
         except Exception:
             pass
         self._touch_recording_flag()
@@ -695,17 +714,7 @@ class BlandPage(QWidget):
         if s['timer'].isActive():
             s['timer'].stop()
             s['start_btn'].setEnabled(True)
-        if s.get('reader_stop'):
-            try:
-                s['reader_stop'].set()
-            except Exception:
-                pass
-        if s.get('reader_thread'):
-            try:
-                s['reader_thread'].join(timeout=0.5)
-            except Exception:
-                pass
-            s['reader_thread'] = None
+        self._release_section_bus(s)
         self._export_section(s)
         if not self._any_recording_active():
             self._set_recording_active(False)
@@ -713,30 +722,17 @@ class BlandPage(QWidget):
     def _reset_section(self, s):
         if s['timer'].isActive():
             s['timer'].stop()
-        if s.get('reader_stop'):
-            try:
-                s['reader_stop'].set()
-            except Exception:
-                pass
-        if s.get('reader_thread'):
-            try:
-                s['reader_thread'].join(timeout=0.5)
-            except Exception:
-                pass
-            s['reader_thread'] = None
+        self._release_section_bus(s)
         s['start_time'] = None
         s['mode'] = 'idle'
-        if s.get('master'):
-            try:
-                s['master'].close()
-            except Exception:
-                pass
-            s['master'] = None
+        # 丟棄尚未套用的文字，避免下一幀蓋掉重置後的內容
+        self.render.forget(s['temp_label'], s['current_label'], s['duration_label'])
         s['duration_label'].setText("運行時長: 00:00:00")
         s['temp_label'].setText("溫度: -- °C")
         s['current_label'].setText("電流: -- A")
         s['plot'].clear()
         s['records'].clear()
+        s['export_since'] = None
         s['data_source_label'].setText("資料來源: 未開始")
         s['data_source_label'].setStyleSheet("")
         s['temp_status'].setText("狀態: 未檢查")
@@ -754,36 +750,33 @@ class BlandPage(QWidget):
         ts = datetime.now().strftime('%Y%m%d_%H%M%S')
         name = f"{s['name']}_{ts}.{self.save_format}"
         path = os.path.join(self.save_path, name)
-        tmp = path + '.tmp'
+        # 先從 ems.db 依生產線與時間區間串流匯出，資料庫不可用時改用記憶體緩衝；皆為 .tmp 再替換
+        # 關閉程式時寫入執行緒已先排空並關閉
+        flush = (lambda: self.db_writer.flush(timeout=5.0)) if self.db_writer else None
         try:
             os.makedirs(self.save_path, exist_ok=True)
-            if self.save_format == 'csv':
-                with open(tmp, 'w', newline='', encoding='utf-8-sig') as f:
-                    w = csv.writer(f)
-                    w.writerow(["生產線", "班次", "工單號", "時間", "溫度", "電流"])
-                    for r in s['records']:
-                        w.writerow([r['line'], r['shift'], r['work_order'], r['time'], r['temperature'], r['current']])
-            else:
-                with open(tmp, 'w', encoding='utf-8-sig') as f:
-                    f.write("生產線\t班次\t工單號\t時間\t溫度\t電流\r\n")
-                    for r in s['records']:
-                        f.write(f"{r['line']}\t{r['shift']}\t{r['work_order']}\t{r['time']}\t{r['temperature']}\t{r['current']}\r\n")
-            os.replace(tmp, path)
+            export_line(self.db_path, s['records'], path, self.save_format, line=s['name'],
+                        start=s['export_since'], flush=flush)
             size = os.path.getsize(path)
             ts2 = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             _show_auto_close_message(self, "儲存完成", f"路徑: {path}\n檔案大小: {_human_size(size)}\n時間: {ts2}")
         except Exception as e:
-            try:
-                if os.path.exists(tmp):
-                    os.remove(tmp)
-            except Exception:
-                pass
             QMessageBox.critical(self, "儲存失敗", str(e))
 
     def _update_interval(self, v):
         for s in self.sections:
             s['timer'].setInterval(int(v))
             s['interval_ms'] = int(v)
+            for sub in s['subs']:
+                sub.interval = int(v) / 1000.0
+
+    def _update_fps(self, v):
+        self.render.set_fps(v)
+        self.render_timer.setInterval(self.render.interval_ms)
+        self.settings.setValue('render_fps', int(v))
+
+    def _section_render_widgets(self, s):
+        return s['plot'], s['temp_label'], s['current_label'], s['duration_label']
 
     def _update_points(self, v):
         for s in self.sections:
@@ -801,22 +794,50 @@ class BlandPage(QWidget):
             s['plot'].setFixedRange(float(self.min_spin.value()), float(self.max_spin.value()))
 
     def _pre_scan_ports(self):
-        self.port_scan_label.setText('設備掃描: 進行中...')
+        # 先用快取立即填入有效串口與地址，再於背景以單一地址 ping 驗證；快取無效時才完整掃描
+        cached = self.discovery_cache.ports()
+        if cached:
+            self.active_ports = set(cached)
+            if not self._selected_port():
+                idx = next((self.shared_port_combo.findText(p) for p in cached if self.shared_port_combo.findText(p) >= 0), -1)
+                if idx >= 0:
+                    self.shared_port_combo.setCurrentIndex(idx)
+            self._fill_all_addr_combos_from_cache()
+            self.port_scan_label.setText('設備掃描: 快取 ' + ", ".join(p + "(✓)" for p in cached) + '，驗證中...')
+        else:
+            self.port_scan_label.setText('設備掃描: 進行中...')
+        # 元件狀態只能在 GUI 執行緒讀取，先取出再交給背景執行緒
+        addresses, bauds = self._scan_settings()
         def worker():
             all_ports = self.list_serial_ports()
-            try:
-                active = scan_modbus_devices(timeout=0.3, ports=all_ports)
-            except Exception:
-                active = []
+            active = []
+            if cached:
+                try:
+                    active = modbus_discovery.revalidate(self.discovery_cache, timeout=0.3)
+                except Exception:
+                    active = []
+            if not active:
+                def on_found(port, baud, addr):
+                    self.discovery_cache.record(port, baud, addr)
+                    QTimer.singleShot(0, partial(self._mark_port_active, port))
+                try:
+                    active = scan_modbus_devices(timeout=0.3, ports=all_ports, addresses=addresses, bauds=bauds,
+                                                 on_found=on_found)
+                except Exception:
+                    active = []
+                self.discovery_cache.save()
             def apply():
                 self.active_ports = set(active)
                 old_text = self.shared_port_combo.currentText()
+                self.shared_port_combo.blockSignals(True)
                 self.shared_port_combo.clear()
                 self.shared_port_combo.addItem("空白")
                 self.shared_port_combo.addItems(all_ports)
                 idx = self.shared_port_combo.findText(old_text)
                 if idx >= 0:
                     self.shared_port_combo.setCurrentIndex(idx)
+                self.shared_port_combo.blockSignals(False)
+                self._fill_all_addr_combos_from_cache()
                 if all_ports:
                     summary = ", ".join([p + ("(✓)" if p in self.active_ports else "(✗)") for p in all_ports])
                     self.port_scan_label.setText("設備掃描: " + summary)
@@ -825,6 +846,36 @@ class BlandPage(QWidget):
             QTimer.singleShot(0, apply)
         threading.Thread(target=worker, daemon=True).start()
 
+    def _fill_all_addr_combos_from_cache(self):
+        for s in self.sections:
+            self._fill_addr_combos_from_cache(s)
+
+    def _fill_addr_combos_from_cache(self, s):
+        """尚未手動掃描的地址選單，用快取地址填入，並選回上次使用的地址"""
+        if s['timer'].isActive():
+            return
+        if {'temp', 'current'} <= s['scanned']:
+            return
+        port = self._selected_port()
+        addrs = [str(a) for a in self.discovery_cache.addresses(port, self.bus_baud)] if port else []
+        if not addrs:
+            return
+        for which, combo in (('temp', s['temp_addr']), ('current', s['current_addr'])):
+            if which in s['scanned']:
+                continue
+            combo.clear()
+            combo.addItem("空白")
+            combo.addItems(addrs)
+            last = str(self.settings.value(f"addr/{s['name']}/{which}", ''))
+            idx = combo.findText(last) if last else -1
+            if idx >= 0:
+                combo.setCurrentIndex(idx)
+
+    def _mark_port_active(self, port):
+        """掃描途中每發現一個有效串口就先更新標籤"""
+        self.active_ports.add(port)
+        self.port_scan_label.setText('設備掃描: 進行中... ' + ", ".join(p + "(✓)" for p in sorted(self.active_ports)))
+
     def _selected_port(self):
         txt = self.shared_port_combo.currentText() or ""
         if txt == "空白" or txt == "未偵測到串口":
@@ -849,30 +900,28 @@ class BlandPage(QWidget):
             except Exception:
                 current_addr = None
         ok = False
-        master = None
-        if modbus_rtu is not None and serial is not None and port:
+        bus = None
+        if port:
             try:
-                ser = serial.Serial(port, baudrate=9600, bytesize=8, parity='N', stopbits=1, timeout=0.3)
-                master = modbus_rtu.RtuMaster(ser)
-                master.set_timeout(0.3)
-                master.set_verbose(False)
-                if temp_addr is not None:
-                    try:
-                        master.execute(temp_addr, 3, 0, 1)
-                        ok = True
-                    except Exception:
-                        ok = False
-                if not ok and current_addr is not None:
+                # 同一串口只開一次，由 BusScheduler 統一排程所有生產線的請求
+                bus = modbus_bus.acquire_bus(port, self.bus_baud, 0.3)
+                for addr in (temp_addr, current_addr):
+                    if addr is None:
+                        continue
                     try:
-                        master.execute(current_addr, 3, 0, 1)
+                        bus.call(addr, 3, 0, 1)
                         ok = True
+                        break
                     except Exception:
                         ok = False
             except Exception:
-                master = None
-        if ok and master is not None:
+                bus = None
+        if ok and bus is not None:
             s['mode'] = 'real'
-            s['master'] = master
+            s['bus'] = bus
+            # 記住本次使用的地址，下次啟動由快取直接選回
+            self.settings.setValue(f"addr/{s['name']}/temp", temp_txt)
+            self.settings.setValue(f"addr/{s['name']}/current", cur_txt)
             s['port'] = port
             s['temp_addr_value'] = temp_addr
             s['current_addr_value'] = current_addr
@@ -895,13 +944,13 @@ class BlandPage(QWidget):
                 s['current_status'].setText("狀態: 未設定")
                 s['current_status'].setStyleSheet("color: orange;")
         else:
-            if master:
+            if bus:
                 try:
-                    master.close()
+                    modbus_bus.release_bus(bus)
                 except Exception:
                     pass
             # 不再提供模擬 fallback，直接標示離線
-            s['master'] = None
+            s['bus'] = None
             s['port'] = None
             s['data_source_label'].setText("資料來源: 離線")
             s['data_source_label'].setStyleSheet("color: red;")
@@ -911,63 +960,35 @@ class BlandPage(QWidget):
             s['current_status'].setStyleSheet("color: red;")
         return ok
 
-    def _read_section_data(self, s, t):
-        """只讀真實設備，失敗即回傳 (None, None)，不再模擬"""
-        master = s.get('master')
-        if not master:
-            return None, None
-        temp = None
-        current = None
-        temp_txt = s['temp_addr'].currentText()
-        cur_txt = s['current_addr'].currentText()
-        try:
-            temp_addr = int(temp_txt) if temp_txt and temp_txt.isdigit() else None
-        except Exception:
-            temp_addr = None
-        try:
-            current_addr = int(cur_txt) if cur_txt and cur_txt.isdigit() else None
-        except Exception:
-            current_addr = None
+    def _subscribe_section(self, s):
+        """向共用匯流排訂閱溫度/電流地址，讀值由匯流排執行緒回填 latest_*"""
+        bus = s.get('bus')
+        if not bus:
+            return
+        interval = max(0.05, float(s.get('interval_ms', 500)) / 1000.0)
+        # 同一從站的溫度/電流訂閱會由匯流排合併成一次區塊讀取
+        for field, key in (('temperature', 'temp_addr_value'), ('current', 'current_addr_value')):
+            addr = s.get(key)
+            if addr is None:
+                continue
+            fields = self.register_map.fields(addr, field, only=(field,))
+            latest = 'latest_temp' if field == 'temperature' else 'latest_current'
+            def on_values(values, field=field, latest=latest):
+                s[latest] = values.get(field) if values else None
+            s['subs'].append(bus.subscribe_fields(addr, fields, interval, on_values))
+
+    def _release_section_bus(self, s):
+        bus = s.get('bus')
+        if not bus:
+            return
+        for sub in s['subs']:
+            bus.unsubscribe(sub)
+        s['subs'] = []
+        s['bus'] = None
         try:
-            if temp_addr is not None:
-                r = master.execute(temp_addr, 3, 0, 1)
-                v = r[0] if isinstance(r, (list, tuple)) and r else 0
-                temp = float(v) / 10.0
-            if current_addr is not None:
-                r2 = master.execute(current_addr, 3, 0, 1)
-                v2 = r2[0] if isinstance(r2, (list, tuple)) and r2 else 0
-                current = float(v2)
-            return temp, current
+            modbus_bus.release_bus(bus)
         except Exception:
-            # 連線異常，不回傳模擬值
-            return None, None
-
-    def _reader_loop(self, s):
-        master = s.get('master')
-        temp_addr = s.get('temp_addr_value')
-        current_addr = s.get('current_addr_value')
-        ev = s.get('reader_stop')
-        while master and ev and not ev.is_set():
-            temp = None
-            current = None
-            try:
-                if temp_addr is not None:
-                    r = master.execute(temp_addr, 3, 0, 1)
-                    v = r[0] if isinstance(r, (list, tuple)) and r else 0
-                    temp = float(v) / 10.0
-                if current_addr is not None:
-                    r2 = master.execute(current_addr, 3, 0, 1)
-                    v2 = r2[0] if isinstance(r2, (list, tuple)) and r2 else 0
-                    current = float(v2)
-            except Exception:
-                temp = None
-                current = None
-            s['latest_temp'] = temp
-            s['latest_current'] = current
-            try:
-                time.sleep(max(0.05, float(s.get('interval_ms', 500))/1000.0))
-            except Exception:
-                time.sleep(0.2)
+            pass
 
     def _update_save_labels(self):
         self.save_path_label.setText(self.save_path)
@@ -1010,25 +1031,66 @@ class BlandPage(QWidget):
         self._apply_equal_widths()
 
     def _init_db(self):
+        if self._closing:
+            return
         try:
-            self.db_conn = sqlite3.connect(self.db_path)
-            _ensure_db(self.db_conn)
+            conn = sqlite3.connect(self.db_path, timeout=5.0)
+            try:
+                ensure_db(conn)
+            finally:
+                conn.close()
+        except Exception as e:
+            # 舊版資料庫轉換失敗（例如同步程式正鎖著 ems.db）：寫入執行緒每次連線都會重試轉換，
+            # 轉換成功前不寫入，錯誤顯示在資料庫寫入狀態
+            print(f"資料庫初始化失敗: {e}")
+        try:
+            # 寫入改由背景執行緒合併提交（WAL + synchronous=NORMAL），不在 GUI 執行緒 fsync
+            self.db_writer = RecordWriter(self.db_path, flush_ms=200, max_rows=500)
+            self.db_writer.start()
         except Exception:
-            self.db_conn = None
+            self.db_writer = None
 
-    def _insert_record(self, ts, data):
+    def _insert_record(self, timestamp, line, shift, work_order, temperature, current):
         try:
-            if not self.db_conn:
+            if not self.db_writer:
                 self._init_db()
-            if not self.db_conn:
+            if not self.db_writer:
                 return
-            cur = self.db_conn.cursor()
-            cur.execute('INSERT INTO records (ts, data) VALUES (?, ?)', (ts, data))
-            self.db_conn.commit()
+            self.db_writer.put(timestamp, line, shift, work_order, temperature, current)
         except Exception:
             pass
 
+    def _update_db_stats(self):
+        if not self.db_writer:
+            self.db_stats_label.setText('資料庫寫入: 未連線')
+            return
+        st = self.db_writer.stats()
+        last = st['last_commit_ms']
+        text = (f"資料庫寫入: 佇列 {st['queue_depth']} 筆, 已提交 {st['rows']} 筆 / {st['commits']} 次, "
+                f"最近提交 {'--' if last is None else f'{last:.1f}'} ms, 最長 {st['max_commit_ms']:.1f} ms")
+        if st['errors']:
+            text += f", 失敗 {st['errors']} 次 ({st['last_error']})"
+        self.db_stats_label.setText(text)
+
     def closeEvent(self, event):
+        self._closing = True
+        # 先停止取樣並退訂匯流排：匯出提示的巢狀 exec_() 仍會跑計時器，
+        # 否則 _tick_section 會在寫入執行緒關閉後重新建立一個
+        for s in self.sections:
+            if s['timer'].isActive():
+                s['timer'].stop()
+            self._release_section_bus(s)
+        try:
+            if self.db_writer:
+                # 關閉前把佇列中的樣本全部寫入
+                self.db_writer.close(timeout=5.0)
+                self.db_writer = None
+        except Exception:
+            pass
+        try:
+            modbus_bus.close_all()
+        except Exception:
+            pass
         if self._ensure_settings_valid():
             saved_any = False
             for s in self.sections:
@@ -1038,11 +1100,6 @@ class BlandPage(QWidget):
             if not saved_any:
                 event.accept()
                 return
-        try:
-            if self.db_conn:
-                self.db_conn.close()
-        except Exception:
-            pass
         try:
             if os.path.exists(self.recording_flag_path):
                 os.remove(self.recording_flag_path)
@@ -1096,12 +1153,21 @@ class LinePlot(QWidget):
     def __init__(self, color=QColor(0,0,0), parent=None):
         super().__init__(parent)
         self.color = color
-        self.data = []
         self.max_points = 120
+        self.data = RingBuffer(self.max_points)
+        # 繪圖前抽點到約每像素 2 點
+        self.lod = MinMaxDecimator(self.data)
+        # 設定後 append 只標記 dirty，由 RenderScheduler 依 FPS 上限重繪
+        self.scheduler = None
         self.auto_scale = True
         self.fixed_min = 0.0
         self.fixed_max = 100.0
         self.show_grid = True
+        # 畫筆、字型只建一次；背景/外框/網格快取在 pixmap，尺寸或格線設定改變才重畫
+        self.pen = _line_pen(self.color)
+        self.label_pen = QPen(QColor(100,100,100))
+        self.label_font = QFont("Arial", 9)
+        self._static = None
     
     def _delayed_init_height(self):
         """延遲初始化高度（在對象創建後調用）"""
@@ -1133,22 +1199,26 @@ class LinePlot(QWidget):
     def resizeEvent(self, event):
         """處理窗口大小改變事件"""
         super().resizeEvent(event)
+        self._static = None
         self._update_height()
 
     def append(self, v):
         self.data.append(float(v))
-        if len(self.data) > self.max_points:
-            self.data.pop(0)
-        self.update()
+        self._changed()
+
+    def _changed(self):
+        if self.scheduler is not None:
+            self.scheduler.mark(self)
+        else:
+            self.update()
 
     def clear(self):
-        self.data = []
+        self.data.clear()
         self.update()
 
     def setMaxPoints(self, n):
         self.max_points = int(n)
-        if len(self.data) > self.max_points:
-            self.data = self.data[-self.max_points:]
+        self.data.resize(self.max_points)
         self.update()
 
     def setAutoScale(self, flag):
@@ -1163,71 +1233,36 @@ class LinePlot(QWidget):
 
     def setShowGrid(self, flag):
         self.show_grid = bool(flag)
+        self._static = None
         self.update()
 
     def paintEvent(self, event):
         p = QPainter(self)
-        p.setRenderHint(QPainter.Antialiasing)  # 启用抗锯齿
-        p.fillRect(self.rect(), QColor(250,250,250))  # 更浅的背景色
-        
-        pen_axis = QPen(QColor(200,200,200))  # 更淡的轴线颜色
-        pen_axis.setWidth(1)
-        p.setPen(pen_axis)
-        
-        r = self.rect()
-        m = 8  # 减少边距，压缩空间
-        chart_rect = r.adjusted(m, m, -m, -m)
-        p.drawRect(chart_rect)
+        if self._static is None:
+            self._static = _plot_chrome(self.size(), self.show_grid)
+        p.drawPixmap(0, 0, self._static)
         
         if not self.data:
             return
             
         vals = self.data
-        x0 = chart_rect.left()
-        y0 = chart_rect.top()
-        w = chart_rect.width()
-        h = chart_rect.height()
+        x0, y0, w, h = _chart_geometry(self.rect())
         # 設置Y軸尺度為0-100
         vmin = 0.0
         vmax = 100.0
         scale_x = w / max(1, len(vals)-1)
-        pen = QPen(self.color)
-        pen.setWidth(2)  # 线条宽度
-        pen.setCapStyle(Qt.RoundCap)  # 圆角线帽
-        pen.setJoinStyle(Qt.RoundJoin)  # 圆角连接
-        p.setPen(pen)
-        
-        pts = []
-        for i, v in enumerate(vals):
-            x = x0 + i * scale_x
-            y = y0 + h - (v - vmin) * h / (vmax - vmin)
-            pts.append(QPointF(x, y))
+        p.setRenderHint(QPainter.Antialiasing)  # 启用抗锯齿
+        p.setPen(self.pen)
         
+        xs, ys = self.lod.points(w)
         # 绘制平滑曲线
-        if len(pts) > 1:
-            p.drawPolyline(pts)
+        if len(xs) > 1:
+            p.drawPolyline(_polygon(polyline_xy(xs, ys, x0, y0, scale_x, h, vmin, vmax)))
 
         if self.show_grid:
-            gpen = QPen(QColor(230,230,230))  # 更淡的网格线
-            gpen.setStyle(Qt.DotLine)
-            p.setPen(gpen)
-            
-            # 绘制水平网格线
-            for i in range(1, 5):
-                yy = y0 + i * h / 5.0
-                p.drawLine(QPointF(x0, yy), QPointF(x0 + w, yy))
-            
-            # 绘制垂直网格线
-            for i in range(1, 8):
-                xx = x0 + i * w / 8.0
-                p.drawLine(QPointF(xx, y0), QPointF(xx, y0 + h))
-            
             # 绘制数值标签
-            label_pen = QPen(QColor(100,100,100))
-            p.setPen(label_pen)
-            label_font = QFont("Arial", 9)
-            p.setFont(label_font)
-            
+            p.setPen(self.label_pen)
+            p.setFont(self.label_font)
             p.drawText(x0 + 6, y0 + 16, f"{vmax:.1f}")
             p.drawText(x0 + 6, y0 + h - 4, f"{vmin:.1f}")
 
@@ -1236,26 +1271,47 @@ class DualLinePlot(QWidget):
         super().__init__(parent)
         self.color1 = color1
         self.color2 = color2
-        self.data1 = []
-        self.data2 = []
         self.max_points = 120
+        # 環形緩衝：append O(1)，點數上限可到數十萬
+        self.data1 = RingBuffer(self.max_points)
+        self.data2 = RingBuffer(self.max_points)
+        # 自動縮放用的視窗極值，隨 append 遞增更新，重繪時不再掃描資料
+        self.range = SlidingMinMax(self.max_points)
+        # 繪圖前抽點到約每像素 2 點
+        self.lod1 = MinMaxDecimator(self.data1)
+        self.lod2 = MinMaxDecimator(self.data2)
+        # 設定後 append 只標記 dirty，由 RenderScheduler 依 FPS 上限重繪
+        self.scheduler = None
         self.auto_scale = True
         self.fixed_min = 0.0
         self.fixed_max = 100.0
         self.show_grid = True
+        # 畫筆、字型只建一次；背景/外框/網格快取在 pixmap，尺寸或格線設定改變才重畫
+        self.pen1 = _line_pen(self.color1)
+        self.pen2 = _line_pen(self.color2)
+        self.label_pen = QPen(QColor(100,100,100))
+        self.label_font = QFont("Arial", 9)
+        self._static = None
         # 延遲初始化高度，等待所有方法定義完成
     
     def append(self, v1, v2):
-        self.data1.append(float(v1))
-        self.data2.append(float(v2))
-        if len(self.data1) > self.max_points:
-            self.data1.pop(0)
-            self.data2.pop(0)
-        self.update()
+        v1 = float(v1)
+        v2 = float(v2)
+        self.data1.append(v1)
+        self.data2.append(v2)
+        self.range.push(v1, v2)
+        self._changed()
+
+    def _changed(self):
+        if self.scheduler is not None:
+            self.scheduler.mark(self)
+        else:
+            self.update()
 
     def clear(self):
-        self.data1 = []
-        self.data2 = []
+        self.data1.clear()
+        self.data2.clear()
+        self.range.clear()
         self.update()
     
     def _update_height(self):
@@ -1284,6 +1340,7 @@ class DualLinePlot(QWidget):
     def resizeEvent(self, event):
         """處理窗口大小改變事件"""
         super().resizeEvent(event)
+        self._static = None
         self._update_height()
     
     def _delayed_init_height(self):
@@ -1292,9 +1349,9 @@ class DualLinePlot(QWidget):
 
     def setMaxPoints(self, n):
         self.max_points = int(n)
-        if len(self.data1) > self.max_points:
-            self.data1 = self.data1[-self.max_points:]
-            self.data2 = self.data2[-self.max_points:]
+        self.data1.resize(self.max_points)
+        self.data2.resize(self.max_points)
+        self.range.resize(self.max_points)
         self.update()
 
     def setAutoScale(self, flag):
@@ -1308,97 +1365,100 @@ class DualLinePlot(QWidget):
 
     def setShowGrid(self, flag):
         self.show_grid = bool(flag)
+        self._static = None
         self.update()
 
     def paintEvent(self, event):
         p = QPainter(self)
-        p.setRenderHint(QPainter.Antialiasing)  # 启用抗锯齿
-        p.fillRect(self.rect(), QColor(250,250,250))  # 更浅的背景色
-        
-        pen_axis = QPen(QColor(200,200,200))  # 更淡的轴线颜色
-        pen_axis.setWidth(1)
-        p.setPen(pen_axis)
-        
-        r = self.rect()
-        m = 8  # 减少边距，压缩空间
-        chart_rect = r.adjusted(m, m, -m, -m)
-        p.drawRect(chart_rect)
+        if self._static is None:
+            self._static = _plot_chrome(self.size(), self.show_grid)
+        p.drawPixmap(0, 0, self._static)
         
         if not self.data1:
             return
             
-        x0 = chart_rect.left()
-        y0 = chart_rect.top()
-        w = chart_rect.width()
-        h = chart_rect.height()
-        vals1 = self.data1
-        vals2 = self.data2 if self.data2 else [0]*len(vals1)
-        # 單 Y 軸：合併兩組資料取極值
-        all_vals = vals1 + vals2
+        x0, y0, w, h = _chart_geometry(self.rect())
+        # 單 Y 軸：兩組資料的視窗極值由 SlidingMinMax 維護
         if self.auto_scale:
-            if all_vals:
-                vmin = min(all_vals)
-                vmax = max(all_vals)
-                delta = (vmax - vmin) * 0.05 or 1.0
-                vmin -= delta
-                vmax += delta
-            else:
-                vmin, vmax = 0.0, 100.0
+            vmin = self.range.min
+            vmax = self.range.max
+            delta = (vmax - vmin) * 0.05 or 1.0
+            vmin -= delta
+            vmax += delta
         else:
             vmin, vmax = self.fixed_min, self.fixed_max
-        # 兩條線共用同一尺度
-        vmin1 = vmin2 = vmin
-        vmax1 = vmax2 = vmax
-        scale_x = w / max(1, len(vals1)-1)
-
-        pen1 = QPen(self.color1); pen1.setWidth(2)
-        pen1.setCapStyle(Qt.RoundCap)
-        pen1.setJoinStyle(Qt.RoundJoin)
-        
-        pen2 = QPen(self.color2); pen2.setWidth(2)
-        pen2.setCapStyle(Qt.RoundCap)
-        pen2.setJoinStyle(Qt.RoundJoin)
-
-        # draw grid
-        if self.show_grid:
-            gpen = QPen(QColor(230,230,230)); gpen.setStyle(Qt.DotLine)
-            p.setPen(gpen)
-            for i in range(1,5):
-                yy = y0 + i * h / 5.0
-                p.drawLine(QPointF(x0, yy), QPointF(x0 + w, yy))
-            for i in range(1,8):
-                xx = x0 + i * w / 8.0
-                p.drawLine(QPointF(xx, y0), QPointF(xx, y0 + h))
-
-        # 设置标签字体
-        label_font = QFont("Arial", 9)
-        p.setFont(label_font)
-        label_pen = QPen(QColor(100,100,100))
-        p.setPen(label_pen)
+        scale_x = w / max(1, len(self.data1)-1)
 
         # 單 Y 軸標籤（左側）
-        p.drawText(x0 + 6, y0 + 16, f"{vmax1:.1f}")
-        p.drawText(x0 + 6, y0 + h - 4, f"{vmin1:.1f}")
-
-        # 繪製溫度線
-        p.setPen(pen1)
-        pts = []
-        for i, v in enumerate(vals1):
-            x = x0 + i * scale_x
-            y = y0 + h - (v - vmin1) * h / (vmax1 - vmin1)
-            pts.append(QPointF(x, y))
-        if len(pts) > 1:
-            p.drawPolyline(pts)
-
-        # 繪製電流線（共用同一 Y 軸）
-        p.setPen(pen2)
-        pts2 = []
-        for i, v in enumerate(vals2):
-            x = x0 + i * scale_x
-            y = y0 + h - (v - vmin2) * h / (vmax2 - vmin2)
-            pts2.append(QPointF(x, y))
-        if len(pts2) > 1:
-            p.drawPolyline(pts2)
+        p.setFont(self.label_font)
+        p.setPen(self.label_pen)
+        p.drawText(x0 + 6, y0 + 16, f"{vmax:.1f}")
+        p.drawText(x0 + 6, y0 + h - 4, f"{vmin:.1f}")
+
+        p.setRenderHint(QPainter.Antialiasing)  # 启用抗锯齿
+        # 繪製溫度線、電流線（共用同一 Y 軸）
+        for pen, lod in ((self.pen1, self.lod1), (self.pen2, self.lod2)):
+            xs, ys = lod.points(w)
+            if len(xs) > 1:
+                p.setPen(pen)
+                p.drawPolyline(_polygon(polyline_xy(xs, ys, x0, y0, scale_x, h, vmin, vmax)))
+
+
+PLOT_MARGIN = 8  # 圖表外框邊距
+
+
+def _chart_geometry(rect):
+    r = rect.adjusted(PLOT_MARGIN, PLOT_MARGIN, -PLOT_MARGIN, -PLOT_MARGIN)
+    return r.left(), r.top(), r.width(), r.height()
+
+
+def _line_pen(color):
+    pen = QPen(color)
+    pen.setWidth(2)  # 线条宽度
+    pen.setCapStyle(Qt.RoundCap)  # 圆角线帽
+    pen.setJoinStyle(Qt.RoundJoin)  # 圆角连接
+    return pen
+
+
+def _plot_chrome(size, show_grid):
+    """圖表靜態層：背景、外框、虛線網格，畫在 pixmap 上供每幀直接貼上"""
+    pm = QPixmap(size)
+    pm.fill(QColor(250,250,250))  # 更浅的背景色
+    p = QPainter(pm)
+    p.setRenderHint(QPainter.Antialiasing)
+    pen_axis = QPen(QColor(200,200,200))  # 更淡的轴线颜色
+    pen_axis.setWidth(1)
+    p.setPen(pen_axis)
+    r = pm.rect().adjusted(PLOT_MARGIN, PLOT_MARGIN, -PLOT_MARGIN, -PLOT_MARGIN)
+    p.drawRect(r)
+    if show_grid:
+        x0, y0, w, h = r.left(), r.top(), r.width(), r.height()
+        gpen = QPen(QColor(230,230,230))  # 更淡的网格线
+        gpen.setStyle(Qt.DotLine)
+        p.setPen(gpen)
+        for i in range(1, 5):
+            yy = y0 + i * h / 5.0
+            p.drawLine(QPointF(x0, yy), QPointF(x0 + w, yy))
+        for i in range(1, 8):
+            xx = x0 + i * w / 8.0
+            p.drawLine(QPointF(xx, y0), QPointF(xx, y0 + h))
+    p.end()
+    return pm
+
+
+def _polygon(xy):
+    """交錯座標 array('d') 直接拷貝進 QPolygonF 的記憶體，不逐點建立 QPointF"""
+    n = len(xy) // 2
+    poly = QPolygonF(n)
+    try:
+        ptr = poly.data()
+        ptr.setsize(16 * n)
+        ptr.setwriteable(True)
+        memoryview(ptr).cast('B')[:] = memoryview(xy).cast('B')
+    except Exception:
+        # qreal 非 double 的平台
+        poly = QPolygonF([QPointF(xy[2 * i], xy[2 * i + 1]) for i in range(n)])
+    return poly
 
         
 def _is_writable_dir(path):
@@ -1437,15 +1497,6 @@ def _show_auto_close_message(parent, title, text, msec=3000):
     QTimer.singleShot(msec, msg.accept)
     msg.exec_()
 
-def _ensure_db(conn):
-    try:
-        cur = conn.cursor()
-        cur.execute('CREATE TABLE IF NOT EXISTS records (id INTEGER PRIMARY KEY AUTOINCREMENT, ts TEXT NOT NULL, data TEXT NOT NULL)')
-        conn.commit()
-    except Exception:
-        pass
-
-
 class StorageSettingsDialog(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -1497,49 +1548,10 @@ class StorageSettingsDialog(QDialog):
         s.setValue('save_format', fmt)
         super().accept()
 
-def scan_modbus_devices(baud=9600, timeout=1, ports=None, max_addr=32):
-    active_ports = []
+def scan_modbus_devices(baud=9600, timeout=1, ports=None, max_addr=32, addresses=None, bauds=None, on_found=None):
+    """各串口平行掃描所有設定地址（結果用來填快取），有回應的串口即為有效串口；timeout 為單次探測的上限"""
     print("開始掃描 Modbus 設備...")
 
-    def probe(port):
-        try:
-            if modbus_rtu is not None and serial is not None:
-                try:
-                    ser = serial.Serial(port, baudrate=baud, bytesize=8, parity='N', stopbits=1, timeout=timeout)
-                except Exception:
-                    return
-                try:
-                    master = modbus_rtu.RtuMaster(ser)
-                    master.set_timeout(timeout)
-                    master.set_verbose(False)
-                except Exception:
-                    try:
-                        ser.close()
-                    except Exception:
-                        pass
-                    return
-                ok = False
-                for addr in range(1, max_addr+1):
-                    try:
-                        master.execute(addr, 3, 0, 1)
-                        ok = True
-                        break
-                    except Exception:
-                        pass
-                try:
-                    master.close()
-                except Exception:
-                    pass
-                try:
-                    ser.close()
-                except Exception:
-                    pass
-                if ok:
-                    active_ports.append(port)
-                    print(f"[+] 發現 Modbus 設備: {port}")
-        except Exception:
-            pass
-
     if ports is None:
         ports_list = []
         if QSerialPortInfo is not None:
@@ -1560,17 +1572,19 @@ def scan_modbus_devices(baud=9600, timeout=1, ports=None, max_addr=32):
     else:
         ports_list = list(ports)
 
-    threads = []
-    for port in ports_list:
-        t = threading.Thread(target=probe, args=(port,))
-        threads.append(t)
-        t.start()
-
-    for t in threads:
-        t.join()
-
+    if not modbus_bus.rtu_available():
+        return []
+    def found(port, b, addr):
+        print(f"[+] 發現 Modbus 設備: {port} (位址 {addr}, {b} bps)")
+        if on_found:
+            on_found(port, b, addr)
+    results = modbus_discovery.scan_ports(
+        ports_list,
+        list(addresses) if addresses is not None else list(range(1, max_addr+1)),
+        list(bauds) if bauds else [baud],
+        on_found=found, max_timeout=timeout, first_baud=True)
     print("掃描完成。")
-    return active_ports
+    return [p for p in ports_list if results.get(p)]
 
 
 def _icon_path():
@@ -0,0 +1,250 @@
+import os
+import sys
+import csv
+import json
+import locale
+import argparse
+from pathlib import Path
+from datetime import datetime, timedelta
+
+INDEX_SUFFIX = '.idx'
+BLOCK_ROWS = 1024
+HEADER = b'id,ts,data\n'
+
+
+def index_path_for(csv_path):
+    p = Path(csv_path)
+    return p.with_name(p.name + INDEX_SUFFIX)
+
+
+def archive_encoding():
+    return locale.getpreferredencoding(False)
+
+
+def _block(off, end, rows, min_ts, max_ts):
+    return {'off': off, 'end': end, 'rows': rows, 'min_ts': min_ts, 'max_ts': max_ts}
+
+
+def build_blocks(lines, timestamps, start_offset, block_rows=BLOCK_ROWS, cur=None):
+    # cur: a partial block ending at start_offset that new rows continue; it is
+    # returned again as the first element so the caller can rewrite it
+    blocks = [cur] if cur is not None else []
+    off = start_offset
+    for raw, ts in zip(lines, timestamps):
+        if cur is None or cur['rows'] >= block_rows:
+            cur = _block(off, off, 0, ts, ts)
+            blocks.append(cur)
+        off += len(raw)
+        cur['end'] = off
+        cur['rows'] += 1
+        if ts < cur['min_ts']:
+            cur['min_ts'] = ts
+        if ts > cur['max_ts']:
+            cur['max_ts'] = ts
+    return blocks
+
+
+def append_blocks(idx_path, blocks):
+    if not blocks:
+        return
+    with open(idx_path, 'a', encoding='utf-8') as f:
+        for b in blocks:
+            f.write(json.dumps(b) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def load_blocks(idx_path):
+    blocks = []
+    try:
+        with open(idx_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    blocks.append(json.loads(line))
+                except Exception:
+                    break
+    except FileNotFoundError:
+        pass
+    return blocks
+
+
+def _read_index(idx_path):
+    # blocks plus the byte offset of the last good line and of the end of the good lines
+    blocks = []
+    tail_off = good_end = 0
+    try:
+        with open(idx_path, 'rb') as f:
+            for raw in f:
+                try:
+                    blocks.append(json.loads(raw))
+                except Exception:
+                    break
+                tail_off = good_end
+                good_end += len(raw)
+    except FileNotFoundError:
+        pass
+    return blocks, tail_off, good_end
+
+
+def _scan_blocks(csv_path, start_offset, block_rows=BLOCK_ROWS):
+    lines = []
+    timestamps = []
+    with open(csv_path, 'rb') as f:
+        f.seek(start_offset)
+        if start_offset == 0:
+            head = f.readline()
+            if head != HEADER:
+                f.seek(0)
+            start_offset = f.tell()
+        for raw in f:
+            if not raw.endswith(b'\n'):
+                break
+            parts = raw.split(b',', 2)
+            if len(parts) < 3:
+                break
+            lines.append(raw)
+            timestamps.append(parts[1].decode('ascii', errors='ignore'))
+    return build_blocks(lines, timestamps, start_offset, block_rows)
+
+
+def ensure_index(csv_path, block_rows=BLOCK_ROWS):
+    csv_path = Path(csv_path)
+    idx_path = index_path_for(csv_path)
+    blocks = load_blocks(idx_path)
+    size = csv_path.stat().st_size
+    indexed_to = blocks[-1]['end'] if blocks else 0
+    if indexed_to > size:
+        idx_path.unlink(missing_ok=True)
+        blocks, indexed_to = [], 0
+    if indexed_to < size:
+        tail = _scan_blocks(csv_path, indexed_to, block_rows)
+        append_blocks(idx_path, tail)
+        blocks.extend(tail)
+    return blocks
+
+
+class BlockIndex:
+    # in-memory sidecar index of one archive, kept by the writer across syncs so
+    # the .idx is not re-read every cycle; small appends grow the last partial
+    # block and only its line is rewritten
+
+    def __init__(self, csv_path, block_rows=BLOCK_ROWS):
+        self.csv_path = Path(csv_path)
+        self.idx_path = index_path_for(self.csv_path)
+        self.block_rows = block_rows
+        if self.csv_path.exists():
+            # drop a torn last line first so ensure_index does not append after it
+            _, _, good_end = _read_index(self.idx_path)
+            if self.idx_path.exists() and self.idx_path.stat().st_size > good_end:
+                with open(self.idx_path, 'r+b') as f:
+                    f.truncate(good_end)
+            ensure_index(self.csv_path, block_rows)
+            self.blocks, self.tail_off, _ = _read_index(self.idx_path)
+        else:
+            self.idx_path.unlink(missing_ok=True)
+            self.blocks, self.tail_off = [], 0
+
+    @property
+    def indexed_to(self):
+        return self.blocks[-1]['end'] if self.blocks else 0
+
+    def _partial(self):
+        return bool(self.blocks) and self.blocks[-1]['rows'] < self.block_rows
+
+    def rollback_offset(self):
+        # .idx size to truncate back to if the next append is interrupted
+        if self._partial():
+            return self.tail_off
+        return self.idx_path.stat().st_size if self.idx_path.exists() else 0
+
+    def append(self, lines, timestamps, start_offset):
+        if not lines:
+            return
+        cur = None
+        rewrite_from = self.idx_path.stat().st_size if self.idx_path.exists() else 0
+        if self._partial() and self.blocks[-1]['end'] == start_offset:
+            cur = dict(self.blocks[-1])
+            rewrite_from = self.tail_off
+        new = build_blocks(lines, timestamps, start_offset, self.block_rows, cur)
+        encoded = [(json.dumps(b) + '\n').encode('utf-8') for b in new]
+        with open(self.idx_path, 'ab') as f:
+            f.truncate(rewrite_from)
+            f.write(b''.join(encoded))
+            f.flush()
+            os.fsync(f.fileno())
+        if cur is not None:
+            self.blocks.pop()
+        self.blocks.extend(new)
+        self.tail_off = rewrite_from + sum(len(e) for e in encoded[:-1])
+
+
+def _iso(t):
+    if isinstance(t, datetime):
+        return t.isoformat(timespec='seconds')
+    return str(t)
+
+
+def query(archives_dir, start, end, line=None, work_order=None, encoding=None):
+    encoding = encoding or archive_encoding()
+    start, end = _iso(start), _iso(end)
+    day = datetime.fromisoformat(start[:10])
+    last_day = datetime.fromisoformat(end[:10])
+    while day <= last_day:
+        csv_path = Path(archives_dir) / (day.strftime('%Y-%m-%d') + '.csv')
+        day += timedelta(days=1)
+        if not csv_path.exists():
+            continue
+        blocks = [b for b in ensure_index(csv_path) if b['max_ts'] >= start and b['min_ts'] <= end]
+        if not blocks:
+            continue
+        with open(csv_path, 'rb') as f:
+            for b in blocks:
+                f.seek(b['off'])
+                buf = f.read(b['end'] - b['off'])
+                for raw in buf.decode(encoding, errors='replace').splitlines():
+                    parts = raw.split(',', 2)
+                    if len(parts) < 3:
+                        continue
+                    rid, ts, data = parts
+                    if ts < start or ts > end:
+                        continue
+                    try:
+                        rec = json.loads(data)
+                    except Exception:
+                        continue
+                    if line is not None and rec.get('line') != line:
+                        continue
+                    if work_order is not None and rec.get('work_order') != work_order:
+                        continue
+                    rec['id'] = int(rid)
+                    rec['ts'] = ts
+                    yield rec
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time-range queries over historical_data/archives')
+    parser.add_argument('--archives', type=str, default=str(Path(__file__).parent / 'historical_data' / 'archives'))
+    parser.add_argument('--encoding', type=str, default=None, help='archive text encoding (default: platform)')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    sub.add_parser('build', help='create or extend the sidecar index of every archive')
+    q = sub.add_parser('query', help='print rows between --start and --end as CSV')
+    q.add_argument('--start', required=True, help='e.g. 2025-11-24T14:00:00')
+    q.add_argument('--end', required=True, help='e.g. 2025-11-24T15:30:00')
+    q.add_argument('--line', type=str, default=None)
+    q.add_argument('--work-order', type=str, default=None)
+    args = parser.parse_args()
+    if args.cmd == 'build':
+        for p in sorted(Path(args.archives).glob('*.csv')):
+            blocks = ensure_index(p)
+            print(f'{p.name}: {sum(b["rows"] for b in blocks)} rows in {len(blocks)} blocks')
+        return
+    w = csv.writer(sys.stdout)
+    w.writerow(['id', 'ts', 'line', 'shift', 'work_order', 'temperature', 'current'])
+    for r in query(args.archives, args.start, args.end, line=args.line, work_order=args.work_order,
+                   encoding=args.encoding):
+        w.writerow([r['id'], r['ts'], r.get('line', ''), r.get('shift', ''), r.get('work_order', ''),
+                    r.get('temperature', ''), r.get('current', '')])
+
+
+if __name__ == '__main__':
+    main()
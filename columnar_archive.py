@@ -0,0 +1,138 @@
+import sys
+import json
+import zlib
+import struct
+from array import array
+from pathlib import Path
+from datetime import datetime
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+MAGIC = b'EMSC'
+VERSION = 1
+SUFFIX = '.cols'
+HEADER = struct.Struct('<4sBII')
+
+NUM_COLUMNS = [('id', 'q'), ('ts', 'd'), ('temperature', 'd'), ('current', 'd')]
+STR_COLUMNS = ['line', 'shift', 'work_order']
+COLUMNS = [name for name, _ in NUM_COLUMNS] + STR_COLUMNS
+
+
+def _to_epoch(ts):
+    try:
+        return datetime.fromisoformat(ts).timestamp()
+    except Exception:
+        return float('nan')
+
+
+def _to_float(v):
+    try:
+        return float(v)
+    except Exception:
+        return float('nan')
+
+
+def _le_bytes(arr):
+    if sys.byteorder == 'big':
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _from_le(typecode, buf):
+    arr = array(typecode)
+    arr.frombytes(buf)
+    if sys.byteorder == 'big':
+        arr.byteswap()
+    return arr
+
+
+def encode_block(records):
+    cols = {name: array(code) for name, code in NUM_COLUMNS}
+    codes = {name: array('I') for name in STR_COLUMNS}
+    strings = {}
+    for r in records:
+        if 'line' in r:
+            data = r
+        else:
+            try:
+                data = json.loads(r['data'])
+                if not isinstance(data, dict):
+                    data = {}
+            except Exception:
+                data = {}
+        cols['id'].append(int(r['id']))
+        cols['ts'].append(_to_epoch(r['ts']))
+        cols['temperature'].append(_to_float(data.get('temperature')))
+        cols['current'].append(_to_float(data.get('current')))
+        for name in STR_COLUMNS:
+            v = data.get(name)
+            v = '' if v is None else str(v)
+            code = strings.get(v)
+            if code is None:
+                code = strings[v] = len(strings)
+            codes[name].append(code)
+    table = '\x00'.join(strings).encode('utf-8')
+    parts = [_le_bytes(cols[name]) for name, _ in NUM_COLUMNS]
+    parts += [_le_bytes(codes[name]) for name in STR_COLUMNS]
+    parts.append(table)
+    payload = zlib.compress(b''.join(parts), 6)
+    return HEADER.pack(MAGIC, VERSION, len(records), len(payload)) + payload
+
+
+def decode_block(n, payload):
+    raw = zlib.decompress(payload)
+    out = {}
+    pos = 0
+    for name, code in NUM_COLUMNS:
+        size = array(code).itemsize * n
+        out[name] = _from_le(code, raw[pos:pos + size])
+        pos += size
+    str_codes = {}
+    for name in STR_COLUMNS:
+        size = array('I').itemsize * n
+        str_codes[name] = _from_le('I', raw[pos:pos + size])
+        pos += size
+    table = raw[pos:].decode('utf-8').split('\x00')
+    for name in STR_COLUMNS:
+        out[name] = [table[c] for c in str_codes[name]]
+    return out
+
+
+def iter_blocks(path):
+    with open(path, 'rb') as f:
+        while True:
+            head = f.read(HEADER.size)
+            if len(head) < HEADER.size:
+                return
+            magic, version, n, size = HEADER.unpack(head)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f'bad columnar block in {path}')
+            payload = f.read(size)
+            if len(payload) < size:
+                # torn tail from an interrupted append; the sync journal rolls it back
+                return
+            yield decode_block(n, payload)
+
+
+def read_columns(path):
+    merged = {name: array(code) for name, code in NUM_COLUMNS}
+    merged.update({name: [] for name in STR_COLUMNS})
+    if Path(path).exists():
+        for block in iter_blocks(path):
+            for name in COLUMNS:
+                merged[name].extend(block[name])
+    if np is None:
+        return merged
+    out = {}
+    for name, code in NUM_COLUMNS:
+        out[name] = np.frombuffer(merged[name].tobytes(), dtype=np.int64 if code == 'q' else np.float64).copy()
+    for name in STR_COLUMNS:
+        out[name] = np.array(merged[name], dtype=str)
+    return out
+
+
+def load_day(archives_dir, day):
+    return read_columns(Path(archives_dir) / (day + SUFFIX))
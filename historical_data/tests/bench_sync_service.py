@@ -0,0 +1,212 @@
+import sys
+import json
+import time
+import random
+import shutil
+import sqlite3
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+from pathlib import Path
+from datetime import datetime, timedelta
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+
+import realtime_store
+from sync_service import SyncService
+
+
+def stage_peak_kb(base):
+    # ru_maxrss never goes down, so later stages would all report the first big one;
+    # tracemalloc's peak is reset per stage and measured above what the stage started with
+    if not tracemalloc.is_tracing():
+        return None
+    _, peak = tracemalloc.get_traced_memory()
+    return max(0, peak - base) // 1024
+
+
+def make_records(conn, rows, rate, lines, start, seed=0, legacy=False):
+    # same shape as BlandPage._tick_section: one row per line per tick
+    rng = random.Random(seed)
+    if legacy:
+        conn.execute('CREATE TABLE IF NOT EXISTS records (id INTEGER PRIMARY KEY AUTOINCREMENT, ts TEXT NOT NULL, data TEXT NOT NULL)')
+        sql = 'INSERT INTO records (ts, data) VALUES (?, ?)'
+    else:
+        realtime_store.ensure_db(conn)
+        sql = ('INSERT INTO records (timestamp, device, shift, work_order, temperature, current) '
+               'VALUES (?, ?, ?, ?, ?, ?)')
+    names = [f'生產線{i + 1}' for i in range(lines)]
+    step = 1.0 / rate
+    batch = []
+    for n in range(rows):
+        tick, line = divmod(n, lines)
+        when = start + timedelta(seconds=tick * step)
+        shift = '早班' if when.hour < 20 else '晚班'
+        work_order = f'WO-{line + 1:03d}'
+        temperature = round(20 + rng.random() * 60, 3)
+        current = round(rng.random() * 5, 3)
+        if legacy:
+            data = {'line': names[line], 'shift': shift, 'work_order': work_order,
+                    'temperature': temperature, 'current': current}
+            batch.append((when.isoformat(timespec='seconds'), json.dumps(data, ensure_ascii=False)))
+        else:
+            batch.append((when.timestamp(), names[line], shift, work_order, temperature, current))
+        if len(batch) >= 10000:
+            conn.executemany(sql, batch)
+            batch = []
+    if batch:
+        conn.executemany(sql, batch)
+    conn.commit()
+
+
+def git(cwd, *args):
+    subprocess.run(['git'] + list(args), cwd=str(cwd), check=True, capture_output=True)
+
+
+def setup_root(base):
+    root = base / 'work'
+    bare = base / 'origin.git'
+    git(base, 'init', '-q', '--bare', str(bare))
+    root.mkdir()
+    git(root, 'init', '-q', '-b', 'main')
+    git(root, 'config', 'user.email', 'bench@localhost')
+    git(root, 'config', 'user.name', 'bench')
+    git(root, 'remote', 'add', 'origin', str(bare))
+    (root / 'README.md').write_text('bench\n', encoding='utf-8')
+    git(root, 'add', 'README.md')
+    git(root, 'commit', '-q', '-m', 'init')
+    git(root, 'push', '-q', 'origin', 'main')
+    return root
+
+
+def reset_outputs(svc):
+    shutil.rmtree(svc.exports_dir, ignore_errors=True)
+    svc.exports_dir.mkdir(parents=True, exist_ok=True)
+    svc.state_path.unlink(missing_ok=True)
+
+
+def instrument(svc, names):
+    spent = {name: 0.0 for name in names}
+    for name in names:
+        fn = getattr(svc, name)
+        def wrapper(*a, _fn=fn, _name=name, **kw):
+            t0 = time.perf_counter()
+            try:
+                return _fn(*a, **kw)
+            finally:
+                spent[_name] += time.perf_counter() - t0
+        setattr(svc, name, wrapper)
+    return spent
+
+
+def timed(results, name, rows, fn, spent=None):
+    if spent:
+        for k in spent:
+            spent[k] = 0.0
+    base = 0
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+    t0 = time.perf_counter()
+    out = fn()
+    elapsed = time.perf_counter() - t0
+    results[name] = {
+        'seconds': round(elapsed, 6),
+        'rows': rows,
+        'rows_per_sec': round(rows / elapsed, 1) if elapsed > 0 else None,
+        'peak_alloc_kb': stage_peak_kb(base),
+    }
+    print(f"{name:<14} {rows:>10} rows {elapsed:>9.3f} s {results[name]['rows_per_sec'] or 0:>12.0f} rows/s  peak alloc {results[name]['peak_alloc_kb']} KB")
+    if spent:
+        results[name]['breakdown'] = {k: round(v, 6) for k, v in spent.items()}
+        print('               ' + '  '.join(f'{k} {v:.3f} s' for k, v in spent.items()))
+    return out
+
+
+def code_revision():
+    try:
+        res = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=str(ROOT), capture_output=True, text=True)
+        return res.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def run(args):
+    results = {}
+    if args.trace_memory:
+        tracemalloc.start()
+    with tempfile.TemporaryDirectory(prefix='ems-bench-') as tmp:
+        base = Path(tmp)
+        root = setup_root(base)
+        db_path = base / 'ems.db'
+        start = datetime(2025, 1, 1, 8, 0, 0)
+        conn = sqlite3.connect(str(db_path))
+        timed(results, 'generate', args.rows, lambda: make_records(conn, args.rows, args.rate, args.lines, start, args.seed, args.legacy_schema))
+        svc = SyncService(db_path=str(db_path), chunk_size=args.chunk_size, archive_format=args.archive_format, root=root)
+
+        recs = timed(results, 'extract', args.rows, lambda: svc._extract_new_records(0))
+        timed(results, 'extract_stream', args.rows, lambda: sum(len(c) for c in svc._iter_record_chunks(0)))
+
+        def write_all():
+            for i in range(0, len(recs), svc.chunk_size):
+                svc._write_exports(recs[i:i + svc.chunk_size])
+        reset_outputs(svc)
+        timed(results, 'write', len(recs), write_all)
+        del recs
+
+        reset_outputs(svc)
+        spent = instrument(svc, ['_write_exports', '_commit_and_push', '_save_last_id'])
+        timed(results, 'run_once', args.rows, svc.run_once, spent)
+
+        tail_start = start + timedelta(seconds=(args.rows // args.lines) / args.rate)
+        make_records(conn, args.tail, args.rate, args.lines, tail_start, args.seed + 1, args.legacy_schema)
+        timed(results, 'run_once_tail', args.tail, svc.run_once, spent)
+        conn.close()
+
+    if args.trace_memory:
+        tracemalloc.stop()
+    report = {
+        'revision': code_revision(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'params': vars(args).copy(),
+        'stages': results,
+    }
+    report['params'].pop('out', None)
+    report['params'].pop('compare', None)
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f'results written to {args.out}')
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            prev = json.load(f)
+        print(f"vs {prev.get('revision')} ({prev.get('timestamp')}):")
+        for name, cur in results.items():
+            old = prev.get('stages', {}).get(name)
+            if old and old.get('seconds'):
+                print(f"  {name:<14} {cur['seconds'] / old['seconds']:>6.2f}x time")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the ems.db -> archive sync pipeline on synthetic data')
+    parser.add_argument('--rows', type=int, default=200000, help='rows in the initial records backlog')
+    parser.add_argument('--tail', type=int, default=100, help='rows added before the incremental run_once')
+    parser.add_argument('--rate', type=float, default=2.0, help='ticks per second per line')
+    parser.add_argument('--lines', type=int, default=10, help='production lines writing per tick')
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--archive-format', choices=['csv', 'columnar', 'both'], default='csv')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-trace-memory', dest='trace_memory', action='store_false',
+                        help='skip per-stage memory peaks (tracemalloc slows every stage down)')
+    parser.add_argument('--legacy-schema', action='store_true', help='use the old records(ts, data JSON) layout')
+    parser.add_argument('--out', type=str, default=None, help='write JSON results to this path')
+    parser.add_argument('--compare', type=str, default=None, help='previous JSON results to compare against')
+    run(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main()
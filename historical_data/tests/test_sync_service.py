@@ -1,30 +1,106 @@
 import os
 import time
 import json
+import logging
+import tempfile
+import subprocess
 from pathlib import Path
+import sqlite3
 import unittest
 
-from sync_service import SyncService
+from sync_service import SyncService, CommitScheduler, StagedSyncEngine, ChangeTrigger
+from version_log import VersionLog
+import realtime_store
+
+def make_repo(base):
+    """Throwaway git repo with a bare origin, so syncs never touch the checked-in archives or history."""
+    root = Path(base) / 'repo'
+    remote = Path(base) / 'origin.git'
+    subprocess.run(['git', 'init', '-q', '--bare', str(remote)], check=True)
+    subprocess.run(['git', 'init', '-q', str(root)], check=True)
+    for args in (['symbolic-ref', 'HEAD', 'refs/heads/main'],
+                 ['config', 'user.email', 'sync@example.com'],
+                 ['config', 'user.name', 'sync'],
+                 ['remote', 'add', 'origin', str(remote)]):
+        subprocess.run(['git'] + args, cwd=str(root), check=True)
+    return root
+
 
 class TestSyncService(unittest.TestCase):
     def setUp(self):
-        self.svc = SyncService(interval=1)
+        self.tmp = tempfile.TemporaryDirectory()
+        root = make_repo(self.tmp.name)
+        self.svc = SyncService(interval=1, root=root, db_path=str(root / 'real_time_monitoring' / 'temp' / 'ems.db'))
+        self.svc.git_branch = 'main'
         self.temp = self.svc.var_dir
         self.archives = self.svc.exports_dir
         self.version_log = self.svc.version_log
-        self.temp.mkdir(parents=True, exist_ok=True)
-        self.archives.mkdir(parents=True, exist_ok=True)
-        if self.version_log.exists():
-            self.version_log.unlink()
 
     def tearDown(self):
-        for d in [self.archives, self.temp]:
-            if d.exists():
-                for p in d.iterdir():
-                    try:
-                        p.unlink()
-                    except Exception:
-                        pass
+        logger = logging.getLogger('sync')
+        for h in list(logger.handlers):
+            logger.removeHandler(h)
+            h.close()
+        self.tmp.cleanup()
+
+    def _make_db(self, rows):
+        db_path = self.temp / 'ems.db'
+        conn = sqlite3.connect(str(db_path))
+        conn.execute('CREATE TABLE IF NOT EXISTS records (id INTEGER PRIMARY KEY AUTOINCREMENT, ts TEXT NOT NULL, data TEXT NOT NULL)')
+        conn.executemany('INSERT INTO records (ts, data) VALUES (?, ?)', rows)
+        conn.commit()
+        conn.close()
+        self.svc.db_path = str(db_path)
+        return db_path
+
+    def test_extract_by_id_watermark(self):
+        self._make_db([
+            ('2025-01-01T00:00:00', '{"a":1}'),
+            ('2025-01-01T00:00:01', '{"a":2}'),
+            ('2025-01-01T00:00:02', '{"a":3}'),
+        ])
+        self.assertEqual([r['id'] for r in self.svc._extract_new_records(0)], [1, 2, 3])
+        self.assertEqual([r['id'] for r in self.svc._extract_new_records(2)], [3])
+        self.svc._commit_and_push = lambda paths: True
+        self.svc.run_once()
+        self.assertEqual(self.svc._load_last_id(), 3)
+        self.assertEqual(self.svc._extract_new_records(self.svc._load_last_id()), [])
+
+    def test_run_once_streams_chunks_and_resumes(self):
+        self._make_db([(f'2025-01-01T00:00:0{i}', f'{{"a":{i}}}') for i in range(5)])
+        self.svc.chunk_size = 2
+        self.svc._commit_and_push = lambda paths: True
+        write = self.svc._write_exports
+        calls = []
+        def flaky(chunk):
+            calls.append(len(chunk))
+            if len(calls) == 2:
+                raise RuntimeError('interrupted')
+            return write(chunk)
+        self.svc._write_exports = flaky
+        with self.assertRaises(RuntimeError):
+            self.svc.run_once()
+        self.assertEqual(self.svc._load_last_id(), 2)
+        self.assertTrue(self.svc._load_state().get('pending_paths'))
+        self.svc._write_exports = write
+        self.svc.run_once()
+        self.assertEqual(self.svc._load_last_id(), 5)
+        self.assertEqual(self.svc._load_state().get('pending_paths'), [])
+        lines = (self.archives / '2025-01-01.csv').read_text().splitlines()
+        self.assertEqual([l.split(',')[0] for l in lines[1:]], ['1', '2', '3', '4', '5'])
+
+    def test_run_once_rewinds_when_db_is_recreated(self):
+        db_path = self._make_db([(f'2025-01-01T00:00:0{i}', f'{{"a":{i}}}') for i in range(4)])
+        self.svc._commit_and_push = lambda paths: True
+        self.svc.run_once()
+        self.assertEqual(self.svc._load_last_id(), 4)
+        # the watermark survives but the new ems.db restarts its ids at 1
+        os.remove(db_path)
+        self._make_db([('2025-01-02T00:00:00', '{"b":1}'), ('2025-01-02T00:00:01', '{"b":2}')])
+        self.svc.run_once()
+        self.assertEqual(self.svc._load_last_id(), 2)
+        lines = (self.archives / '2025-01-02.csv').read_text().splitlines()
+        self.assertEqual([l.split(',')[0] for l in lines[1:]], ['1', '2'])
 
     def test_is_recording_flag(self):
         if self.svc.recording_flag.exists():
@@ -46,8 +122,289 @@ class TestSyncService(unittest.TestCase):
         self.assertTrue(paths)
         self.svc._commit_and_push(paths)
         self.assertTrue(self.version_log.exists())
-        log = json.loads(self.version_log.read_text(encoding='utf-8'))
+        log = list(self.svc.versions.entries())
         self.assertTrue(len(log) >= 1)
+        self.assertEqual(log[-1]['changed_files'], paths)
+
+    def test_failed_push_is_retried_and_not_counted_as_published(self):
+        root = self.svc.root
+        remote = subprocess.run(['git', 'remote', 'get-url', 'origin'], cwd=str(root),
+                                capture_output=True, text=True, check=True).stdout.strip()
+        subprocess.run(['git', 'remote', 'set-url', 'origin', str(Path(self.tmp.name) / 'gone.git')], cwd=str(root), check=True)
+        paths = self.svc._write_exports([{'id': 1, 'ts': '2025-01-01T00:00:00+00:00', 'data': '{"a":1}'}])
+        self.assertFalse(self.svc._commit_and_push(paths))
+        self.assertTrue(self.svc._has_unpushed_commits())
+        subprocess.run(['git', 'remote', 'set-url', 'origin', remote], cwd=str(root), check=True)
+        # nothing new to stage, but the local commit still has to go out
+        self.assertTrue(self.svc._commit_and_push(paths))
+        self.assertFalse(self.svc._has_unpushed_commits())
+        pushed = subprocess.run(['git', 'rev-list', '--count', 'main'], cwd=remote,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        self.assertEqual(pushed, '1')
+        self.assertTrue(self.svc._commit_and_push(paths))
+
+    def test_write_exports_batches_per_day_and_recovers(self):
+        recs = [
+            {'id': 1, 'ts': '2025-01-01T23:59:59', 'data': '{"a":1}'},
+            {'id': 2, 'ts': '2025-01-02T00:00:00', 'data': '{"a":2}'},
+            {'id': 3, 'ts': '2025-01-02T00:00:01', 'data': '{"a":3}'},
+        ]
+        paths = self.svc._write_exports(recs)
+        self.assertEqual(sorted(Path(p).name for p in paths), ['2025-01-01.csv', '2025-01-02.csv'])
+        day2 = self.archives / '2025-01-02.csv'
+        self.assertEqual(day2.read_text().splitlines(), ['id,ts,data', '2,2025-01-02T00:00:00,{"a":2}', '3,2025-01-02T00:00:01,{"a":3}'])
+        self.assertFalse(self.svc.write_journal.exists())
+        # simulate a crash mid-append: journal left behind with the pre-append size
+        size = day2.stat().st_size
+        self.svc.write_journal.write_text(json.dumps({str(day2): size}), encoding='utf-8')
+        with open(day2, 'a') as f:
+            f.write('4,2025-01-02T00:0')
+        self.svc._write_exports([{'id': 4, 'ts': '2025-01-02T00:00:02', 'data': '{"a":4}'}])
+        self.assertEqual(day2.read_text().splitlines()[-1], '4,2025-01-02T00:00:02,{"a":4}')
+        self.assertEqual(len(day2.read_text().splitlines()), 4)
+        self.assertEqual(self.svc._load_last_id(), 4)
+
+    def test_write_journal_reconciles_against_the_watermark(self):
+        day = self.archives / '2025-01-01.csv'
+        self.svc._write_exports([{'id': 1, 'ts': '2025-01-01T00:00:00', 'data': '{"a":1}'}])
+        size = day.stat().st_size
+        with open(day, 'a') as f:
+            f.write('2,2025-01-01T00:00:01,{"a":2}\n')
+        # crash after the append but before the watermark: the chunk is rolled back and re-read
+        self.svc.write_journal.write_text(json.dumps({'last_id': 2, 'offsets': {str(day): size}}), encoding='utf-8')
+        self.svc._write_exports([{'id': 2, 'ts': '2025-01-01T00:00:01', 'data': '{"a":2}'}])
+        self.assertEqual([l.split(',')[0] for l in day.read_text().splitlines()[1:]], ['1', '2'])
+        # crash after the watermark but before the journal was removed: the append stays
+        size = day.stat().st_size
+        with open(day, 'a') as f:
+            f.write('3,2025-01-01T00:00:02,{"a":3}\n')
+        self.svc._save_last_id(3)
+        self.svc.write_journal.write_text(json.dumps({'last_id': 3, 'offsets': {str(day): size}}), encoding='utf-8')
+        self.svc._write_exports([{'id': 4, 'ts': '2025-01-01T00:00:03', 'data': '{"a":4}'}])
+        self.assertEqual([l.split(',')[0] for l in day.read_text().splitlines()[1:]], ['1', '2', '3', '4'])
+        self.assertFalse(self.svc.write_journal.exists())
+
+    def test_columnar_archive_roundtrip(self):
+        self.svc.archive_format = 'both'
+        recs = [
+            {'id': 1, 'ts': '2025-01-01T08:00:00', 'data': '{"line": "生產線1", "shift": "早班", "work_order": "WO-1", "temperature": 25.5, "current": 1.25}'},
+            {'id': 2, 'ts': '2025-01-01T08:00:01', 'data': '{"line": "生產線2", "shift": "早班", "work_order": "", "temperature": 26.0, "current": 0.0}'},
+        ]
+        self.svc._write_exports(recs[:1])
+        paths = self.svc._write_exports(recs[1:])
+        self.assertIn(str(self.archives / '2025-01-01.cols'), paths)
+        self.assertTrue((self.archives / '2025-01-01.csv').exists())
+        cols = self.svc.load_day_columns('2025-01-01')
+        self.assertEqual(list(cols['id']), [1, 2])
+        self.assertEqual(list(cols['temperature']), [25.5, 26.0])
+        self.assertEqual(list(cols['current']), [1.25, 0.0])
+        self.assertEqual(list(cols['line']), ['生產線1', '生產線2'])
+        self.assertEqual(list(cols['work_order']), ['WO-1', ''])
+        self.assertAlmostEqual(cols['ts'][1] - cols['ts'][0], 1.0)
+
+    def test_commit_scheduler_coalesces_cycles(self):
+        self._make_db([('2025-01-01T00:00:00', '{"a":1}')])
+        commits = []
+        self.svc._commit_and_push = lambda paths: commits.append(list(paths)) or True
+        self.svc.publisher = CommitScheduler(self.svc, max_age=3600)
+        self.svc.publisher.start()
+        try:
+            self.svc.run_once()
+            self._make_db([('2025-01-02T00:00:00', '{"a":2}')])
+            self.svc.run_once()
+            self.assertEqual(commits, [])
+            self.assertEqual(self.svc.publish_stats()['queue_depth'], 2)
+            self.svc.publisher.flush(timeout=5)
+        finally:
+            self.svc.publisher.stop(timeout=5)
+        self.assertEqual(len(commits), 1)
+        self.assertEqual(sorted(Path(p).name for p in commits[0]), ['2025-01-01.csv', '2025-01-02.csv'])
+        st = self.svc.publish_stats()
+        self.assertEqual(st['queue_depth'], 0)
+        self.assertIsNotNone(st['last_push_age'])
+        self.assertEqual(self.svc._load_state().get('pending_paths'), [])
+
+    def test_staged_engine_recovers_from_write_failure(self):
+        self._make_db([(f'2025-01-01T00:00:0{i}', f'{{"a":{i}}}') for i in range(6)])
+        self.svc.recording_flag.write_text('1', encoding='utf-8')
+        self.svc.chunk_size = 2
+        self.svc.interval = 0.05
+        self.svc._commit_and_push = lambda paths: True
+        write = self.svc._write_exports
+        calls = []
+        def flaky(chunk):
+            calls.append(chunk[0]['id'])
+            if len(calls) == 2:
+                raise OSError('disk hiccup')
+            return write(chunk)
+        self.svc._write_exports = flaky
+        engine = StagedSyncEngine(self.svc, queue_size=1)
+        engine.start()
+        try:
+            deadline = time.time() + 5
+            while self.svc._load_last_id() < 6 and time.time() < deadline:
+                time.sleep(0.02)
+        finally:
+            engine.stop(timeout=5)
+        self.assertEqual(self.svc._load_last_id(), 6)
+        st = engine.stats()
+        self.assertEqual(st['write']['errors'], 1)
+        self.assertEqual(st['write']['rows'], 6)
+        lines = (self.archives / '2025-01-01.csv').read_text().splitlines()
+        self.assertEqual([l.split(',')[0] for l in lines[1:]], ['1', '2', '3', '4', '5', '6'])
+
+    def test_staged_engine_rewinds_when_db_is_recreated(self):
+        db_path = self._make_db([(f'2025-01-01T00:00:0{i}', f'{{"a":{i}}}') for i in range(4)])
+        self.svc.recording_flag.write_text('1', encoding='utf-8')
+        self.svc.interval = 0.05
+        self.svc._commit_and_push = lambda paths: True
+        engine = StagedSyncEngine(self.svc)
+        engine.start()
+        try:
+            deadline = time.time() + 5
+            while self.svc._load_last_id() < 4 and time.time() < deadline:
+                time.sleep(0.02)
+            # a reset deletes ems.db and sync_state.json; the next recording restarts ids at 1
+            os.remove(db_path)
+            self.svc.state_path.unlink()
+            self._make_db([('2025-01-02T00:00:00', '{"b":1}'), ('2025-01-02T00:00:01', '{"b":2}')])
+            deadline = time.time() + 5
+            while self.svc._load_last_id() != 2 and time.time() < deadline:
+                time.sleep(0.02)
+        finally:
+            engine.stop(timeout=5)
+        lines = (self.archives / '2025-01-02.csv').read_text().splitlines()
+        self.assertEqual([l.split(',')[0] for l in lines[1:]], ['1', '2'])
+
+    def test_change_trigger_fires_on_commit(self):
+        db_path = self._make_db([('2025-01-01T00:00:00', '{"a":1}')])
+        for use_inotify in (False, True):
+            trigger = ChangeTrigger(db_path, debounce=0.05, poll=0.02, use_inotify=use_inotify)
+            try:
+                if trigger.backend == 'data_version':
+                    self.assertTrue(trigger.wait(0.5))
+                self.assertFalse(trigger.wait(0.2))
+                self._make_db([('2025-01-01T00:00:01', '{"a":2}')])
+                self.assertTrue(trigger.wait(2))
+                self.assertFalse(trigger.wait(0.2))
+            finally:
+                trigger.close()
+
+    def test_change_trigger_ignores_readers_in_wal_mode(self):
+        db_path = self._make_db([('2025-01-01T00:00:00', '{"a":1}')])
+        conn = sqlite3.connect(str(db_path))
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.close()
+        for use_inotify in (False, True):
+            trigger = ChangeTrigger(db_path, debounce=0.05, poll=0.02, use_inotify=use_inotify)
+            try:
+                trigger.wait(0.1)
+                # read-only connections create and remove ems.db-wal but commit nothing
+                for _ in range(5):
+                    reader = sqlite3.connect(str(db_path))
+                    reader.execute('SELECT COUNT(*) FROM records').fetchone()
+                    reader.close()
+                self.assertFalse(trigger.wait(0.3))
+                self._make_db([('2025-01-01T00:00:01', '{"a":2}')])
+                self.assertTrue(trigger.wait(2))
+            finally:
+                trigger.close()
+
+    def test_version_log_query_and_compaction(self):
+        vlog = VersionLog(self.temp / 'version_log.jsonl', stride=2)
+        for day, hour, name in [(1, 0, 'a'), (1, 12, 'b'), (2, 0, 'c'), (3, 0, 'd'), (3, 6, 'e')]:
+            vlog.append([name + '.csv'], 'synced 1 file(s)', timestamp=f'2025-01-0{day}T{hour:02d}:00:00+00:00')
+        got = [e['changed_files'][0] for e in vlog.entries('2025-01-01T06:00:00+00:00', '2025-01-03T00:00:00+00:00')]
+        self.assertEqual(got, ['b.csv', 'c.csv', 'd.csv'])
+        self.assertEqual(vlog.files_changed_since(3), ['d.csv', 'e.csv'])
+        # torn tail from a crash must not corrupt the next append
+        with open(vlog.path, 'ab') as f:
+            f.write(b'{"seq": 6, "times')
+        vlog = VersionLog(vlog.path, stride=2)
+        self.assertEqual(vlog.append(['f.csv'], 'synced 1 file(s)')['seq'], 6)
+        vlog.compact('2025-01-03T00:00:00+00:00')
+        entries = list(vlog.entries())
+        self.assertEqual([e['seq'] for e in entries], [2, 3, 4, 5, 6])
+        self.assertEqual(entries[0]['changed_files'], ['a.csv', 'b.csv'])
+        self.assertEqual(vlog.entry(1)['seq'], 2)
+        self.assertEqual(vlog.files_changed_since(2), ['c.csv', 'd.csv', 'e.csv', 'f.csv'])
+        self.assertEqual(vlog.append(['g.csv'], 'synced 1 file(s)')['seq'], 7)
+
+    def test_version_log_compacts_only_when_it_can_shrink(self):
+        self.svc.version_log_compact_bytes = 0
+        self.svc.versions.append(['old.csv'], 'synced 1 file(s)', timestamp='2020-01-01T00:00:00+00:00')
+        self.svc._update_version_log(['a.csv'])
+        self.assertIn('syncs', next(self.svc.versions.entries()))
+        rewrites = []
+        compact = self.svc.versions.compact
+        self.svc.versions.compact = lambda cutoff: rewrites.append(cutoff) or compact(cutoff)
+        for name in ('b.csv', 'c.csv'):
+            self.svc._update_version_log([name])
+        # still over the threshold, but nothing older than the retention cutoff is left raw
+        self.assertEqual(rewrites, [])
+        self.assertEqual(self.svc.versions.files_changed_since(1), ['a.csv', 'b.csv', 'c.csv'])
+
+    def test_archive_index_range_query(self):
+        self.svc.index_block_rows = 2
+        recs = []
+        for i in range(8):
+            line = '生產線1' if i % 2 == 0 else '生產線2'
+            recs.append({'id': i + 1, 'ts': f'2025-01-01T14:0{i}:00',
+                         'data': json.dumps({'line': line, 'work_order': 'WO-1', 'temperature': 20 + i, 'current': 1.0}, ensure_ascii=False)})
+        self.svc._write_exports(recs[:3])
+        self.svc._write_exports(recs[3:])
+        got = list(self.svc.query_archives('2025-01-01T14:02:00', '2025-01-01T14:05:00', line='生產線1'))
+        self.assertEqual([r['id'] for r in got], [3, 5])
+        self.assertEqual(got[0]['temperature'], 22)
+        # a legacy archive without a sidecar gets indexed on first use
+        idx = self.archives / '2025-01-01.csv.idx'
+        idx.unlink()
+        got = list(self.svc.query_archives('2025-01-01T14:06:00', '2025-01-01T23:59:59', work_order='WO-1'))
+        self.assertEqual([r['id'] for r in got], [7, 8])
+        self.assertTrue(idx.exists())
+        self.assertEqual(list(self.svc.query_archives('2025-01-01T15:00:00', '2025-01-02T00:00:00')), [])
+
+    def test_archive_index_grows_last_block_without_rereading(self):
+        import archive_index
+        self.svc.index_block_rows = 4
+        def rec(i):
+            return {'id': i, 'ts': f'2025-01-01T10:00:{i:02d}', 'data': '{"line": "生產線1"}'}
+        self.svc._write_exports([rec(1)])
+        read_index = archive_index._read_index
+        archive_index._read_index = lambda path: self.fail('index re-read during sync')
+        try:
+            for i in range(2, 7):
+                self.svc._write_exports([rec(i)])
+        finally:
+            archive_index._read_index = read_index
+        idx = self.archives / '2025-01-01.csv.idx'
+        blocks = archive_index.load_blocks(idx)
+        self.assertEqual([b['rows'] for b in blocks], [4, 2])
+        self.assertEqual(len(idx.read_text(encoding='utf-8').splitlines()), 2)
+        self.assertEqual(blocks[-1]['end'], (self.archives / '2025-01-01.csv').stat().st_size)
+        self.assertEqual(blocks, archive_index.BlockIndex(self.archives / '2025-01-01.csv', 4).blocks)
+        got = list(self.svc.query_archives('2025-01-01T10:00:03', '2025-01-01T10:00:05'))
+        self.assertEqual([r['id'] for r in got], [3, 4, 5])
+
+    def test_typed_records_export_same_archive_rows(self):
+        db_path = self.temp / 'ems.db'
+        conn = sqlite3.connect(str(db_path))
+        realtime_store.ensure_db(conn)
+        t = realtime_store.iso_to_epoch('2025-01-01T08:00:00')
+        conn.executemany('INSERT INTO records (timestamp, device, shift, work_order, temperature, current) VALUES (?, ?, ?, ?, ?, ?)', [
+            (t + 0.4, '生產線1', '早班', 'WO-1', 25.5, 1.0),
+            (t + 1.2, '生產線1', '早班', 'WO-1', None, 0.125),
+        ])
+        conn.commit()
+        conn.close()
+        self.svc.db_path = str(db_path)
+        recs = self.svc._extract_new_records(0)
+        self.assertEqual([r['ts'] for r in recs], ['2025-01-01T08:00:00', '2025-01-01T08:00:01'])
+        self.assertEqual(recs[0]['data'], json.dumps({'line': '生產線1', 'shift': '早班', 'work_order': 'WO-1', 'temperature': 25.5, 'current': 1.0}, ensure_ascii=False))
+        self.assertEqual(json.loads(recs[1]['data'])['temperature'], None)
+        self.svc._commit_and_push = lambda paths: True
+        self.svc.run_once()
+        self.assertEqual(self.svc._load_last_id(), 2)
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,323 @@
+import os
+import time
+import struct
+import asyncio
+import threading
+try:
+    import termios
+except Exception:
+    termios = None
+try:
+    import serial
+except Exception:
+    serial = None
+
+
+class ModbusTimeout(TimeoutError):
+    pass
+
+
+class ModbusFrameError(IOError):
+    """殘缺、CRC 錯誤或不符的回應"""
+
+
+class ModbusExceptionResponse(IOError):
+    def __init__(self, addr, func, code):
+        super().__init__(f'slave {addr} function {func} exception code {code}')
+        self.code = code
+
+
+def crc16(data):
+    crc = 0xFFFF
+    for b in data:
+        crc ^= b
+        for _ in range(8):
+            if crc & 1:
+                crc = (crc >> 1) ^ 0xA001
+            else:
+                crc >>= 1
+    return crc
+
+
+def frame_gap(baud):
+    """RTU 幀間隔 3.5 字元時間（11 bit/字元），19200 以上固定 1.75 ms"""
+    if baud > 19200:
+        return 0.00175
+    return 3.5 * 11.0 / float(baud)
+
+
+def with_crc(body):
+    crc = crc16(body)
+    return bytes(body) + bytes([crc & 0xFF, crc >> 8])
+
+
+def build_read_request(addr, func, start, count):
+    return with_crc(struct.pack('>BBHH', addr, func, start, count))
+
+
+def response_length(func, count):
+    # addr + func + byte count + 2*count + crc
+    return 5 + 2 * count
+
+
+def parse_read_response(frame, addr, func, count):
+    if not frame:
+        raise ModbusTimeout(f'no response from slave {addr}')
+    if len(frame) >= 5 and frame[1] == (func | 0x80):
+        if crc16(frame[:3]) != (frame[3] | (frame[4] << 8)):
+            raise ModbusFrameError('bad CRC in exception response')
+        raise ModbusExceptionResponse(addr, func, frame[2])
+    n = response_length(func, count)
+    if len(frame) < n:
+        raise ModbusFrameError(f'short response ({len(frame)}/{n} bytes)')
+    frame = bytes(frame[:n])
+    if crc16(frame[:-2]) != (frame[-2] | (frame[-1] << 8)):
+        raise ModbusFrameError('bad CRC')
+    if frame[0] != addr or frame[1] != func or frame[2] != 2 * count:
+        raise ModbusFrameError('unexpected response header')
+    return struct.unpack(f'>{count}H', frame[3:-2])
+
+
+def open_fd(port, baud):
+    """以非阻塞 fd 開啟串口（POSIX），設定 raw 8N1"""
+    fd = os.open(port, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+    try:
+        attrs = termios.tcgetattr(fd)
+        speed = getattr(termios, f'B{int(baud)}')
+        attrs[0] = 0
+        attrs[1] = 0
+        attrs[2] = termios.CS8 | termios.CREAD | termios.CLOCAL
+        attrs[3] = 0
+        attrs[4] = speed
+        attrs[5] = speed
+        attrs[6][termios.VMIN] = 0
+        attrs[6][termios.VTIME] = 0
+        termios.tcsetattr(fd, termios.TCSANOW, attrs)
+    except Exception:
+        os.close(fd)
+        raise
+    return fd
+
+
+def available():
+    return termios is not None or serial is not None
+
+
+class FdTransport:
+    """由事件迴圈 add_reader 驅動的非阻塞 fd"""
+
+    def __init__(self, fd):
+        self.fd = fd
+        self.buf = bytearray()
+        self._loop = None
+        self._event = None
+
+    def attach(self, loop):
+        self._loop = loop
+        self._event = asyncio.Event()
+        loop.add_reader(self.fd, self._on_readable)
+
+    def _on_readable(self):
+        try:
+            data = os.read(self.fd, 512)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+        if data:
+            self.buf += data
+        self._event.set()
+
+    def discard_input(self):
+        self.buf.clear()
+        try:
+            while os.read(self.fd, 512):
+                pass
+        except OSError:
+            pass
+
+    async def write(self, data):
+        view = memoryview(data)
+        while view:
+            try:
+                n = os.write(self.fd, view)
+            except (BlockingIOError, InterruptedError):
+                n = 0
+            view = view[n:]
+            if view:
+                await asyncio.sleep(0.001)
+
+    async def wait_readable(self, timeout):
+        self._event.clear()
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def close(self):
+        if self._loop is not None:
+            self._loop.remove_reader(self.fd)
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+
+
+class PollTransport:
+    """pyserial（timeout=0）輪詢版本，用於無法 add_reader 串口的平台（Windows）"""
+
+    def __init__(self, ser, poll=0.002):
+        self.ser = ser
+        self.poll = poll
+        self.buf = bytearray()
+
+    def attach(self, loop):
+        pass
+
+    def discard_input(self):
+        self.buf.clear()
+        try:
+            self.ser.reset_input_buffer()
+        except Exception:
+            pass
+
+    async def write(self, data):
+        self.ser.write(data)
+
+    async def wait_readable(self, timeout):
+        await asyncio.sleep(min(self.poll, max(0.0, timeout)))
+        try:
+            n = self.ser.in_waiting
+            if n:
+                self.buf += self.ser.read(n)
+        except Exception:
+            pass
+
+    def close(self):
+        try:
+            self.ser.close()
+        except Exception:
+            pass
+
+
+def open_transport(port, baud):
+    if termios is not None:
+        return FdTransport(open_fd(port, baud))
+    if serial is not None:
+        return PollTransport(serial.Serial(port, baudrate=baud, bytesize=8, parity='N', stopbits=1, timeout=0))
+    raise RuntimeError('no serial transport available')
+
+
+class AsyncRtuClient:
+    """單一串口的 RTU 主站：請求依序送出、遵守幀間隔、每個請求有自己的逾時"""
+
+    def __init__(self, transport, baud=9600, timeout=0.3, gap=None):
+        self.transport = transport
+        self.baud = int(baud)
+        self.timeout = float(timeout)
+        self.gap = frame_gap(self.baud) if gap is None else float(gap)
+        self._lock = None
+        self._last_frame_end = 0.0
+        self.last_latency_ms = None
+
+    def attach(self, loop):
+        self._lock = asyncio.Lock()
+        self.transport.attach(loop)
+
+    async def read_registers(self, addr, start, count, func=3, timeout=None):
+        timeout = self.timeout if timeout is None else float(timeout)
+        request = build_read_request(addr, func, start, count)
+        expected = response_length(func, count)
+        tr = self.transport
+        async with self._lock:
+            pause = self._last_frame_end + self.gap - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            tr.discard_input()
+            t0 = time.monotonic()
+            await tr.write(request)
+            deadline = t0 + timeout
+            while True:
+                buf = tr.buf
+                if len(buf) >= expected or (len(buf) >= 5 and buf[1] == (func | 0x80)):
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                await tr.wait_readable(remaining)
+            frame = bytes(tr.buf)
+            self._last_frame_end = time.monotonic()
+            self.last_latency_ms = (self._last_frame_end - t0) * 1000.0
+        return parse_read_response(frame, addr, func, count)
+
+    def close(self):
+        self.transport.close()
+
+
+class AcquisitionLoop:
+    """所有串口共用的單一事件迴圈執行緒"""
+
+    def __init__(self):
+        self.loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                ready = threading.Event()
+                def run():
+                    self.loop = asyncio.new_event_loop()
+                    asyncio.set_event_loop(self.loop)
+                    ready.set()
+                    self.loop.run_forever()
+                self._thread = threading.Thread(target=run, name='modbus-loop', daemon=True)
+                self._thread.start()
+                ready.wait()
+        return self
+
+    def run(self, coro, timeout=None):
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def call_soon(self, fn, *args):
+        self.start()
+        self.loop.call_soon_threadsafe(fn, *args)
+
+    def stop(self):
+        with self._lock:
+            if self._thread is None:
+                return
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(2.0)
+            self._thread = None
+
+
+_default_loop = AcquisitionLoop()
+
+
+def get_loop():
+    return _default_loop.start()
+
+
+class SyncMaster:
+    """提供 modbus_tk RtuMaster 相同的 set_timeout/execute/close 介面，供掃描等同步程式使用"""
+
+    def __init__(self, port, baud=9600, timeout=0.3, loop=None, transport=None):
+        self._aloop = loop or get_loop()
+        self.client = AsyncRtuClient(transport or open_transport(port, baud), baud, timeout)
+        self._aloop.run(self._attach())
+
+    async def _attach(self):
+        self.client.attach(asyncio.get_running_loop())
+
+    def set_timeout(self, timeout):
+        self.client.timeout = float(timeout)
+
+    def execute(self, addr, func, start, count):
+        return self._aloop.run(self.client.read_registers(addr, start, count, func), self.client.timeout + 2.0)
+
+    def close(self):
+        async def _close():
+            self.client.close()
+        self._aloop.run(_close())
@@ -0,0 +1,456 @@
+import json
+import math
+import time
+import asyncio
+import threading
+from collections import deque
+try:
+    import serial
+except Exception:
+    serial = None
+try:
+    from modbus_tk import modbus_rtu
+except Exception:
+    modbus_rtu = None
+import modbus_async
+from modbus_async import frame_gap
+
+
+def rtu_available():
+    return (modbus_rtu is not None and serial is not None) or modbus_async.available()
+
+
+def open_rtu_master(port, baud=9600, timeout=0.3):
+    if modbus_rtu is None or serial is None:
+        # 未安裝 modbus-tk 時改用內建的 RTU 主站（同樣的 set_timeout/execute/close 介面）
+        return modbus_async.SyncMaster(port, baud, timeout)
+    ser = serial.Serial(port, baudrate=baud, bytesize=8, parity='N', stopbits=1, timeout=timeout)
+    try:
+        master = modbus_rtu.RtuMaster(ser)
+        master.set_timeout(timeout)
+        master.set_verbose(False)
+    except Exception:
+        ser.close()
+        raise
+    return master
+
+
+def plan_reads(ranges, max_count=64, max_gap=8):
+    """把同一從站的 (start, count) 合併成最少的區塊讀取；間隔不超過 max_gap 個暫存器就一起讀"""
+    spans = []
+    for start, count in sorted(ranges):
+        end = start + count
+        if spans and start <= spans[-1][1] + max_gap and max(end, spans[-1][1]) - spans[-1][0] <= max_count:
+            spans[-1][1] = max(end, spans[-1][1])
+        else:
+            spans.append([start, end])
+    return [(a, b - a) for a, b in spans]
+
+
+DEFAULT_PROFILES = {
+    'temperature': {'temperature': {'register': 0, 'scale': 0.1}},
+    'current': {'current': {'register': 0, 'scale': 1.0}},
+}
+
+
+class RegisterMap:
+    """每個從站要讀哪些保持暫存器、如何換算；未列出的地址使用預設設定檔"""
+
+    def __init__(self, profiles=None, devices=None):
+        self.profiles = dict(DEFAULT_PROFILES)
+        self.profiles.update(profiles or {})
+        self.devices = {str(k): v for k, v in (devices or {}).items()}
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                cfg = json.load(f)
+        except Exception:
+            return cls()
+        return cls(cfg.get('profiles'), cfg.get('devices'))
+
+    def fields(self, addr, default_profile, only=None):
+        profile = self.profiles.get(self.devices.get(str(addr), default_profile)) or self.profiles[default_profile]
+        picked = {k: v for k, v in profile.items() if only is None or k in only}
+        if not picked:
+            # 設備設定檔沒有這個欄位時退回預設設定檔
+            picked = {k: v for k, v in self.profiles[default_profile].items() if only is None or k in only}
+        return picked
+
+    @staticmethod
+    def span(fields):
+        regs = [f['register'] for f in fields.values()]
+        return min(regs), max(regs) - min(regs) + 1
+
+    @staticmethod
+    def decode(values, start, fields):
+        out = {}
+        for name, f in fields.items():
+            raw = values[f['register'] - start]
+            if f.get('signed') and raw >= 0x8000:
+                raw -= 0x10000
+            out[name] = raw * f.get('scale', 1.0) + f.get('offset', 0.0)
+        return out
+
+
+class Subscription:
+    def __init__(self, addr, func, start, count, interval, callback, priority):
+        self.addr = addr
+        self.func = func
+        self.start = start
+        self.count = count
+        self.interval = max(0.0, float(interval))
+        self.callback = callback
+        self.priority = priority
+        self.next_due = 0.0
+        self.last_served = 0.0
+        self.last_values = None
+        self.last_ok = None
+        self.errors = 0
+
+    def deliver(self, values, now):
+        self.last_served = now
+        # 維持固定節拍；落後超過一個週期時不補讀，對齊到下一個 interval 整數倍，
+        # 同一從站、同一週期的訂閱因此落在同一時刻，能合併成一個區塊讀取
+        self.next_due += self.interval
+        if self.next_due <= now:
+            self.next_due = (math.floor(now / self.interval) + 1) * self.interval if self.interval else now
+        self.last_values = values
+        if values is None:
+            self.errors += 1
+        else:
+            self.last_ok = now
+        try:
+            self.callback(values)
+        except Exception:
+            pass
+
+
+class _Call:
+    def __init__(self, addr, func, start, count):
+        self.addr = addr
+        self.func = func
+        self.start = start
+        self.count = count
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class BusScheduler:
+    """單一串口的匯流排擁有者：所有生產線的讀取請求排隊輪流送出，保證同一時間只有一個幀在線上"""
+
+    def __init__(self, port, baud=9600, timeout=0.3, gap=None, master_factory=None, max_block=64, max_gap=8):
+        self.port = port
+        self.baud = int(baud)
+        self.timeout = float(timeout)
+        self.gap = frame_gap(self.baud) if gap is None else float(gap)
+        self._factory = master_factory or (lambda: open_rtu_master(port, self.baud, self.timeout))
+        self.max_block = int(max_block)
+        self.max_gap = int(max_gap)
+        self._master = None
+        self._subs = []
+        self._calls = deque()
+        self._cond = threading.Condition()
+        self._closing = False
+        self._thread = None
+        self._last_frame_end = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.coalesced = 0
+        self.last_latency_ms = None
+        self.refs = 0
+
+    def start(self):
+        if self._thread is None:
+            self._master = self._factory()
+            self._closing = False
+            self._thread = threading.Thread(target=self._run, name=f'modbus-bus-{self.port}', daemon=True)
+            self._thread.start()
+        return self
+
+    def subscribe(self, addr, interval, callback, func=3, start=0, count=1, priority=1):
+        sub = Subscription(addr, func, start, count, interval, callback, priority)
+        with self._cond:
+            self._subs.append(sub)
+            self._cond.notify()
+        return sub
+
+    def subscribe_fields(self, addr, fields, interval, callback, priority=1):
+        """依暫存器對照表訂閱；callback 收到 {欄位: 換算值}，失敗時為 None"""
+        start, count = RegisterMap.span(fields)
+        def on_values(values):
+            callback(RegisterMap.decode(values, start, fields) if values else None)
+        return self.subscribe(addr, interval, on_values, 3, start, count, priority)
+
+    def unsubscribe(self, sub):
+        with self._cond:
+            if sub in self._subs:
+                self._subs.remove(sub)
+
+    def call(self, addr, func=3, start=0, count=1, timeout=None):
+        """插隊執行一次請求（探測/掃描用），在匯流排執行緒完成後回傳"""
+        c = _Call(addr, func, start, count)
+        with self._cond:
+            self._calls.append(c)
+            self._cond.notify()
+        if not c.done.wait(timeout if timeout is not None else self.timeout * 4 + 1.0):
+            raise TimeoutError(f'bus {self.port} busy')
+        if c.error is not None:
+            raise c.error
+        return c.result
+
+    def close(self, timeout=2.0):
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._master is not None:
+            try:
+                self._master.close()
+            except Exception:
+                pass
+            self._master = None
+
+    def stats(self):
+        with self._cond:
+            return {
+                'port': self.port,
+                'subscriptions': len(self._subs),
+                'pending_calls': len(self._calls),
+                'requests': self.requests,
+                'errors': self.errors,
+                'coalesced': self.coalesced,
+                'last_latency_ms': self.last_latency_ms,
+            }
+
+    def _next_item(self):
+        with self._cond:
+            while not self._closing:
+                if self._calls:
+                    return self._calls.popleft()
+                now = time.monotonic()
+                due = [s for s in self._subs if s.next_due <= now]
+                if due:
+                    # 同時到期時依優先序，再取最久未服務者（輪詢）
+                    first = min(due, key=lambda s: (s.priority, s.last_served))
+                    # 同一從站同功能碼、已到期的其他訂閱一起以區塊讀取
+                    return [s for s in due if s.addr == first.addr and s.func == first.func]
+                wait = min((s.next_due for s in self._subs), default=now + 1.0) - now
+                self._cond.wait(max(0.001, wait))
+        return None
+
+    def _execute(self, addr, func, start, count):
+        pause = self._last_frame_end + self.gap - time.monotonic()
+        if pause > 0:
+            time.sleep(pause)
+        t0 = time.monotonic()
+        try:
+            return self._master.execute(addr, func, start, count)
+        finally:
+            self._last_frame_end = time.monotonic()
+            self.last_latency_ms = (self._last_frame_end - t0) * 1000.0
+            self.requests += 1
+
+    @staticmethod
+    def _deliver(subs, results):
+        """把各區塊讀取結果切給對應的訂閱者"""
+        now = time.monotonic()
+        for sub in subs:
+            values = None
+            for start, (count, block) in results.items():
+                if start <= sub.start and sub.start + sub.count <= start + count:
+                    if block is not None and len(block) >= count:
+                        values = tuple(block[sub.start - start:sub.start - start + sub.count])
+                    break
+            sub.deliver(values, now)
+
+    def _poll_group(self, subs):
+        addr, func = subs[0].addr, subs[0].func
+        spans = plan_reads([(sub.start, sub.count) for sub in subs], self.max_block, self.max_gap)
+        if len(subs) > len(spans):
+            self.coalesced += len(subs) - len(spans)
+        results = {}
+        for start, count in spans:
+            try:
+                results[start] = (count, self._execute(addr, func, start, count))
+            except Exception:
+                self.errors += 1
+                results[start] = (count, None)
+        self._deliver(subs, results)
+
+    def _run(self):
+        while True:
+            item = self._next_item()
+            if item is None:
+                return
+            if isinstance(item, _Call):
+                try:
+                    item.result = self._execute(item.addr, item.func, item.start, item.count)
+                except Exception as e:
+                    self.errors += 1
+                    item.error = e
+                item.done.set()
+                continue
+            self._poll_group(item)
+
+
+class AsyncBus(BusScheduler):
+    """BusScheduler 的 asyncio 版本：所有串口的輪詢都在同一個事件迴圈執行緒內以截止時間排程"""
+
+    def __init__(self, port, baud=9600, timeout=0.3, gap=None, transport_factory=None, loop=None,
+                 max_block=64, max_gap=8):
+        super().__init__(port, baud, timeout, gap, max_block=max_block, max_gap=max_gap)
+        self._transport_factory = transport_factory or (lambda: modbus_async.open_transport(port, self.baud))
+        self._aloop = loop or modbus_async.get_loop()
+        self.client = None
+        self._task = None
+        self._wake = None
+
+    def start(self):
+        if self._task is None:
+            self._closing = False
+            self._aloop.run(self._astart(), 5.0)
+        return self
+
+    async def _astart(self):
+        self.client = modbus_async.AsyncRtuClient(self._transport_factory(), self.baud, self.timeout, self.gap)
+        self.client.attach(asyncio.get_running_loop())
+        self._wake = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._poll_forever())
+
+    def _notify(self):
+        if self._wake is not None:
+            self._aloop.call_soon(self._wake.set)
+
+    def subscribe(self, addr, interval, callback, func=3, start=0, count=1, priority=1):
+        sub = Subscription(addr, func, start, count, interval, callback, priority)
+        with self._cond:
+            self._subs.append(sub)
+        self._notify()
+        return sub
+
+    def call(self, addr, func=3, start=0, count=1, timeout=None):
+        return self._aloop.run(self._read(addr, func, start, count),
+                               timeout if timeout is not None else self.timeout * 4 + 1.0)
+
+    async def _read(self, addr, func, start, count):
+        try:
+            return await self.client.read_registers(addr, start, count, func)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.requests += 1
+            self.last_latency_ms = self.client.last_latency_ms
+
+    def close(self, timeout=2.0):
+        if self._task is None:
+            return
+        self._closing = True
+        try:
+            self._aloop.run(self._aclose(), timeout)
+        except Exception:
+            pass
+        self._task = None
+
+    async def _aclose(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except (asyncio.CancelledError, Exception):
+            pass
+        self.client.close()
+
+    async def _poll_forever(self):
+        while not self._closing:
+            with self._cond:
+                now = time.monotonic()
+                due = [s for s in self._subs if s.next_due <= now]
+                wait = min((s.next_due for s in self._subs), default=now + 1.0) - now
+            if not due:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), max(0.001, wait))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            first = min(due, key=lambda s: (s.priority, s.last_served))
+            await self._apoll_group([s for s in due if s.addr == first.addr and s.func == first.func])
+
+    async def _apoll_group(self, subs):
+        addr, func = subs[0].addr, subs[0].func
+        spans = plan_reads([(sub.start, sub.count) for sub in subs], self.max_block, self.max_gap)
+        if len(subs) > len(spans):
+            self.coalesced += len(subs) - len(spans)
+        results = {}
+        for start, count in spans:
+            try:
+                results[start] = (count, await self._read(addr, func, start, count))
+            except Exception:
+                results[start] = (count, None)
+        self._deliver(subs, results)
+
+
+_buses = {}
+_buses_lock = threading.Lock()
+_port_locks = {}
+
+
+def port_lock(port):
+    """同一串口同時只允許一方開啟（匯流排或掃描）"""
+    with _buses_lock:
+        lock = _port_locks.get(port)
+        if lock is None:
+            lock = _port_locks[port] = threading.Lock()
+        return lock
+
+
+def acquire_bus(port, baud=9600, timeout=0.3, master_factory=None):
+    """取得（必要時開啟）某串口共用的匯流排，以參考計數管理；
+    預設為 AsyncBus（共用事件迴圈），指定 master_factory 時使用執行緒版 BusScheduler"""
+    with _buses_lock:
+        bus = _buses.get(port)
+        if bus is not None:
+            bus.refs += 1
+            return bus
+    # 等待進行中的掃描/驗證釋放串口後再開啟
+    with port_lock(port):
+        with _buses_lock:
+            bus = _buses.get(port)
+            if bus is None:
+                if master_factory is not None:
+                    bus = BusScheduler(port, baud, timeout, master_factory=master_factory).start()
+                else:
+                    bus = AsyncBus(port, baud, timeout).start()
+                _buses[port] = bus
+            bus.refs += 1
+            return bus
+
+
+def release_bus(bus):
+    with _buses_lock:
+        bus.refs -= 1
+        if bus.refs > 0:
+            return
+        if _buses.get(bus.port) is bus:
+            del _buses[bus.port]
+    with port_lock(bus.port):
+        bus.close()
+
+
+def get_bus(port):
+    with _buses_lock:
+        return _buses.get(port)
+
+
+def close_all():
+    with _buses_lock:
+        buses = list(_buses.values())
+        _buses.clear()
+    for bus in buses:
+        with port_lock(bus.port):
+            bus.close()
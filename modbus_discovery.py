@@ -0,0 +1,276 @@
+import os
+import json
+import time
+import threading
+from modbus_bus import open_rtu_master, port_lock, get_bus
+
+SILENT = 'silent'
+PARTIAL = 'partial'
+PRESENT = 'present'
+
+DEFAULT_ADDRESSES = '1-32'
+DEFAULT_BAUDS = '9600'
+
+
+def parse_addresses(text):
+    """'1-32,40,50-52' -> [1..32, 40, 50, 51, 52]，只保留 1-247"""
+    out = []
+    for part in str(text).replace(' ', '').split(','):
+        if not part:
+            continue
+        if '-' in part:
+            a, b = part.split('-', 1)
+            out.extend(range(int(a), int(b) + 1))
+        else:
+            out.append(int(part))
+    seen = set()
+    return [a for a in out if 1 <= a <= 247 and not (a in seen or seen.add(a))]
+
+
+def parse_bauds(text):
+    return [int(b) for b in str(text).replace(' ', '').split(',') if b]
+
+
+def frame_time(baud, nbytes=15):
+    """功能碼 3 讀 1 暫存器：請求 8 + 回應 7 位元組，每位元組 11 bit"""
+    return nbytes * 11.0 / float(baud)
+
+
+class LatencyEstimator:
+    """依實測回應時間調整探測逾時（類似 TCP RTO：srtt + 4 * rttvar），未有樣本前用幀長推估"""
+
+    def __init__(self, baud=9600, min_timeout=0.02, max_timeout=0.3, turnaround=0.03):
+        self.min_timeout = float(min_timeout)
+        self.max_timeout = float(max_timeout)
+        self.floor = frame_time(baud)
+        self.initial = frame_time(baud) + turnaround
+        self.srtt = None
+        self.rttvar = None
+
+    def observe(self, seconds):
+        if self.srtt is None:
+            self.srtt = seconds
+            self.rttvar = seconds / 2.0
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - seconds)
+            self.srtt = 0.875 * self.srtt + 0.125 * seconds
+
+    @property
+    def timeout(self):
+        t = self.initial if self.srtt is None else max(self.floor, self.srtt + 4.0 * self.rttvar)
+        return min(self.max_timeout, max(self.min_timeout, t))
+
+
+def classify_error(exc):
+    name = type(exc).__name__
+    if name in ('ModbusError', 'ModbusExceptionResponse'):
+        # 從站回了例外碼，代表設備存在
+        return PRESENT
+    if isinstance(exc, TimeoutError) or 'invalid 0' in str(exc):
+        return SILENT
+    if name in ('ModbusInvalidResponseError', 'ModbusFrameError'):
+        # 收到殘缺或 CRC 錯誤的回應，值得用較長逾時重試
+        return PARTIAL
+    return SILENT
+
+
+def master_prober(master):
+    def probe(addr, timeout):
+        master.set_timeout(timeout)
+        try:
+            master.execute(addr, 3, 0, 1)
+            return PRESENT
+        except Exception as e:
+            return classify_error(e)
+    return probe
+
+
+def discover(probe, addresses, estimator, on_found=None, stop=None, retries=1, first_only=False):
+    """逐一探測地址；無回應只花一個短逾時，只有殘缺回應才以最大逾時重試"""
+    found = []
+    for addr in addresses:
+        if stop is not None and stop.is_set():
+            break
+        timeout = estimator.timeout
+        t0 = time.monotonic()
+        result = probe(addr, timeout)
+        tries = 0
+        while result == PARTIAL and tries < retries:
+            tries += 1
+            timeout = estimator.max_timeout
+            t0 = time.monotonic()
+            result = probe(addr, timeout)
+        if result != PRESENT:
+            continue
+        estimator.observe(time.monotonic() - t0)
+        found.append(addr)
+        if on_found is not None:
+            on_found(addr)
+        if first_only:
+            break
+    return found
+
+
+def scan_port(port, addresses, bauds=(9600,), on_found=None, stop=None, min_timeout=0.02, max_timeout=0.3,
+              first_only=False, open_master=open_rtu_master, first_baud=False):
+    """掃描單一串口的各鮑率，回傳 [(baud, addr)]；on_found(port, baud, addr) 即時回報
+
+    first_only 找到第一個設備即停止；first_baud 掃完有回應的鮑率的所有地址後，不再嘗試其他鮑率
+    （同一條 RS-485 匯流排只有一種鮑率）。
+    """
+    results = []
+    for baud in bauds:
+        if stop is not None and stop.is_set():
+            break
+        with port_lock(port):
+            try:
+                master = open_master(port, baud, max_timeout)
+            except Exception:
+                return results
+            try:
+                est = LatencyEstimator(baud, min_timeout, max_timeout)
+                cb = (lambda addr, baud=baud: on_found(port, baud, addr)) if on_found else None
+                for addr in discover(master_prober(master), addresses, est, cb, stop, first_only=first_only):
+                    results.append((baud, addr))
+            finally:
+                try:
+                    master.close()
+                except Exception:
+                    pass
+        if (first_only or first_baud) and results:
+            break
+    return results
+
+
+def scan_ports(ports, addresses, bauds=(9600,), on_found=None, stop=None, min_timeout=0.02, max_timeout=0.3,
+               first_only=False, open_master=open_rtu_master, first_baud=False):
+    """各串口平行掃描，回傳 {port: [(baud, addr)]}"""
+    results = {}
+    def worker(port):
+        results[port] = scan_port(port, addresses, bauds, on_found, stop, min_timeout, max_timeout,
+                                  first_only, open_master, first_baud)
+    threads = [threading.Thread(target=worker, args=(p,), daemon=True) for p in ports]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+class DiscoveryCache:
+    """掃描結果的持久快取，鍵為 (port, baud, addr)；超過 ttl 未確認的項目不再用來填選單"""
+
+    def __init__(self, path, ttl=7 * 24 * 3600):
+        self.path = path
+        self.ttl = float(ttl)
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            for e in data.get('entries', []):
+                self._entries[(e['port'], int(e['baud']), int(e['addr']))] = e
+        except Exception:
+            self._entries = {}
+
+    def save(self):
+        with self._lock:
+            entries = sorted(self._entries.values(), key=lambda e: (e['port'], e['baud'], e['addr']))
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'entries': entries}, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.path)
+        except Exception:
+            pass
+
+    def record(self, port, baud, addr, now=None):
+        with self._lock:
+            self._entries[(port, int(baud), int(addr))] = {
+                'port': port, 'baud': int(baud), 'addr': int(addr), 'seen': now if now is not None else time.time()}
+
+    def forget(self, port, baud, addr):
+        with self._lock:
+            self._entries.pop((port, int(baud), int(addr)), None)
+
+    def replace_scan(self, port, baud, scanned, found, now=None):
+        """一次完整掃描後：掃描範圍內沒回應的地址移除，有回應的更新時間"""
+        found = set(found)
+        for addr in scanned:
+            if addr in found:
+                self.record(port, baud, addr, now)
+            else:
+                self.forget(port, baud, addr)
+
+    def entries(self, include_stale=False, now=None):
+        now = now if now is not None else time.time()
+        with self._lock:
+            items = list(self._entries.values())
+        return [dict(e) for e in items if include_stale or now - e['seen'] <= self.ttl]
+
+    def addresses(self, port, baud=None, now=None):
+        return sorted({e['addr'] for e in self.entries(now=now)
+                       if e['port'] == port and (baud is None or e['baud'] == baud)})
+
+    def ports(self, now=None):
+        return sorted({e['port'] for e in self.entries(now=now)})
+
+
+def revalidate(cache, stop=None, timeout=0.3, open_master=open_rtu_master, on_result=None):
+    """背景逐一以單一地址 ping 快取項目（每個串口/鮑率只開一次），更新或移除；回傳仍有效的串口
+
+    只有確實探測且無回應的項目才移除；串口無法開啟（被占用）或回應殘缺時保留原項目。
+    """
+    groups = {}
+    for e in cache.entries(include_stale=True):
+        groups.setdefault((e['port'], e['baud']), []).append(e['addr'])
+    alive = set()
+    for (port, baud), addrs in sorted(groups.items()):
+        if stop is not None and stop.is_set():
+            break
+        bus = get_bus(port)
+        if bus is not None:
+            # 串口已在擷取中，ping 經由匯流排送出
+            def probe(addr, t, bus=bus):
+                try:
+                    bus.call(addr, 3, 0, 1)
+                    return PRESENT
+                except Exception as e:
+                    return classify_error(e)
+            results = [(a, probe(a, timeout)) for a in sorted(addrs)]
+        else:
+            with port_lock(port):
+                try:
+                    master = open_master(port, baud, timeout)
+                except Exception:
+                    master = None
+                if master is None:
+                    results = [(a, None) for a in sorted(addrs)]
+                else:
+                    try:
+                        probe = master_prober(master)
+                        results = []
+                        for a in sorted(addrs):
+                            r = probe(a, timeout)
+                            if r == PARTIAL:
+                                r = probe(a, timeout)
+                            results.append((a, r))
+                    finally:
+                        try:
+                            master.close()
+                        except Exception:
+                            pass
+        for addr, r in results:
+            if r == PRESENT:
+                cache.record(port, baud, addr)
+                alive.add(port)
+            elif r == SILENT:
+                cache.forget(port, baud, addr)
+            if on_result is not None:
+                on_result(port, baud, addr, r == PRESENT)
+    cache.save()
+    return sorted(alive)
+
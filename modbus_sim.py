@@ -0,0 +1,206 @@
+import os
+import sys
+import math
+import time
+import random
+import select
+import struct
+import argparse
+import threading
+from modbus_async import crc16, with_crc, open_fd
+
+# 暫存器設定檔：register -> f(t, addr)，回傳 16 bit 原始值
+PROFILES = {
+    'temperature': {
+        0: lambda t, a: int(round((25.0 + 5.0 * math.sin(t / 10.0 + a)) * 10)),
+    },
+    'current': {
+        0: lambda t, a: int(round(10.0 + 2.0 * math.sin(t / 7.0 + a))),
+    },
+    'temp_current': {
+        0: lambda t, a: int(round((25.0 + 5.0 * math.sin(t / 10.0 + a)) * 10)),
+        1: lambda t, a: int(round((10.0 + 2.0 * math.sin(t / 7.0 + a)) * 100)),
+    },
+    # 固定值 addr * 100 + register，方便驗證
+    'static': {},
+}
+
+
+class VirtualSlave:
+    """單一虛擬 RTU 從站：可設定回應延遲、抖動、例外回應率、不回應率、殘缺回應率"""
+
+    def __init__(self, addr, profile='temperature', latency=0.005, jitter=0.0, error_rate=0.0,
+                 timeout_rate=0.0, garble_rate=0.0, registers=16, seed=None):
+        self.addr = int(addr)
+        self.profile = PROFILES[profile] if isinstance(profile, str) else dict(profile)
+        self.latency = float(latency)
+        self.jitter = float(jitter)
+        self.error_rate = float(error_rate)
+        self.timeout_rate = float(timeout_rate)
+        self.garble_rate = float(garble_rate)
+        self.registers = int(registers)
+        self.rng = random.Random(seed if seed is not None else addr)
+        self.requests = 0
+        self.t0 = time.monotonic()
+
+    def delay(self):
+        return max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+
+    def register(self, reg, t):
+        fn = self.profile.get(reg)
+        v = fn(t, self.addr) if fn else self.addr * 100 + reg
+        return int(v) & 0xFFFF
+
+    def respond(self, func, body):
+        """回傳回應幀；None 表示不回應"""
+        self.requests += 1
+        r = self.rng.random()
+        if r < self.timeout_rate:
+            return None
+        if func == 0x11:
+            resp = with_crc(bytes([self.addr, 0x11, 2, self.addr, 0xFF]))
+        elif func in (3, 4):
+            start, count = struct.unpack('>HH', body)
+            if r < self.timeout_rate + self.error_rate or count < 1 or start + count > self.registers:
+                return with_crc(bytes([self.addr, func | 0x80, 2]))
+            t = time.monotonic() - self.t0
+            regs = [self.register(start + i, t) for i in range(count)]
+            resp = with_crc(bytes([self.addr, func, 2 * count]) + struct.pack(f'>{count}H', *regs))
+        else:
+            return with_crc(bytes([self.addr, func | 0x80, 1]))
+        if self.rng.random() < self.garble_rate:
+            resp = resp[:-1]
+        return resp
+
+
+class VirtualBus:
+    """一組 pty：tty 端給擷取程式開啟（如同 /dev/ttyUSB0），另一端由本執行緒扮演匯流排上的所有從站"""
+
+    def __init__(self, slaves, baud=9600, wire_delay=True):
+        self.slaves = {s.addr: s for s in slaves}
+        self.baud = int(baud)
+        self.wire_delay = wire_delay
+        self.port = None
+        self.requests = 0
+        self.bad_frames = 0
+        self._fd = None
+        self._tty_fd = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._fd, self._tty_fd = os.openpty()
+        self.port = os.ttyname(self._tty_fd)
+        # 讓 tty 端保持 raw，且一直開著，避免客戶端之間 pty 另一端讀到 EIO
+        os.close(open_fd(self.port, self.baud))
+        self._thread = threading.Thread(target=self._run, name=f'modbus-sim-{self.port}', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(1.0)
+            self._thread = None
+        for fd in (self._fd, self._tty_fd):
+            try:
+                os.close(fd)
+            except Exception:
+                pass
+
+    def _wire(self, nbytes):
+        return nbytes * 11.0 / self.baud if self.wire_delay else 0.0
+
+    def _run(self):
+        buf = b''
+        while not self._stop.is_set():
+            r, _, _ = select.select([self._fd], [], [], 0.1)
+            if not r:
+                # 匯流排閒置時丟棄未完成的殘片
+                buf = b''
+                continue
+            try:
+                buf += os.read(self._fd, 512)
+            except OSError:
+                time.sleep(0.01)
+                continue
+            while len(buf) >= 2:
+                func = buf[1]
+                n = 8 if func in (3, 4) else 4 if func == 0x11 else None
+                if n is None:
+                    self.bad_frames += 1
+                    buf = b''
+                    break
+                if len(buf) < n:
+                    break
+                frame, buf = buf[:n], buf[n:]
+                if crc16(frame[:-2]) != (frame[-2] | (frame[-1] << 8)):
+                    # CRC 錯誤的請求，真實從站不會回應
+                    self.bad_frames += 1
+                    buf = b''
+                    break
+                self.requests += 1
+                slave = self.slaves.get(frame[0])
+                if slave is None:
+                    continue
+                resp = slave.respond(func, frame[2:-2])
+                if resp is None:
+                    continue
+                time.sleep(self._wire(n) + slave.delay() + self._wire(len(resp)))
+                try:
+                    os.write(self._fd, resp)
+                except OSError:
+                    pass
+
+
+def build(devices, ports=1, profile='temperature', baud=9600, latency=0.005, jitter=0.0, error_rate=0.0,
+          timeout_rate=0.0, garble_rate=0.0, wire_delay=True, seed=0):
+    """建立 devices 台虛擬從站，平均分到 ports 條匯流排，位址各自從 1 起算；回傳 [VirtualBus]"""
+    per_port = [[] for _ in range(max(1, min(ports, devices)))]
+    for i in range(devices):
+        per_port[i % len(per_port)].append(i)
+    buses = []
+    for p, idx in enumerate(per_port):
+        if len(idx) > 247:
+            raise ValueError('at most 247 slaves per bus')
+        slaves = [VirtualSlave(n + 1, profile, latency, jitter, error_rate, timeout_rate, garble_rate,
+                               seed=seed * 1000 + p * 256 + n) for n in range(len(idx))]
+        buses.append(VirtualBus(slaves, baud, wire_delay).start())
+    return buses
+
+
+def stop_all(buses):
+    for b in buses:
+        b.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Virtual Modbus RTU slaves on pseudo-terminals')
+    parser.add_argument('--devices', type=int, default=4)
+    parser.add_argument('--ports', type=int, default=1)
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='temp_current')
+    parser.add_argument('--baud', type=int, default=9600)
+    parser.add_argument('--latency', type=float, default=5.0, help='response latency (ms)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='latency jitter, +/- ms')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction answered with an exception')
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help='fraction left unanswered')
+    parser.add_argument('--garble-rate', type=float, default=0.0, help='fraction answered with a truncated frame')
+    parser.add_argument('--no-wire-delay', action='store_true', help='do not emulate line time at --baud')
+    args = parser.parse_args()
+    buses = build(args.devices, args.ports, args.profile, args.baud, args.latency / 1000.0, args.jitter / 1000.0,
+                  args.error_rate, args.timeout_rate, args.garble_rate, not args.no_wire_delay)
+    for b in buses:
+        print(f'{b.port}: slaves {min(b.slaves)}-{max(b.slaves)} @ {b.baud} bps')
+    print(f'EMS_EXTRA_PORTS={os.pathsep.join(b.port for b in buses)}')
+    sys.stdout.flush()
+    try:
+        while True:
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_all(buses)
+
+
+if __name__ == '__main__':
+    main()
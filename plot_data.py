@@ -0,0 +1,299 @@
+from array import array
+from collections import deque
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+
+class RingBuffer:
+    """固定容量的 float 環形緩衝：append O(1)，segments() 依時間順序回傳兩段零複製 memoryview"""
+
+    def __init__(self, capacity=120):
+        self.capacity = max(1, int(capacity))
+        self._buf = array('d', bytes(8 * self.capacity))
+        self._head = 0  # 下一個寫入位置
+        self._len = 0
+        self.total = 0  # 累計寫入筆數，作為樣本的絕對序號
+
+    def __len__(self):
+        return self._len
+
+    def __bool__(self):
+        return self._len > 0
+
+    def append(self, v):
+        self._buf[self._head] = v
+        self._head += 1
+        if self._head == self.capacity:
+            self._head = 0
+        if self._len < self.capacity:
+            self._len += 1
+        self.total += 1
+
+    def _index(self, i):
+        if i < 0:
+            i += self._len
+        if not 0 <= i < self._len:
+            raise IndexError('ring buffer index out of range')
+        return (self._head - self._len + i) % self.capacity
+
+    def __getitem__(self, i):
+        return self._buf[self._index(i)]
+
+    def segments(self):
+        start = self._head - self._len
+        mv = memoryview(self._buf)
+        if start >= 0:
+            return mv[start:self._head], mv[0:0]
+        return mv[start + self.capacity:], mv[:self._head]
+
+    def __iter__(self):
+        for seg in self.segments():
+            yield from seg
+
+    @property
+    def first(self):
+        """視窗內最舊樣本的絕對序號"""
+        return self.total - self._len
+
+    def span(self, start, stop):
+        """絕對序號 [start, stop) 的樣本（需在視窗內），以 memoryview 片段回傳"""
+        if start >= stop:
+            return ()
+        p = self._index(start - self.first)
+        n = stop - start
+        mv = memoryview(self._buf)
+        if p + n <= self.capacity:
+            return (mv[p:p + n],)
+        return (mv[p:], mv[:p + n - self.capacity])
+
+    def values(self):
+        a, b = self.segments()
+        out = array('d', a)
+        out.extend(b)
+        return out
+
+    def to_numpy(self):
+        a, b = self.segments()
+        if not len(b):
+            return np.frombuffer(a, dtype=np.float64)
+        return np.concatenate((np.frombuffer(a, dtype=np.float64), np.frombuffer(b, dtype=np.float64)))
+
+    def clear(self):
+        self._head = 0
+        self._len = 0
+
+    def resize(self, capacity):
+        """改變容量，保留最新的 min(len, capacity) 筆"""
+        capacity = max(1, int(capacity))
+        if capacity == self.capacity:
+            return
+        keep = self.values()[-capacity:] if self._len else array('d')
+        self.capacity = capacity
+        self._buf = array('d', bytes(8 * capacity))
+        self._buf[:len(keep)] = keep
+        self._len = len(keep)
+        self._head = self._len % capacity
+
+
+class SlidingMinMax:
+    """最近 window 個樣本的極值：單調佇列，每樣本攤銷 O(1)，查詢 O(1)；push 可一次給同一樣本的多個值"""
+
+    def __init__(self, window=120):
+        self.window = max(1, int(window))
+        self._n = 0
+        self._min = deque()  # (序號, 值)，值遞增
+        self._max = deque()  # (序號, 值)，值遞減
+
+    def push(self, *values):
+        i = self._n
+        self._n += 1
+        lo, hi = self._min, self._max
+        for v in values:
+            while lo and lo[-1][1] >= v:
+                lo.pop()
+            lo.append((i, v))
+            while hi and hi[-1][1] <= v:
+                hi.pop()
+            hi.append((i, v))
+        self._evict()
+
+    def _evict(self):
+        oldest = self._n - self.window
+        while self._min and self._min[0][0] < oldest:
+            self._min.popleft()
+        while self._max and self._max[0][0] < oldest:
+            self._max.popleft()
+
+    def resize(self, window):
+        self.window = max(1, int(window))
+        self._evict()
+
+    def clear(self):
+        self._min.clear()
+        self._max.clear()
+
+    @property
+    def min(self):
+        return self._min[0][1] if self._min else None
+
+    @property
+    def max(self):
+        return self._max[0][1] if self._max else None
+
+
+def _bucket_points(ring, start, stop):
+    """單一桶的 min/max 兩點（依時間先後），回傳 [(絕對序號, 值)]"""
+    lo_i = hi_i = start
+    lo = hi = None
+    i = start
+    for seg in ring.span(start, stop):
+        for v in seg:
+            if lo is None or v < lo:
+                lo, lo_i = v, i
+            if hi is None or v > hi:
+                hi, hi_i = v, i
+            i += 1
+    if lo is None:
+        return []
+    if lo_i == hi_i:
+        return [(lo_i, lo)]
+    return [(lo_i, lo), (hi_i, hi)] if lo_i < hi_i else [(hi_i, hi), (lo_i, lo)]
+
+
+class MinMaxDecimator:
+    """把 RingBuffer 的視窗抽成約每像素 2 點（每桶保留 min 與 max），保留尖峰
+
+    桶依樣本絕對序號對齊、大小取 2 的冪次，已完成的桶結果快取；新樣本進來只重算
+    頭尾兩個不完整的桶，重繪成本與寬度成正比，與點數無關。
+    """
+
+    def __init__(self, ring):
+        self.ring = ring
+        self._bucket = 0
+        self._cache = deque()  # (桶編號, 點)
+        self._next = 0  # 下一個待快取的桶編號
+
+    def bucket_size(self, width):
+        n = len(self.ring)
+        width = max(1, int(width))
+        if n <= 2 * width:
+            return 1
+        b = 1
+        while b * width < n:
+            b *= 2
+        return b
+
+    def points(self, width):
+        """回傳 (xs, ys)：xs 為相對於視窗最舊樣本的序號"""
+        ring = self.ring
+        xs, ys = array('d'), array('d')
+        n = len(ring)
+        if not n:
+            return xs, ys
+        first, end = ring.first, ring.total
+        b = self.bucket_size(width)
+        if b == 1:
+            for seg in ring.segments():
+                ys.extend(seg)
+            xs.extend(range(n))
+            return xs, ys
+        if b != self._bucket:
+            self._bucket = b
+            self._cache.clear()
+            self._next = 0
+        cache = self._cache
+        head = -(-first // b)  # 第一個完整桶
+        while cache and cache[0][0] < head:
+            cache.popleft()
+        if self._next < head:
+            cache.clear()
+            self._next = head
+        tail = end // b  # 最後一個（不完整）桶
+        while self._next < tail:
+            k = self._next
+            cache.append((k, _bucket_points(ring, k * b, k * b + b)))
+            self._next += 1
+        pts = _bucket_points(ring, first, min(head * b, end))
+        for _, bp in cache:
+            pts.extend(bp)
+        if tail >= head:
+            # 尾端桶不是開頭那個不完整的桶（first 落在桶邊界時開頭桶是空的）
+            pts.extend(_bucket_points(ring, tail * b, end))
+        for i, v in pts:
+            xs.append(i - first)
+            ys.append(v)
+        return xs, ys
+
+    def clear(self):
+        self._cache.clear()
+        self._next = 0
+
+
+def polyline_xy(xs, ys, x0, y0, scale_x, h, vmin, vmax):
+    """(序號, 值) 一次換算成畫面座標，回傳交錯的 array('d') [x0, y0, x1, y1, ...]，記憶體佈局與 QPolygonF 相同"""
+    n = len(xs)
+    out = array('d', bytes(16 * n))
+    if not n:
+        return out
+    k = h / (vmax - vmin) if vmax != vmin else 0.0
+    # y = y0 + h - (v - vmin) * k
+    base = y0 + h + vmin * k
+    if np is not None:
+        v = np.frombuffer(out, dtype=np.float64)
+        v[0::2] = np.frombuffer(xs, dtype=np.float64) * scale_x + x0
+        v[1::2] = base - np.frombuffer(ys, dtype=np.float64) * k
+    else:
+        out[0::2] = array('d', [x0 + x * scale_x for x in xs])
+        out[1::2] = array('d', [base - v * k for v in ys])
+    return out
+
+
+class RenderScheduler:
+    """集中重繪：取樣只標記圖表 dirty、記下標籤文字，由單一計時器以 fps 上限一次套用
+
+    只重繪可見的圖表；文字與樣式沒變的標籤不呼叫 setText/setStyleSheet，避免重新排版。
+    """
+
+    def __init__(self, fps=20):
+        self.fps = 20
+        self.set_fps(fps)
+        self._dirty = {}
+        self._texts = {}
+        self.frames = 0
+        self.skipped_texts = 0
+
+    @property
+    def interval_ms(self):
+        return max(1, int(round(1000.0 / self.fps)))
+
+    def set_fps(self, fps):
+        self.fps = min(120, max(1, int(fps)))
+
+    def mark(self, widget):
+        self._dirty[widget] = True
+
+    def set_text(self, label, text, style=None):
+        self._texts[label] = (text, style)
+
+    def forget(self, *widgets):
+        """移除待處理的項目（元件即將刪除，或文字已被直接設定）"""
+        for w in widgets:
+            self._dirty.pop(w, None)
+            self._texts.pop(w, None)
+
+    def flush(self):
+        dirty, self._dirty = self._dirty, {}
+        texts, self._texts = self._texts, {}
+        for w in dirty:
+            if w.isVisible():
+                w.update()
+        for label, (text, style) in texts.items():
+            if style is not None and label.styleSheet() != style:
+                label.setStyleSheet(style)
+            if label.text() != text:
+                label.setText(text)
+            else:
+                self.skipped_texts += 1
+        self.frames += 1
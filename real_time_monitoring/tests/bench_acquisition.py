@@ -0,0 +1,189 @@
+import os
+import sys
+import json
+import time
+import select
+import argparse
+import subprocess
+import threading
+from pathlib import Path
+from datetime import datetime
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+
+import modbus_bus
+import modbus_async
+import modbus_sim
+
+
+def code_revision():
+    try:
+        res = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=str(ROOT), capture_output=True, text=True)
+        return res.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+class BlockingMaster:
+    """The pre-asyncio design: the port's own thread writes the request and blocks reading the reply."""
+
+    def __init__(self, port, baud, timeout):
+        self.fd = modbus_async.open_fd(port, baud)
+        os.set_blocking(self.fd, True)
+        self.timeout = float(timeout)
+
+    def set_timeout(self, timeout):
+        self.timeout = float(timeout)
+
+    def execute(self, addr, func, start, count):
+        # drop whatever a timed-out slave sent late
+        while select.select([self.fd], [], [], 0)[0] and os.read(self.fd, 512):
+            pass
+        os.write(self.fd, modbus_async.build_read_request(addr, func, start, count))
+        n = modbus_async.response_length(func, count)
+        buf = bytearray()
+        deadline = time.monotonic() + self.timeout
+        while len(buf) < n and not (len(buf) >= 5 and buf[1] == (func | 0x80)):
+            left = deadline - time.monotonic()
+            if left <= 0 or not select.select([self.fd], [], [], left)[0]:
+                break
+            buf += os.read(self.fd, n - len(buf))
+        return modbus_async.parse_read_response(bytes(buf), addr, func, count)
+
+    def close(self):
+        os.close(self.fd)
+
+
+def open_bus(backend, port, baud, timeout):
+    if backend == 'thread':
+        # one OS thread per port that blocks on its own fd; nothing runs on the shared asyncio loop
+        return modbus_bus.BusScheduler(port, baud, timeout,
+                                       master_factory=lambda: BlockingMaster(port, baud, timeout)).start()
+    return modbus_bus.AsyncBus(port, baud, timeout).start()
+
+
+def run_case(args, devices):
+    sim = modbus_sim.build(devices, args.ports, args.profile, args.baud, args.latency / 1000.0, args.jitter / 1000.0,
+                           args.error_rate, args.timeout_rate, args.garble_rate, not args.no_wire_delay, args.seed)
+    lock = threading.Lock()
+    samples = {}
+    buses = []
+    try:
+        for vb in sim:
+            bus = open_bus(args.backend, vb.port, args.baud, args.timeout / 1000.0)
+            buses.append(bus)
+            for addr in vb.slaves:
+                key = (vb.port, addr)
+                samples[key] = []
+                def cb(values, key=key):
+                    if values is not None:
+                        with lock:
+                            samples[key].append(time.monotonic())
+                bus.subscribe(addr, args.interval / 1000.0, cb, count=args.registers)
+        t0 = time.monotonic()
+        threads_during = threading.active_count()
+        time.sleep(args.duration)
+        t_end = time.monotonic()
+        stats = [b.stats() for b in buses]
+    finally:
+        for b in buses:
+            b.close()
+        modbus_sim.stop_all(sim)
+    with lock:
+        per_device = {k: [t for t in v if t >= t0] for k, v in samples.items()}
+    total = sum(len(v) for v in per_device.values())
+    # staleness: longest wait between successful readings of one device, including the tail at the end
+    gaps = []
+    ages = []
+    for ts in per_device.values():
+        points = [t0] + ts + [t_end]
+        gaps.append(max(b - a for a, b in zip(points, points[1:])))
+        ages.append(t_end - ts[-1] if ts else args.duration)
+    requests = sum(s['requests'] for s in stats)
+    errors = sum(s['errors'] for s in stats)
+    return {
+        'devices': devices,
+        'ports': len(sim),
+        'samples': total,
+        'samples_per_sec': total / args.duration,
+        'per_device_hz': total / args.duration / max(1, devices),
+        'target_hz': 1000.0 / args.interval if args.interval else None,
+        'staleness_p50_ms': percentile(gaps, 0.5) * 1000.0,
+        'staleness_p95_ms': percentile(gaps, 0.95) * 1000.0,
+        'staleness_max_ms': max(gaps) * 1000.0,
+        'age_at_end_max_ms': max(ages) * 1000.0,
+        'requests_per_sec': requests / args.duration,
+        'errors': errors,
+        'threads': threads_during,
+    }
+
+
+def run(args):
+    results = {}
+    print(f"{'devices':>8} {'ports':>5} {'samples/s':>10} {'dev Hz':>7} {'stale p50':>10} {'p95':>8} {'max':>8} "
+          f"{'req/s':>7} {'errors':>6} {'threads':>7}")
+    for n in args.devices:
+        r = run_case(args, n)
+        results[str(n)] = r
+        print(f"{n:>8} {r['ports']:>5} {r['samples_per_sec']:>10.1f} {r['per_device_hz']:>7.2f} "
+              f"{r['staleness_p50_ms']:>8.0f}ms {r['staleness_p95_ms']:>6.0f}ms {r['staleness_max_ms']:>6.0f}ms "
+              f"{r['requests_per_sec']:>7.1f} {r['errors']:>6} {r['threads']:>7}")
+    report = {
+        'revision': code_revision(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'params': vars(args).copy(),
+        'cases': results,
+    }
+    report['params'].pop('out', None)
+    report['params'].pop('compare', None)
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f'results written to {args.out}')
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            prev = json.load(f)
+        print(f"vs {prev.get('revision')} ({prev.get('timestamp')}):")
+        for n, cur in results.items():
+            old = prev.get('cases', {}).get(n)
+            if old and old.get('samples_per_sec'):
+                print(f"  {n:>6} devices {cur['samples_per_sec'] / old['samples_per_sec']:>6.2f}x samples/s  "
+                      f"stale p95 {old['staleness_p95_ms']:.0f} -> {cur['staleness_p95_ms']:.0f} ms")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Modbus acquisition against virtual RTU slaves on ptys')
+    parser.add_argument('--devices', type=lambda s: [int(x) for x in s.split(',')], default=[1, 10, 50, 200],
+                        help='comma separated device counts, e.g. 1,10,50,200')
+    parser.add_argument('--ports', type=int, default=4, help='virtual buses the devices are spread over')
+    parser.add_argument('--backend', choices=['async', 'thread'], default='async')
+    parser.add_argument('--interval', type=float, default=500.0, help='poll interval per device (ms)')
+    parser.add_argument('--registers', type=int, default=1, help='registers read per poll')
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per case')
+    parser.add_argument('--timeout', type=float, default=300.0, help='per-request timeout (ms)')
+    parser.add_argument('--profile', choices=sorted(modbus_sim.PROFILES), default='temp_current')
+    parser.add_argument('--baud', type=int, default=9600)
+    parser.add_argument('--latency', type=float, default=5.0, help='slave response latency (ms)')
+    parser.add_argument('--jitter', type=float, default=2.0, help='latency jitter, +/- ms')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--timeout-rate', type=float, default=0.0)
+    parser.add_argument('--garble-rate', type=float, default=0.0)
+    parser.add_argument('--no-wire-delay', action='store_true', help='do not emulate line time at --baud')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', type=str, default=None, help='write JSON results to this path')
+    parser.add_argument('--compare', type=str, default=None, help='previous JSON results to compare against')
+    run(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main()
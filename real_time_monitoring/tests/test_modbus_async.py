@@ -0,0 +1,108 @@
+import os
+import time
+import struct
+import threading
+import unittest
+
+import modbus_async
+import modbus_bus
+from modbus_async import (ModbusExceptionResponse, ModbusFrameError, ModbusTimeout, build_read_request, crc16,
+                          parse_read_response, with_crc)
+
+
+def responder(fd, slaves, stop, garble=()):
+    """Answers function-3 reads on the device end of a pty; register value = addr * 100 + register."""
+    buf = b''
+    while not stop.is_set():
+        try:
+            data = os.read(fd, 256)
+        except BlockingIOError:
+            time.sleep(0.001)
+            continue
+        except OSError:
+            return
+        buf += data
+        while len(buf) >= 8:
+            req, buf = buf[:8], buf[8:]
+            addr, func, start, count = struct.unpack('>BBHH', req[:6])
+            if addr not in slaves:
+                continue
+            if start >= 100:
+                resp = with_crc(bytes([addr, func | 0x80, 2]))
+            else:
+                regs = [addr * 100 + start + i for i in range(count)]
+                resp = with_crc(bytes([addr, func, 2 * count]) + struct.pack(f'>{count}H', *regs))
+            if addr in garble:
+                resp = resp[:-1]
+            os.write(fd, resp)
+
+
+@unittest.skipUnless(hasattr(os, 'openpty') and modbus_async.termios is not None, 'needs a POSIX pty')
+class TestAsyncRtu(unittest.TestCase):
+    def setUp(self):
+        # keep the tty end open, otherwise reads on the device end fail with EIO between clients
+        self.dev_fd, self.tty_fd = os.openpty()
+        self.port = os.ttyname(self.tty_fd)
+        os.set_blocking(self.dev_fd, False)
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=responder, args=(self.dev_fd, {1, 2, 3, 4}, self.stop, {4}),
+                                       daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.stop.set()
+        self.thread.join(1.0)
+        os.close(self.dev_fd)
+        os.close(self.tty_fd)
+
+    def test_framer(self):
+        req = build_read_request(1, 3, 0, 2)
+        self.assertEqual(req[:6], b'\x01\x03\x00\x00\x00\x02')
+        self.assertEqual(crc16(req[:6]), req[6] | (req[7] << 8))
+        self.assertEqual(parse_read_response(with_crc(b'\x01\x03\x04\x00\x64\x00\x65'), 1, 3, 2), (100, 101))
+        with self.assertRaises(ModbusTimeout):
+            parse_read_response(b'', 1, 3, 1)
+        with self.assertRaises(ModbusFrameError):
+            parse_read_response(b'\x01\x03\x02\x00', 1, 3, 1)
+        with self.assertRaises(ModbusExceptionResponse):
+            parse_read_response(with_crc(b'\x01\x83\x02'), 1, 3, 1)
+
+    def test_sync_master_over_pty(self):
+        m = modbus_async.SyncMaster(self.port, 9600, 0.2)
+        try:
+            self.assertEqual(m.execute(2, 3, 5, 3), (205, 206, 207))
+            with self.assertRaises(ModbusExceptionResponse):
+                m.execute(2, 3, 100, 1)
+            m.set_timeout(0.05)
+            t0 = time.monotonic()
+            with self.assertRaises(ModbusTimeout):
+                m.execute(9, 3, 0, 1)
+            self.assertLess(time.monotonic() - t0, 0.2)
+            with self.assertRaises(ModbusFrameError):
+                m.execute(4, 3, 0, 1)
+        finally:
+            m.close()
+
+    def test_async_bus_polls_all_subscriptions_on_one_loop(self):
+        bus = modbus_bus.AsyncBus(self.port, 9600, 0.1).start()
+        got = {1: [], 2: [], 3: [], 9: []}
+        try:
+            for addr in got:
+                bus.subscribe(addr, 0.02, got[addr].append)
+            bus.subscribe_fields(3, {'current': {'register': 1, 'scale': 0.01}}, 0.02, lambda v: None)
+            time.sleep(0.5)
+            self.assertEqual(bus.call(1, 3, 7, 1), (107,))
+        finally:
+            bus.close()
+        for addr in (1, 2, 3):
+            self.assertGreater(len(got[addr]), 2)
+            self.assertEqual(got[addr][-1], (addr * 100,))
+        self.assertTrue(got[9] and all(v is None for v in got[9]))
+        self.assertGreater(bus.stats()['coalesced'], 0)
+        names = [t.name for t in threading.enumerate()]
+        self.assertEqual(names.count('modbus-loop'), 1)
+        self.assertFalse(any(n.startswith('modbus-bus-') for n in names))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import time
+import threading
+import unittest
+
+import modbus_bus
+from modbus_bus import BusScheduler, RegisterMap, plan_reads
+
+
+class FakeMaster:
+    def __init__(self, latency=0.002, dead=()):
+        self.latency = latency
+        self.dead = set(dead)
+        self.frames = []
+        self.busy = False
+        self.overlaps = 0
+        self.closed = False
+
+    def execute(self, addr, func, start, count):
+        if self.busy:
+            self.overlaps += 1
+        self.busy = True
+        t0 = time.monotonic()
+        try:
+            time.sleep(self.latency)
+            if addr in self.dead:
+                raise IOError('timeout')
+            return tuple(addr * 100 + start + i for i in range(count))
+        finally:
+            self.frames.append((addr, t0, time.monotonic()))
+            self.busy = False
+
+    def close(self):
+        self.closed = True
+
+
+class TestBusScheduler(unittest.TestCase):
+    def test_round_robin_without_overlap_and_with_gap(self):
+        fake = FakeMaster()
+        bus = BusScheduler('COMX', gap=0.003, master_factory=lambda: fake).start()
+        got = {a: [] for a in (1, 2, 3, 4, 9)}
+        for a in got:
+            bus.subscribe(a, 0.0, got[a].append)
+        time.sleep(0.3)
+        bus.close()
+        self.assertTrue(fake.closed)
+        self.assertEqual(fake.overlaps, 0)
+        counts = [len(v) for v in got.values()]
+        self.assertGreater(min(counts), 3)
+        self.assertLessEqual(max(counts) - min(counts), 1)
+        self.assertEqual(got[2][0], (200,))
+        gaps = [b[1] - a[2] for a, b in zip(fake.frames, fake.frames[1:])]
+        self.assertGreaterEqual(min(gaps), 0.0029)
+
+    def test_errors_publish_none_and_call_jumps_queue(self):
+        fake = FakeMaster(dead={7})
+        bus = BusScheduler('COMX', gap=0.0, master_factory=lambda: fake).start()
+        seen = []
+        done = threading.Event()
+        def cb(values):
+            seen.append(values)
+            done.set()
+        sub = bus.subscribe(7, 10.0, cb)
+        self.assertTrue(done.wait(1.0))
+        self.assertEqual(seen, [None])
+        self.assertEqual(sub.errors, 1)
+        self.assertEqual(bus.call(5, 3, 2, 2), (502, 503))
+        with self.assertRaises(IOError):
+            bus.call(7)
+        st = bus.stats()
+        self.assertEqual(st['errors'], 2)
+        self.assertEqual(st['subscriptions'], 1)
+        bus.close()
+
+    def test_same_slave_subscriptions_coalesce_into_block_read(self):
+        fake = FakeMaster()
+        bus = BusScheduler('COMX', gap=0.0, master_factory=lambda: fake)
+        rmap = RegisterMap(profiles={'tc': {'temperature': {'register': 0, 'scale': 0.1, 'signed': True},
+                                             'current': {'register': 1, 'scale': 0.01}}},
+                           devices={3: 'tc'})
+        got = {}
+        done = threading.Event()
+        def on(field):
+            def cb(values):
+                got[field] = values
+                if len(got) == 2:
+                    done.set()
+            return cb
+        bus.subscribe_fields(3, rmap.fields(3, 'temperature', only=('temperature',)), 10.0, on('t'))
+        bus.subscribe_fields(3, rmap.fields(3, 'current', only=('current',)), 10.0, on('c'))
+        bus.start()
+        self.assertTrue(done.wait(1.0))
+        bus.close()
+        self.assertEqual(len(fake.frames), 1)
+        self.assertEqual(bus.stats()['coalesced'], 1)
+        self.assertAlmostEqual(got['t']['temperature'], 30.0)
+        self.assertAlmostEqual(got['c']['current'], 3.01)
+
+    def test_late_subscriptions_realign_to_a_shared_grid(self):
+        a = modbus_bus.Subscription(3, 3, 0, 1, 0.5, lambda v: None, 0)
+        b = modbus_bus.Subscription(3, 3, 1, 1, 0.5, lambda v: None, 0)
+        # added at different moments, served late, they still land on the same next tick
+        a.deliver((1,), 1000.13)
+        b.deliver((2,), 1000.41)
+        self.assertEqual(a.next_due, b.next_due)
+        self.assertAlmostEqual(a.next_due, 1000.5)
+        a.deliver((1,), 1000.52)
+        self.assertAlmostEqual(a.next_due, 1001.0)
+
+    def test_plan_reads_and_register_map(self):
+        self.assertEqual(plan_reads([(0, 1), (1, 1), (4, 2)]), [(0, 6)])
+        self.assertEqual(plan_reads([(0, 1), (40, 1)]), [(0, 1), (40, 1)])
+        self.assertEqual(plan_reads([(0, 1), (5, 1)], max_count=4), [(0, 1), (5, 1)])
+        rmap = RegisterMap(profiles={'tc': {'temperature': {'register': 2, 'scale': 0.1, 'signed': True}}},
+                           devices={'7': 'tc'})
+        self.assertEqual(rmap.fields(1, 'temperature'), {'temperature': {'register': 0, 'scale': 0.1}})
+        fields = rmap.fields(7, 'temperature')
+        self.assertEqual(RegisterMap.span(fields), (2, 1))
+        self.assertAlmostEqual(RegisterMap.decode((0xFFF6,), 2, fields)['temperature'], -1.0)
+        # a profile without the field falls back to the default profile
+        self.assertEqual(rmap.fields(7, 'current', only=('current',)), {'current': {'register': 0, 'scale': 1.0}})
+
+    def test_acquire_shares_one_bus_per_port(self):
+        opened = []
+        def factory():
+            opened.append(FakeMaster())
+            return opened[-1]
+        a = modbus_bus.acquire_bus('COMY', master_factory=factory)
+        b = modbus_bus.acquire_bus('COMY', master_factory=factory)
+        self.assertIs(a, b)
+        self.assertEqual(len(opened), 1)
+        modbus_bus.release_bus(a)
+        self.assertIs(modbus_bus.get_bus('COMY'), b)
+        modbus_bus.release_bus(b)
+        self.assertIsNone(modbus_bus.get_bus('COMY'))
+        self.assertTrue(opened[0].closed)
+
+
+if __name__ == '__main__':
+    unittest.main()
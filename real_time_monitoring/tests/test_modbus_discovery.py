@@ -0,0 +1,144 @@
+import time
+import tempfile
+import unittest
+from pathlib import Path
+
+import modbus_discovery
+from modbus_discovery import DiscoveryCache, LatencyEstimator, PARTIAL, PRESENT, SILENT
+
+
+class ModbusInvalidResponseError(Exception):
+    pass
+
+
+class ModbusError(Exception):
+    pass
+
+
+class FakeMaster:
+    """Answers on `present`, raises an exception response on `exc`, garbles the first reply of `partial`."""
+
+    def __init__(self, present=(), exc=(), partial=(), latency=0.005):
+        self.present = set(present)
+        self.exc = set(exc)
+        self.partial = set(partial)
+        self.latency = latency
+        self.timeout = None
+        self.probes = []
+        self.closed = False
+
+    def set_timeout(self, t):
+        self.timeout = t
+
+    def execute(self, addr, func, start, count):
+        self.probes.append((addr, self.timeout))
+        if addr in self.partial:
+            self.partial.discard(addr)
+            raise ModbusInvalidResponseError('Invalid CRC in response')
+        if addr in self.present:
+            time.sleep(self.latency)
+            return (1,)
+        if addr in self.exc:
+            raise ModbusError('exception code = 2')
+        raise ModbusInvalidResponseError('Response length is invalid 0')
+
+    def close(self):
+        self.closed = True
+
+
+class TestDiscovery(unittest.TestCase):
+    def test_parse_ranges(self):
+        self.assertEqual(modbus_discovery.parse_addresses('1-3, 5,3,300'), [1, 2, 3, 5])
+        self.assertEqual(modbus_discovery.parse_bauds('9600, 19200'), [9600, 19200])
+
+    def test_estimator_adapts_and_clamps(self):
+        est = LatencyEstimator(9600, min_timeout=0.02, max_timeout=0.3)
+        self.assertLess(est.timeout, 0.06)
+        for _ in range(10):
+            est.observe(0.025)
+        self.assertAlmostEqual(est.timeout, max(est.floor, est.srtt + 4 * est.rttvar))
+        est.observe(5.0)
+        self.assertEqual(est.timeout, 0.3)
+
+    def test_silent_addresses_cost_one_short_probe_and_partial_retries(self):
+        fake = FakeMaster(present={3, 9}, exc={12}, partial={9})
+        seen = []
+        results = modbus_discovery.scan_port('COMX', list(range(1, 17)), [9600, 19200],
+                                             on_found=lambda p, b, a: seen.append((p, b, a)),
+                                             max_timeout=0.3, open_master=lambda p, b, t: fake)
+        self.assertEqual(results, [(9600, 3), (9600, 9), (9600, 12), (19200, 3), (19200, 9), (19200, 12)])
+        self.assertEqual(seen[0], ('COMX', 9600, 3))
+        self.assertTrue(fake.closed)
+        first_pass = fake.probes[:17]
+        self.assertEqual([a for a, _ in first_pass], list(range(1, 10)) + [9] + list(range(10, 17)))
+        # silent addresses never wait the full timeout; only the garbled reply is retried at max
+        self.assertTrue(all(t < 0.3 for a, t in first_pass if a != 9))
+        self.assertEqual([t for a, t in first_pass if a == 9], [first_pass[8][1], 0.3])
+
+    def test_first_only_stops_at_first_device_per_port(self):
+        masters = {p: FakeMaster(present=({4, 5} if p == 'A' else set())) for p in ('A', 'B')}
+        results = modbus_discovery.scan_ports(['A', 'B'], list(range(1, 33)), [9600], first_only=True,
+                                              open_master=lambda p, b, t: masters[p])
+        self.assertEqual(results, {'A': [(9600, 4)], 'B': []})
+        self.assertEqual(len(masters['A'].probes), 4)
+        self.assertEqual(len(masters['B'].probes), 32)
+
+    def test_first_baud_scans_every_address_at_the_answering_baud(self):
+        fake = FakeMaster(present={4, 5, 20})
+        results = modbus_discovery.scan_port('A', list(range(1, 33)), [9600, 19200], first_baud=True,
+                                             open_master=lambda p, b, t: fake)
+        self.assertEqual(results, [(9600, 4), (9600, 5), (9600, 20)])
+        self.assertEqual(len(fake.probes), 32)
+
+    def test_classify_error(self):
+        self.assertEqual(modbus_discovery.classify_error(ModbusError('x')), PRESENT)
+        self.assertEqual(modbus_discovery.classify_error(ModbusInvalidResponseError('Response length is invalid 0')), SILENT)
+        self.assertEqual(modbus_discovery.classify_error(ModbusInvalidResponseError('Invalid CRC in response')), PARTIAL)
+        self.assertEqual(modbus_discovery.classify_error(TimeoutError()), SILENT)
+
+
+class TestDiscoveryCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = str(Path(self.tmp.name) / 'discovery_cache.json')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_persists_and_expires(self):
+        cache = DiscoveryCache(self.path, ttl=60)
+        cache.replace_scan('COM3', 9600, range(1, 9), [2, 5])
+        cache.record('COM4', 9600, 1, now=time.time() - 3600)
+        cache.save()
+        again = DiscoveryCache(self.path, ttl=60)
+        self.assertEqual(again.addresses('COM3', 9600), [2, 5])
+        self.assertEqual(again.addresses('COM3', 19200), [])
+        self.assertEqual(again.ports(), ['COM3'])
+        self.assertEqual(len(again.entries(include_stale=True)), 3)
+        again.replace_scan('COM3', 9600, range(1, 4), [])
+        self.assertEqual(again.addresses('COM3'), [5])
+
+    def test_revalidate_pings_each_entry_once(self):
+        cache = DiscoveryCache(self.path, ttl=60)
+        for addr in (2, 5, 7):
+            cache.record('COM3', 9600, addr, now=time.time() - 3600)
+        cache.record('COM9', 9600, 1)
+        masters = {'COM3': FakeMaster(present={2, 7}, partial={7})}
+        def open_master(port, baud, timeout):
+            if port not in masters:
+                raise IOError('no such port')
+            return masters[port]
+        results = []
+        alive = modbus_discovery.revalidate(cache, open_master=open_master,
+                                            on_result=lambda p, b, a, ok: results.append((p, a, ok)))
+        self.assertEqual(alive, ['COM3'])
+        self.assertEqual([a for a, _ in masters['COM3'].probes], [2, 5, 7, 7])
+        self.assertEqual(results, [('COM3', 2, True), ('COM3', 5, False), ('COM3', 7, True), ('COM9', 1, False)])
+        reloaded = DiscoveryCache(self.path, ttl=60)
+        self.assertEqual(reloaded.addresses('COM3'), [2, 7])
+        # COM9 could not be opened (busy or unplugged): not probed, so not forgotten
+        self.assertEqual(reloaded.addresses('COM9'), [1])
+
+
+if __name__ == '__main__':
+    unittest.main()
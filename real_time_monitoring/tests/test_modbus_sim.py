@@ -0,0 +1,81 @@
+import os
+import time
+import unittest
+
+import modbus_async
+import modbus_bus
+import modbus_discovery
+import modbus_sim
+from modbus_async import ModbusExceptionResponse, ModbusTimeout
+
+
+@unittest.skipUnless(hasattr(os, 'openpty') and modbus_async.termios is not None, 'needs a POSIX pty')
+class TestModbusSim(unittest.TestCase):
+    def setUp(self):
+        self.buses = []
+
+    def tearDown(self):
+        modbus_sim.stop_all(self.buses)
+
+    def build(self, *args, **kwargs):
+        kwargs.setdefault('wire_delay', False)
+        kwargs.setdefault('latency', 0.001)
+        buses = modbus_sim.build(*args, **kwargs)
+        self.buses.extend(buses)
+        return buses
+
+    def test_spreads_devices_over_ports(self):
+        buses = self.build(5, 2, 'static')
+        self.assertEqual([sorted(b.slaves) for b in buses], [[1, 2, 3], [1, 2]])
+        self.assertEqual(len(self.build(1, 4, 'static')), 1)
+
+    def test_reads_and_faults(self):
+        bus, = self.build(3, 1, 'static')
+        m = modbus_async.SyncMaster(bus.port, 9600, 0.1)
+        try:
+            self.assertEqual(m.execute(2, 3, 0, 3), (200, 201, 202))
+            with self.assertRaises(ModbusExceptionResponse):
+                m.execute(2, 3, 15, 2)
+            with self.assertRaises(ModbusTimeout):
+                m.execute(7, 3, 0, 1)
+        finally:
+            m.close()
+        self.assertEqual(bus.requests, 3)
+        bad, = self.build(1, 1, 'static', error_rate=1.0)
+        m = modbus_async.SyncMaster(bad.port, 9600, 0.1)
+        try:
+            with self.assertRaises(ModbusExceptionResponse):
+                m.execute(1, 3, 0, 1)
+        finally:
+            m.close()
+
+    def test_profile_values(self):
+        bus, = self.build(1, 1, 'temp_current')
+        m = modbus_async.SyncMaster(bus.port, 9600, 0.1)
+        try:
+            temp, current = m.execute(1, 3, 0, 2)
+        finally:
+            m.close()
+        self.assertTrue(200 <= temp <= 300)
+        self.assertTrue(800 <= current <= 1200)
+
+    def test_discovery_and_async_bus_against_sim(self):
+        bus, = self.build(3, 1, 'static')
+        found = modbus_discovery.scan_port(bus.port, range(1, 9), [9600], min_timeout=0.02, max_timeout=0.1,
+                                           open_master=lambda p, b, t: modbus_async.SyncMaster(p, b, t))
+        self.assertEqual(found, [(9600, 1), (9600, 2), (9600, 3)])
+        ab = modbus_bus.AsyncBus(bus.port, 9600, 0.1).start()
+        got = {a: [] for a in (1, 2, 3)}
+        try:
+            for addr in got:
+                ab.subscribe(addr, 0.02, got[addr].append)
+            time.sleep(0.3)
+        finally:
+            ab.close()
+        for addr, values in got.items():
+            self.assertGreater(len(values), 2)
+            self.assertEqual(values[-1], (addr * 100,))
+
+
+if __name__ == '__main__':
+    unittest.main()
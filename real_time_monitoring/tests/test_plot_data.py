@@ -0,0 +1,201 @@
+import random
+import unittest
+from array import array
+
+import plot_data
+from plot_data import MinMaxDecimator, RenderScheduler, RingBuffer, SlidingMinMax, polyline_xy
+
+
+class TestRingBuffer(unittest.TestCase):
+    def test_append_wraps_and_keeps_order(self):
+        rb = RingBuffer(4)
+        self.assertFalse(rb)
+        for v in range(1, 7):
+            rb.append(v)
+        self.assertEqual(len(rb), 4)
+        self.assertEqual(rb.total, 6)
+        self.assertEqual(list(rb), [3.0, 4.0, 5.0, 6.0])
+        self.assertEqual((rb[0], rb[-1]), (3.0, 6.0))
+        a, b = rb.segments()
+        self.assertEqual((list(a), list(b)), ([3.0, 4.0], [5.0, 6.0]))
+        with self.assertRaises(IndexError):
+            rb[4]
+
+    def test_resize_keeps_newest(self):
+        rb = RingBuffer(5)
+        for v in range(8):
+            rb.append(v)
+        rb.resize(3)
+        self.assertEqual(list(rb), [5.0, 6.0, 7.0])
+        rb.resize(10)
+        rb.append(8)
+        self.assertEqual(list(rb), [5.0, 6.0, 7.0, 8.0])
+        rb.clear()
+        self.assertEqual(list(rb.values()), [])
+
+    @unittest.skipIf(plot_data.np is None, 'numpy not installed')
+    def test_to_numpy(self):
+        rb = RingBuffer(3)
+        for v in range(5):
+            rb.append(v)
+        self.assertEqual(rb.to_numpy().tolist(), [2.0, 3.0, 4.0])
+
+
+class TestSlidingMinMax(unittest.TestCase):
+    def test_matches_brute_force_over_pairs(self):
+        rng = random.Random(3)
+        window = 7
+        tracker = SlidingMinMax(window)
+        self.assertIsNone(tracker.min)
+        history = []
+        for _ in range(300):
+            pair = (rng.uniform(-5, 5), rng.uniform(-5, 5))
+            tracker.push(*pair)
+            history.append(pair)
+            recent = [v for p in history[-window:] for v in p]
+            self.assertEqual((tracker.min, tracker.max), (min(recent), max(recent)))
+
+    def test_resize_and_clear(self):
+        tracker = SlidingMinMax(5)
+        for v in (9, 1, 2, 3, 4):
+            tracker.push(v)
+        self.assertEqual((tracker.min, tracker.max), (1, 9))
+        tracker.resize(3)
+        self.assertEqual((tracker.min, tracker.max), (2, 4))
+        tracker.clear()
+        self.assertIsNone(tracker.max)
+        tracker.push(6)
+        self.assertEqual((tracker.min, tracker.max), (6, 6))
+
+
+class TestMinMaxDecimator(unittest.TestCase):
+    def check(self, rb, xs, ys):
+        vals = list(rb)
+        self.assertEqual(list(xs), sorted(xs))
+        self.assertEqual([vals[int(x)] for x in xs], list(ys))
+        self.assertEqual((min(ys), max(ys)), (min(vals), max(vals)))
+
+    def test_small_window_is_not_decimated(self):
+        rb = RingBuffer(50)
+        for v in range(30):
+            rb.append(v)
+        xs, ys = MinMaxDecimator(rb).points(100)
+        self.assertEqual(list(ys), list(rb))
+        self.assertEqual(list(xs), list(range(30)))
+
+    def test_bounded_by_width_and_keeps_extremes_while_sliding(self):
+        rng = random.Random(1)
+        rb = RingBuffer(5000)
+        lod = MinMaxDecimator(rb)
+        for step in range(12000):
+            rb.append(rng.gauss(0, 1))
+            if step % 97 == 0:
+                xs, ys = lod.points(200)
+                self.assertLessEqual(len(xs), 2 * 200 + 4)
+                self.check(rb, xs, ys)
+        # a spike arriving after the cache is built still shows up
+        rb.append(50.0)
+        xs, ys = lod.points(200)
+        self.assertEqual((xs[-1], ys[-1]), (len(rb) - 1, 50.0))
+
+    def test_window_starting_on_a_bucket_boundary_keeps_its_tail(self):
+        for cap, width in ((3, 1), (1000, 1), (64, 4), (100, 7)):
+            rb = RingBuffer(cap)
+            lod = MinMaxDecimator(rb)
+            for v in range(3 * cap):
+                rb.append(v % 11)
+                self.check(rb, *lod.points(width))
+
+    def test_follows_resize_and_clear(self):
+        rb = RingBuffer(4000)
+        lod = MinMaxDecimator(rb)
+        for v in range(4000):
+            rb.append(v % 17)
+        lod.points(100)
+        rb.resize(1000)
+        self.check(rb, *lod.points(100))
+        rb.clear()
+        self.assertEqual(len(lod.points(100)[0]), 0)
+        rb.append(3.0)
+        self.assertEqual(list(lod.points(100)[1]), [3.0])
+
+
+class FakeWidget:
+    def __init__(self, visible=True):
+        self.visible = visible
+        self.updates = 0
+
+    def isVisible(self):
+        return self.visible
+
+    def update(self):
+        self.updates += 1
+
+
+class FakeLabel:
+    def __init__(self):
+        self._text = ''
+        self._style = ''
+        self.set_calls = 0
+
+    def text(self):
+        return self._text
+
+    def setText(self, text):
+        self._text = text
+        self.set_calls += 1
+
+    def styleSheet(self):
+        return self._style
+
+    def setStyleSheet(self, style):
+        self._style = style
+
+
+class TestRenderScheduler(unittest.TestCase):
+    def test_coalesces_marks_into_one_repaint_per_frame(self):
+        render = RenderScheduler(25)
+        self.assertEqual(render.interval_ms, 40)
+        shown, hidden = FakeWidget(), FakeWidget(visible=False)
+        for _ in range(10):
+            render.mark(shown)
+            render.mark(hidden)
+        render.flush()
+        render.flush()
+        self.assertEqual((shown.updates, hidden.updates), (1, 0))
+        self.assertEqual(render.frames, 2)
+
+    def test_skips_unchanged_labels_and_forgets(self):
+        render = RenderScheduler()
+        label = FakeLabel()
+        render.set_text(label, 'a')
+        render.set_text(label, 'b', 'color: gray;')
+        render.flush()
+        self.assertEqual((label.text(), label.styleSheet(), label.set_calls), ('b', 'color: gray;', 1))
+        render.set_text(label, 'b')
+        render.flush()
+        self.assertEqual((label.set_calls, render.skipped_texts), (1, 1))
+        render.set_text(label, 'c')
+        render.forget(label)
+        render.flush()
+        self.assertEqual(label.text(), 'b')
+        render.set_fps(500)
+        self.assertEqual(render.fps, 120)
+
+
+class TestPolylineXY(unittest.TestCase):
+    def test_matches_per_point_transform(self):
+        xs = array('d', [0, 1, 2, 3])
+        ys = array('d', [0.0, 50.0, 100.0, 25.0])
+        xy = polyline_xy(xs, ys, 8, 8, 10.0, 200, 0.0, 100.0)
+        expect = []
+        for x, v in zip(xs, ys):
+            expect += [8 + x * 10.0, 8 + 200 - (v - 0.0) * 200 / 100.0]
+        self.assertEqual(list(xy), expect)
+        self.assertEqual(len(polyline_xy(array('d'), array('d'), 0, 0, 1, 1, 0, 1)), 0)
+        flat = polyline_xy(xs, ys, 0, 0, 1.0, 100, 5.0, 5.0)
+        self.assertEqual(list(flat[1::2]), [100.0] * 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
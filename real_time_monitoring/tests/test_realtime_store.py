@@ -0,0 +1,188 @@
+import csv
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+
+import realtime_store
+from realtime_store import RecordWriter, SampleStore
+
+class TestRecordWriter(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = str(Path(self.tmp.name) / 'ems.db')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_group_commit_and_flush_on_close(self):
+        w = RecordWriter(self.db_path, flush_ms=50, max_rows=10)
+        w.start()
+        for i in range(25):
+            w.put(1735689600.0 + i, '生產線1', '早班', 'WO-1', 20.0 + i, 1.5)
+        w.close()
+        st = w.stats()
+        self.assertEqual(st['rows'], 25)
+        self.assertEqual(st['queue_depth'], 0)
+        self.assertLessEqual(st['commits'], 5)
+        self.assertIsNotNone(st['last_commit_ms'])
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM records').fetchone()[0], 25)
+        self.assertEqual(conn.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        self.assertEqual(conn.execute('SELECT device, temperature FROM records WHERE id = 3').fetchone(), ('生產線1', 22.0))
+        conn.close()
+
+    def test_migrate_legacy_json_records(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('CREATE TABLE records (id INTEGER PRIMARY KEY AUTOINCREMENT, ts TEXT NOT NULL, data TEXT NOT NULL)')
+        conn.executemany('INSERT INTO records (id, ts, data) VALUES (?, ?, ?)', [
+            (5, '2025-01-01T08:00:00', '{"line": "生產線1", "shift": "早班", "work_order": "WO-1", "temperature": 25.5, "current": 1.2}'),
+            (9, '2025-01-01T08:00:01', 'not json'),
+        ])
+        conn.commit()
+        realtime_store.ensure_db(conn)
+        self.assertTrue(realtime_store.is_typed(conn))
+        rows = conn.execute('SELECT id, timestamp, device, shift, work_order, temperature, current FROM records ORDER BY id').fetchall()
+        self.assertEqual(rows[0][0], 5)
+        self.assertEqual(realtime_store.epoch_to_iso(rows[0][1]), '2025-01-01T08:00:00')
+        self.assertEqual(rows[0][2:], ('生產線1', '早班', 'WO-1', 25.5, 1.2))
+        self.assertEqual(rows[1][0], 9)
+        self.assertIsNone(rows[1][2])
+        # AUTOINCREMENT keeps counting after the migrated ids
+        conn.execute('INSERT INTO records (timestamp) VALUES (0)')
+        self.assertEqual(conn.execute('SELECT MAX(id) FROM records').fetchone()[0], 10)
+        indexes = [r[1] for r in conn.execute('PRAGMA index_list(records)')]
+        self.assertIn('idx_records_wo_device', indexes)
+        conn.close()
+
+    def test_failed_migration_raises_and_writer_retries_it(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('CREATE TABLE records (id INTEGER PRIMARY KEY AUTOINCREMENT, ts TEXT NOT NULL, data TEXT NOT NULL)')
+        conn.commit()
+        # another process (the sync reader) holds the database
+        conn.execute('BEGIN EXCLUSIVE')
+        other = sqlite3.connect(self.db_path, timeout=0.1)
+        with self.assertRaises(sqlite3.OperationalError):
+            realtime_store.ensure_db(other)
+        other.close()
+        conn.rollback()
+        self.assertFalse(realtime_store.is_typed(conn))
+        w = RecordWriter(self.db_path, flush_ms=10)
+        w.start()
+        w.put(1735689600.0, '生產線1', '早班', 'WO-1', 20.0, 1.0)
+        self.assertTrue(w.flush())
+        w.close()
+        self.assertTrue(realtime_store.is_typed(conn))
+        self.assertEqual(conn.execute('SELECT device FROM records').fetchall(), [('生產線1',)])
+        conn.close()
+
+    def test_flush_commits_queued_rows_and_export_streams_range(self):
+        w = RecordWriter(self.db_path, flush_ms=1000, max_rows=1000)
+        w.start()
+        for i in range(50):
+            line = '生產線1' if i % 2 == 0 else '生產線2'
+            w.put(1735689600.0 + i, line, '早班', 'WO-1' if i < 30 else 'WO-2', float(i), 0.5)
+        self.assertTrue(w.flush(timeout=5.0))
+        self.assertEqual(w.stats()['rows'], 50)
+        conn = sqlite3.connect(self.db_path)
+        out = Path(self.tmp.name) / 'out.csv'
+        n = realtime_store.export_records(conn, out, 'csv', line='生產線1', work_order='WO-1',
+                                          start=1735689600.0 + 10, end=realtime_store.epoch_to_iso(1735689600.0 + 40),
+                                          chunk_size=3)
+        with open(out, newline='', encoding='utf-8-sig') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0], realtime_store.EXPORT_HEADER)
+        self.assertEqual(n, 10)
+        self.assertEqual([float(r[4]) for r in rows[1:]], [float(i) for i in range(10, 30, 2)])
+        self.assertEqual(rows[1][3], realtime_store.epoch_to_iso(1735689600.0 + 10))
+        self.assertFalse(Path(str(out) + '.tmp').exists())
+        plan = ' '.join(r[-1] for r in conn.execute(
+            'EXPLAIN QUERY PLAN SELECT * FROM records WHERE device = ? AND timestamp >= ?', ('生產線1', 0)))
+        self.assertIn('idx_records_device_ts', plan)
+        conn.close()
+        w.close()
+
+    def test_export_line_from_db_and_fallback_to_buffer(self):
+        store = SampleStore(capacity=100)
+        w = RecordWriter(self.db_path, flush_ms=1000, max_rows=1000)
+        w.start()
+        for i in range(20):
+            line = '生產線1' if i % 2 == 0 else '生產線2'
+            w.put(1735689600.0 + i, line, '早班', 'WO-1', float(i), 0.5)
+            if line == '生產線1':
+                store.append(1735689600.0 + i, line, '早班', 'WO-1', float(i), 0.5)
+        out = Path(self.tmp.name) / 'line1.csv'
+        n, source = realtime_store.export_line(self.db_path, store, out, 'csv', line='生產線1',
+                                               start=1735689600.0, flush=lambda: w.flush(timeout=5.0))
+        w.close()
+        self.assertEqual((n, source), (10, 'db'))
+        self.assertFalse(Path(str(out) + '.tmp').exists())
+        with open(out, newline='', encoding='utf-8-sig') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0], realtime_store.EXPORT_HEADER)
+        self.assertEqual([float(r[4]) for r in rows[1:]], [float(i) for i in range(0, 20, 2)])
+        # the buffer has rows the database is missing -> export the buffer
+        store.append(1735689700.0, '生產線1', '早班', 'WO-1', 99.0, 0.5)
+        txt = Path(self.tmp.name) / 'line1.txt'
+        n, source = realtime_store.export_line(self.db_path, store, txt, 'txt', line='生產線1', start=1735689600.0)
+        self.assertEqual((n, source), (11, 'buffer'))
+        with open(txt, encoding='utf-8-sig', newline='') as f:
+            lines = f.read().split('\r\n')
+        self.assertEqual(lines[0].split('\t'), realtime_store.EXPORT_HEADER)
+        self.assertEqual(lines[11].split('\t')[4], '99.0')
+        # no database and a failed flush both fall back as well
+        missing = str(Path(self.tmp.name) / 'missing.db')
+        self.assertEqual(realtime_store.export_line(missing, store, out, line='生產線1', start=0.0)[1], 'buffer')
+        self.assertEqual(realtime_store.export_line(self.db_path, store, out, line='生產線1', start=0.0,
+                                                    flush=lambda: False)[1], 'buffer')
+
+
+class TestSampleStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.spill = Path(self.tmp.name) / 'samples.bin'
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_spills_full_blocks_and_keeps_order(self):
+        store = SampleStore(capacity=4, spill_path=str(self.spill))
+        for i in range(10):
+            wo = 'WO-1' if i < 6 else 'WO-2'
+            store.append(1735689600.0 + i, '生產線1', '早班', wo, 20.0 + i, 1.0)
+        self.assertEqual(len(store), 10)
+        self.assertEqual(store.spilled, 8)
+        self.assertTrue(self.spill.exists())
+        rows = list(store.iter_rows())
+        self.assertEqual([r['temperature'] for r in rows], [20.0 + i for i in range(10)])
+        self.assertEqual([r['work_order'] for r in rows], ['WO-1'] * 6 + ['WO-2'] * 4)
+        self.assertEqual(rows[0]['time'], realtime_store.epoch_to_iso(1735689600.0))
+        self.assertEqual(rows[0]['line'], '生產線1')
+        store.clear()
+        self.assertFalse(store)
+        self.assertFalse(self.spill.exists())
+        self.assertEqual(list(store.iter_rows()), [])
+
+    def test_without_spill_path_memory_stays_bounded(self):
+        store = SampleStore(capacity=3)
+        for i in range(7):
+            store.append(1735689600.0 + i, '生產線1', '早班', 'WO-1', float(i), 0.0)
+        self.assertEqual(store.dropped, 6)
+        self.assertEqual([r['temperature'] for r in store.iter_rows()], [6.0])
+
+    def test_ignores_stale_spill_file_and_survives_write_errors(self):
+        self.spill.write_bytes(b'left over from a crashed run')
+        store = SampleStore(capacity=2, spill_path=str(self.spill))
+        self.assertFalse(self.spill.exists())
+        store.spill_path = str(Path(self.tmp.name) / 'missing' / 'samples.bin')
+        store.append(1735689600.0, '生產線1', '早班', 'WO-1', 1.0, 0.0)
+        with self.assertRaises(OSError):
+            store.append(1735689601.0, '生產線1', '早班', 'WO-1', 2.0, 0.0)
+        self.assertEqual((store.dropped, len(store)), (2, 0))
+        store.spill_path = str(self.spill)
+        for i in range(3):
+            store.append(1735689602.0 + i, '生產線1', '早班', 'WO-1', 3.0 + i, 0.0)
+        self.assertEqual([r['temperature'] for r in store.iter_rows()], [3.0, 4.0, 5.0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,490 @@
+import os
+import csv
+import time
+import json
+import struct
+import queue
+import sqlite3
+import argparse
+import threading
+from array import array
+from datetime import datetime
+
+
+RECORD_FIELDS = ('timestamp', 'device', 'shift', 'work_order', 'temperature', 'current')
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS records ('
+    'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+    'timestamp REAL NOT NULL, '
+    'device TEXT, '
+    'shift TEXT, '
+    'work_order TEXT, '
+    'temperature REAL, '
+    'current REAL)'
+)
+INDEXES = (
+    'CREATE INDEX IF NOT EXISTS idx_records_wo_device ON records(work_order, device)',
+    'CREATE INDEX IF NOT EXISTS idx_records_device_ts ON records(device, timestamp)',
+)
+EXPORT_HEADER = ["生產線", "班次", "工單號", "時間", "溫度", "電流"]
+
+
+def record_columns(conn):
+    return [row[1] for row in conn.execute('PRAGMA table_info(records)')]
+
+
+def is_typed(conn):
+    return 'timestamp' in record_columns(conn)
+
+
+def iso_to_epoch(ts):
+    try:
+        return datetime.fromisoformat(ts).timestamp()
+    except Exception:
+        return None
+
+
+def epoch_to_iso(t):
+    return datetime.fromtimestamp(t).isoformat(timespec='seconds')
+
+
+def _json_field(data, key):
+    try:
+        v = json.loads(data).get(key)
+    except Exception:
+        return None
+    return v if isinstance(v, (str, int, float)) or v is None else str(v)
+
+
+def migrate_legacy(conn):
+    """把舊版 records(ts TEXT, data TEXT JSON) 原地轉成型別欄位，保留 id 讓同步水位不中斷"""
+    conn.create_function('iso_epoch', 1, iso_to_epoch)
+    conn.create_function('json_field', 2, _json_field)
+    with conn:
+        conn.execute('BEGIN')
+        conn.execute('DROP TABLE IF EXISTS records_typed')
+        conn.execute(SCHEMA.replace('IF NOT EXISTS records', 'records_typed'))
+        conn.execute(
+            'INSERT INTO records_typed (id, timestamp, device, shift, work_order, temperature, current) '
+            "SELECT id, COALESCE(iso_epoch(ts), 0), json_field(data, 'line'), json_field(data, 'shift'), "
+            "json_field(data, 'work_order'), json_field(data, 'temperature'), json_field(data, 'current') "
+            'FROM records ORDER BY id'
+        )
+        conn.execute('DROP TABLE records')
+        conn.execute('ALTER TABLE records_typed RENAME TO records')
+        for sql in INDEXES:
+            conn.execute(sql)
+
+
+def ensure_db(conn):
+    """建立或轉換 records；轉換失敗（例如 ems.db 被同步程式鎖住）時拋出例外，不在舊格式上繼續寫"""
+    cols = record_columns(conn)
+    if cols and 'timestamp' not in cols:
+        migrate_legacy(conn)
+        return
+    conn.execute(SCHEMA)
+    for sql in INDEXES:
+        conn.execute(sql)
+    conn.commit()
+
+
+def connect(db_path, synchronous='NORMAL', timeout=5.0):
+    conn = sqlite3.connect(db_path, timeout=timeout, check_same_thread=False)
+    try:
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(f'PRAGMA synchronous={synchronous}')
+    except Exception:
+        pass
+    try:
+        ensure_db(conn)
+    except Exception:
+        conn.close()
+        raise
+    return conn
+
+
+def _epoch(t):
+    if t is None or isinstance(t, (int, float)):
+        return t
+    if isinstance(t, datetime):
+        return t.timestamp()
+    v = iso_to_epoch(str(t))
+    if v is None:
+        raise ValueError(f'invalid time: {t}')
+    return v
+
+
+def iter_records(conn, line=None, work_order=None, start=None, end=None, chunk_size=2000):
+    """依生產線/工單/時間區間逐批讀出樣本，結果集不整批載入記憶體"""
+    where = []
+    params = []
+    if line is not None:
+        where.append('device = ?')
+        params.append(line)
+    if work_order is not None:
+        where.append('work_order = ?')
+        params.append(work_order)
+    if start is not None:
+        where.append('timestamp >= ?')
+        params.append(_epoch(start))
+    if end is not None:
+        where.append('timestamp <= ?')
+        params.append(_epoch(end))
+    sql = 'SELECT device, shift, work_order, timestamp, temperature, current FROM records'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY timestamp, id'
+    cur = conn.execute(sql, params)
+    try:
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+    finally:
+        cur.close()
+
+
+def _export_row(row):
+    device, shift, work_order, ts, temperature, current = row
+    return [device or '', shift or '', work_order or '', epoch_to_iso(ts),
+            '' if temperature is None else temperature, '' if current is None else current]
+
+
+def export_records(conn, path, fmt='csv', line=None, work_order=None, start=None, end=None, chunk_size=2000):
+    """串流匯出為 CSV/TXT（先寫 .tmp 再替換），回傳筆數"""
+    tmp = str(path) + '.tmp'
+    n = 0
+    try:
+        with open(tmp, 'w', newline='', encoding='utf-8-sig') as f:
+            if fmt == 'csv':
+                w = csv.writer(f)
+                w.writerow(EXPORT_HEADER)
+                for rows in iter_records(conn, line, work_order, start, end, chunk_size):
+                    w.writerows(_export_row(r) for r in rows)
+                    n += len(rows)
+            else:
+                f.write('\t'.join(EXPORT_HEADER) + '\r\n')
+                for rows in iter_records(conn, line, work_order, start, end, chunk_size):
+                    f.write(''.join('\t'.join(str(v) for v in _export_row(r)) + '\r\n' for r in rows))
+                    n += len(rows)
+        os.replace(tmp, path)
+    except Exception:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    return n
+
+
+def export_samples(store, path, fmt='csv'):
+    """把 SampleStore 的樣本（含已溢寫的區塊）匯出為 CSV/TXT（先寫 .tmp 再替換），回傳筆數"""
+    tmp = str(path) + '.tmp'
+    n = 0
+    try:
+        with open(tmp, 'w', newline='', encoding='utf-8-sig') as f:
+            if fmt == 'csv':
+                w = csv.writer(f)
+                w.writerow(EXPORT_HEADER)
+            else:
+                f.write('\t'.join(EXPORT_HEADER) + '\r\n')
+            for r in store.iter_rows():
+                row = [r['line'], r['shift'], r['work_order'], r['time'], r['temperature'], r['current']]
+                if fmt == 'csv':
+                    w.writerow(row)
+                else:
+                    f.write('\t'.join(str(v) for v in row) + '\r\n')
+                n += 1
+        os.replace(tmp, path)
+    except Exception:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    return n
+
+
+def export_line(db_path, store, path, fmt='csv', line=None, start=None, flush=None):
+    """匯出一條生產線：先從 ems.db 串流；資料庫不可用、flush() 失敗或筆數少於緩衝時改用 store
+
+    回傳 (筆數, 'db' 或 'buffer')；寫檔失敗時拋出例外。
+    """
+    if start is not None and db_path and (flush is None or flush()) and os.path.exists(db_path):
+        try:
+            conn = sqlite3.connect(db_path, timeout=5.0)
+            try:
+                n = export_records(conn, path, fmt, line=line, start=start)
+            finally:
+                conn.close()
+        except Exception:
+            n = -1
+        # 資料庫筆數少於緩衝（例如寫入失敗）時以緩衝為準
+        if n >= len(store):
+            return n, 'db'
+    return export_samples(store, path, fmt), 'buffer'
+
+
+class RecordWriter:
+    """背景寫入執行緒：把各生產線的樣本合併成單一交易提交，避免 GUI 執行緒逐筆 fsync"""
+
+    _STOP = object()
+
+    def __init__(self, db_path, flush_ms=200, max_rows=500, synchronous='NORMAL'):
+        self.db_path = db_path
+        self.flush_ms = int(flush_ms)
+        self.max_rows = int(max_rows)
+        self.synchronous = synchronous
+        self.queue = queue.Queue()
+        self.rows = 0
+        self.commits = 0
+        self.errors = 0
+        self.last_error = None
+        self.last_commit_ms = None
+        self.max_commit_ms = 0.0
+        self._commit_ms_total = 0.0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='ems-db-writer', daemon=True)
+            self._thread.start()
+
+    def put(self, timestamp, device, shift, work_order, temperature, current):
+        self.queue.put((timestamp, device, shift, work_order, temperature, current))
+
+    def flush(self, timeout=5.0):
+        """等待目前佇列中的樣本全部提交，匯出前呼叫"""
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout=5.0):
+        if self._thread is None:
+            return
+        self.queue.put(self._STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queue_depth': self.queue.qsize(),
+                'rows': self.rows,
+                'commits': self.commits,
+                'errors': self.errors,
+                'last_error': self.last_error,
+                'last_commit_ms': self.last_commit_ms,
+                'max_commit_ms': self.max_commit_ms,
+                'avg_commit_ms': self._commit_ms_total / self.commits if self.commits else None,
+            }
+
+    def _run(self):
+        conn = None
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            if item is self._STOP:
+                break
+            if isinstance(item, threading.Event):
+                item.set()
+                continue
+            batch = [item]
+            flushed = []
+            deadline = time.monotonic() + self.flush_ms / 1000.0
+            while len(batch) < self.max_rows:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self.queue.get(timeout=max(0.0, remaining)) if remaining > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stopping = True
+                    break
+                if isinstance(item, threading.Event):
+                    flushed.append(item)
+                    break
+                batch.append(item)
+            # 失敗時重新連線再試一次（例如資料庫檔被清除後重建）
+            for _ in range(2):
+                try:
+                    if conn is None:
+                        conn = connect(self.db_path, self.synchronous)
+                    t0 = time.perf_counter()
+                    with conn:
+                        conn.executemany('INSERT INTO records (timestamp, device, shift, work_order, temperature, current) '
+                                         'VALUES (?, ?, ?, ?, ?, ?)', batch)
+                    self._record_commit(len(batch), (time.perf_counter() - t0) * 1000.0)
+                    break
+                except Exception as e:
+                    with self._lock:
+                        self.errors += 1
+                        self.last_error = str(e)
+                    try:
+                        if conn is not None:
+                            conn.close()
+                    except Exception:
+                        pass
+                    conn = None
+            for ev in flushed:
+                ev.set()
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _record_commit(self, n, ms):
+        with self._lock:
+            self.rows += n
+            self.commits += 1
+            self.last_commit_ms = ms
+            self.max_commit_ms = max(self.max_commit_ms, ms)
+            self._commit_ms_total += ms
+
+
+class SampleStore:
+    """每條生產線的樣本緩衝：time/溫度/電流存於預先配置的 array，
+    生產線/班次/工單只在變更時記一次；超過容量時整塊寫到暫存檔，記憶體維持固定大小"""
+
+    _BLOCK = struct.Struct('<II')
+
+    def __init__(self, capacity=36000, spill_path=None):
+        self.capacity = max(1, int(capacity))
+        self.spill_path = spill_path
+        self._time = array('d', bytes(8 * self.capacity))
+        self._temp = array('d', bytes(8 * self.capacity))
+        self._current = array('d', bytes(8 * self.capacity))
+        self._n = 0
+        self._segments = []
+        self._meta = None
+        self.spilled = 0
+        self.dropped = 0
+        # 同名的舊暫存檔（上次異常結束留下）不屬於這個緩衝
+        self._remove_spill()
+
+    def __len__(self):
+        return self.spilled + self._n
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def append(self, t, line, shift, work_order, temperature, current):
+        meta = (line, shift, work_order)
+        if meta != self._meta:
+            self._meta = meta
+            self._segments.append((self._n,) + meta)
+        i = self._n
+        self._time[i] = t
+        self._temp[i] = temperature
+        self._current[i] = current
+        self._n = i + 1
+        if self._n >= self.capacity:
+            self._spill()
+
+    def _spill(self):
+        if not self.spill_path:
+            # 沒有暫存檔時只保留最近一個區塊，丟棄筆數記在 dropped
+            self.dropped += self._n
+            self._reset_block()
+            return
+        meta = json.dumps(self._segments, ensure_ascii=False).encode('utf-8')
+        start = None
+        try:
+            with open(self.spill_path, 'ab') as f:
+                start = f.tell()
+                f.write(self._BLOCK.pack(self._n, len(meta)))
+                f.write(meta)
+                for col in (self._time, self._temp, self._current):
+                    f.write(col[:self._n].tobytes())
+        except OSError:
+            # 寫入失敗（例如磁碟滿）：截掉寫了一半的區塊，已寫入的區塊仍可讀回；這個區塊計入 dropped
+            if start is not None:
+                try:
+                    os.truncate(self.spill_path, start)
+                except OSError:
+                    pass
+            self.dropped += self._n
+            self._reset_block()
+            raise
+        self.spilled += self._n
+        self._reset_block()
+
+    def _reset_block(self):
+        self._n = 0
+        # 新區塊沿用目前的生產線/班次/工單
+        self._segments = [(0,) + self._meta] if self._meta else []
+
+    def _iter_block(self, n, segments, times, temps, currents):
+        bounds = [seg[0] for seg in segments[1:]] + [n]
+        for (start, line, shift, work_order), end in zip(segments, bounds):
+            for i in range(start, end):
+                yield {
+                    'line': line,
+                    'shift': shift,
+                    'work_order': work_order,
+                    'time': epoch_to_iso(times[i]),
+                    'temperature': temps[i],
+                    'current': currents[i],
+                }
+
+    def iter_rows(self):
+        if self.spill_path and os.path.exists(self.spill_path):
+            with open(self.spill_path, 'rb') as f:
+                while True:
+                    head = f.read(self._BLOCK.size)
+                    if len(head) < self._BLOCK.size:
+                        break
+                    n, meta_len = self._BLOCK.unpack(head)
+                    segments = [tuple(seg) for seg in json.loads(f.read(meta_len).decode('utf-8'))]
+                    cols = []
+                    for _ in range(3):
+                        col = array('d')
+                        col.frombytes(f.read(8 * n))
+                        cols.append(col)
+                    yield from self._iter_block(n, segments, *cols)
+        yield from self._iter_block(self._n, self._segments, self._time, self._temp, self._current)
+
+    def clear(self):
+        self._n = 0
+        self._segments = []
+        self._meta = None
+        self.spilled = 0
+        self.dropped = 0
+        self._remove_spill()
+
+    def _remove_spill(self):
+        if self.spill_path:
+            try:
+                os.remove(self.spill_path)
+            except OSError:
+                pass
+
+
+def main():
+    base = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description='Export realtime samples from ems.db')
+    parser.add_argument('--db-path', type=str, default=os.path.join(base, 'real_time_monitoring', 'temp', 'ems.db'))
+    parser.add_argument('--line', type=str, default=None)
+    parser.add_argument('--work-order', type=str, default=None)
+    parser.add_argument('--start', type=str, default=None, help='e.g. 2025-11-24T08:00:00')
+    parser.add_argument('--end', type=str, default=None, help='e.g. 2025-11-30T20:00:00')
+    parser.add_argument('--format', choices=['csv', 'txt'], default='csv')
+    parser.add_argument('--out', type=str, required=True)
+    args = parser.parse_args()
+    conn = sqlite3.connect(args.db_path)
+    try:
+        n = export_records(conn, args.out, args.format, line=args.line, work_order=args.work_order,
+                           start=args.start, end=args.end)
+    finally:
+        conn.close()
+    print(f'{n} rows -> {args.out}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,30 +1,491 @@
 import os
+import sys
 import time
 import json
 import logging
 from logging.handlers import RotatingFileHandler
 from pathlib import Path
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 import subprocess
 import sqlite3
 import argparse
+import threading
+import queue
+import select
+import struct
+import ctypes
+import ctypes.util
+
+import columnar_archive
+import archive_index
+import realtime_store
+from version_log import VersionLog
+
+def _json_num(v):
+    # repr matches json.dumps for finite floats; v - v is 0 only when finite
+    if type(v) is float and v - v == 0:
+        return repr(v)
+    return json.dumps(v)
+
+
+class CommitScheduler:
+    def __init__(self, service, max_age=300, max_bytes=8 * 1024 * 1024, retry_delay=30):
+        self.service = service
+        self.max_age = float(max_age)
+        self.max_bytes = int(max_bytes)
+        self.retry_delay = float(retry_delay)
+        self.pending = set()
+        self.pending_bytes = 0
+        self.first_enqueued = None
+        self.last_push = None
+        self.in_flight = 0
+        self.pushes = 0
+        self.failures = 0
+        self._next_attempt = 0.0
+        self._flush_requested = False
+        self._stopping = False
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='sync-publish', daemon=True)
+            self._thread.start()
+
+    def enqueue(self, paths, nbytes=0):
+        if not paths:
+            return
+        with self._cond:
+            if not self.pending:
+                self.first_enqueued = time.time()
+            self.pending.update(paths)
+            self.pending_bytes += int(nbytes)
+            self._cond.notify()
+
+    def flush(self, wait=True, timeout=None):
+        with self._cond:
+            self._flush_requested = True
+            self._next_attempt = 0.0
+            self._cond.notify()
+            if wait and self._thread is not None:
+                self._cond.wait_for(lambda: not self.pending and not self.in_flight, timeout)
+
+    def stop(self, flush=True, timeout=None):
+        if flush and self._thread is not None:
+            self.flush(wait=True, timeout=timeout)
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self):
+        with self._cond:
+            now = time.time()
+            return {
+                'queue_depth': len(self.pending),
+                'pending_bytes': self.pending_bytes,
+                'oldest_pending_age': (now - self.first_enqueued) if self.pending else None,
+                'last_push_age': (now - self.last_push) if self.last_push else None,
+                'in_flight': self.in_flight,
+                'pushes': self.pushes,
+                'failures': self.failures,
+            }
+
+    def _due(self, now):
+        if not self.pending or now < self._next_attempt:
+            return False
+        if self._flush_requested or self.pending_bytes >= self.max_bytes:
+            return True
+        return now - self.first_enqueued >= self.max_age
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopping and not self._due(time.time()):
+                    if self.pending:
+                        wake = max(self._next_attempt, self.first_enqueued + self.max_age)
+                        self._cond.wait(max(0.05, wake - time.time()))
+                    else:
+                        self._flush_requested = False
+                        self._cond.notify_all()
+                        self._cond.wait()
+                if self._stopping:
+                    return
+                paths = sorted(self.pending)
+                nbytes = self.pending_bytes
+                self.pending = set()
+                self.pending_bytes = 0
+                self.in_flight = len(paths)
+            ok = False
+            try:
+                ok = self.service._commit_and_push(paths)
+            except Exception as e:
+                self.service.log.error(f'publish failed: {e}')
+            with self._cond:
+                self.in_flight = 0
+                if ok:
+                    self.last_push = time.time()
+                    self.pushes += 1
+                    self._flush_requested = False
+                    self.service._remove_pending_paths(paths)
+                else:
+                    self.failures += 1
+                    if not self.pending:
+                        self.first_enqueued = time.time()
+                    self.pending.update(paths)
+                    self.pending_bytes += nbytes
+                    self._next_attempt = time.time() + self.retry_delay
+                self._cond.notify_all()
+
+class ChangeTrigger:
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    _EVENT = struct.Struct('iIII')
+
+    def __init__(self, db_path, flag_path=None, debounce=0.5, poll=0.25, use_inotify=True):
+        self.db_path = Path(db_path)
+        self.flag_path = Path(flag_path) if flag_path else None
+        self.debounce = float(debounce)
+        self.poll = float(poll)
+        self.events = 0
+        self.fires = 0
+        self._names = {self.db_path.name, self.db_path.name + '-wal', self.db_path.name + '-journal'}
+        if self.flag_path is not None:
+            self._names.add(self.flag_path.name)
+        self._fd = None
+        self._conn = None
+        self._conn_ino = None
+        self._data_version = None
+        self._flag_present = None
+        if use_inotify:
+            self._fd = self._open_inotify()
+        self.backend = 'inotify' if self._fd is not None else 'data_version'
+        if self._fd is not None:
+            # inotify only says a file was touched; data_version confirms a commit happened
+            try:
+                self._probe_data_version()
+            except Exception:
+                self._close_conn()
+
+    def _open_inotify(self):
+        if not sys.platform.startswith('linux'):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+            fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+            if fd < 0:
+                return None
+            mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE | self.IN_DELETE
+            dirs = {str(self.db_path.parent)}
+            if self.flag_path is not None:
+                dirs.add(str(self.flag_path.parent))
+            for d in dirs:
+                Path(d).mkdir(parents=True, exist_ok=True)
+                if libc.inotify_add_watch(fd, d.encode(), mask) < 0:
+                    os.close(fd)
+                    return None
+            return fd
+        except Exception:
+            return None
+
+    def close(self):
+        if self._fd is not None:
+            try:
+                os.close(self._fd)
+            except Exception:
+                pass
+            self._fd = None
+        self._close_conn()
+
+    def _close_conn(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    def _drain_inotify(self):
+        # in WAL mode every read-only open/close creates and deletes ems.db-wal (and closing
+        # an O_RDWR handle is IN_CLOSE_WRITE), including the sync service's own reads, so
+        # events are only a hint and a real commit is confirmed through data_version
+        changed = False
+        while True:
+            try:
+                buf = os.read(self._fd, 65536)
+            except BlockingIOError:
+                break
+            if not buf:
+                break
+            pos = 0
+            while pos + self._EVENT.size <= len(buf):
+                _, _, _, length = self._EVENT.unpack_from(buf, pos)
+                name = buf[pos + self._EVENT.size:pos + self._EVENT.size + length].rstrip(b'\0').decode(errors='ignore')
+                pos += self._EVENT.size + length
+                if name in self._names:
+                    changed = True
+        if not changed:
+            return False
+        try:
+            return self._probe_data_version()
+        except Exception:
+            self._close_conn()
+            return False
+
+    def _wait_inotify(self, timeout):
+        deadline = time.time() + max(0.0, timeout)
+        while True:
+            r, _, _ = select.select([self._fd], [], [], max(0.0, deadline - time.time()))
+            if r and self._drain_inotify():
+                return True
+            if time.time() >= deadline:
+                return False
+
+    def _probe_data_version(self):
+        flag = self.flag_path.exists() if self.flag_path is not None else None
+        flag_changed = self._flag_present is not None and flag != self._flag_present
+        self._flag_present = flag
+        try:
+            st = self.db_path.stat()
+        except OSError:
+            self._close_conn()
+            return flag_changed
+        if self._conn is None or st.st_ino != self._conn_ino:
+            self._close_conn()
+            self._conn = sqlite3.connect(str(self.db_path))
+            self._conn_ino = st.st_ino
+            self._data_version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+            return True
+        v = self._conn.execute('PRAGMA data_version').fetchone()[0]
+        if v != self._data_version:
+            self._data_version = v
+            return True
+        return flag_changed
+
+    def _wait_data_version(self, timeout):
+        deadline = time.time() + max(0.0, timeout)
+        while True:
+            try:
+                if self._probe_data_version():
+                    return True
+            except Exception:
+                self._close_conn()
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            time.sleep(min(self.poll, remaining))
+
+    def _wait_change(self, timeout):
+        if self._fd is not None:
+            return self._wait_inotify(timeout)
+        return self._wait_data_version(timeout)
+
+    def wait(self, timeout=None):
+        timeout = 3600.0 if timeout is None else float(timeout)
+        if not self._wait_change(timeout):
+            return False
+        self.events += 1
+        # debounce: fold follow-up writes inside the window into this one wake-up
+        deadline = time.time() + self.debounce
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            if self._wait_change(remaining):
+                self.events += 1
+        self.fires += 1
+        return True
+
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.rows = 0
+        self.chunks = 0
+        self.busy = 0.0
+        self.last_latency = None
+        self.errors = 0
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def record(self, rows, elapsed):
+        with self._lock:
+            self.rows += rows
+            self.chunks += 1
+            self.busy += elapsed
+            self.last_latency = elapsed
+
+    def snapshot(self):
+        with self._lock:
+            wall = max(1e-9, time.time() - self.started)
+            return {
+                'rows': self.rows,
+                'chunks': self.chunks,
+                'rows_per_sec': self.rows / self.busy if self.busy else 0.0,
+                'utilization': self.busy / wall,
+                'last_latency': self.last_latency,
+                'errors': self.errors,
+            }
+
+
+class StagedSyncEngine:
+    _REWIND = object()
+
+    def __init__(self, service, queue_size=4):
+        self.service = service
+        self.write_queue = queue.Queue(maxsize=max(1, int(queue_size)))
+        self.publisher = service.publisher or CommitScheduler(service, max_age=0)
+        self.extract_stats = StageStats('extract')
+        self.write_stats = StageStats('write')
+        self.last_cycle_lag = None
+        self._rewind = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self.publisher.enqueue(self.service._load_state().get('pending_paths') or [])
+        self.publisher.start()
+        for target, name in [(self._extract_loop, 'sync-extract'), (self._write_loop, 'sync-write')]:
+            t = threading.Thread(target=target, name=name, daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+        self.publisher.stop(flush=True, timeout=timeout)
+
+    def stats(self):
+        return {
+            'extract': self.extract_stats.snapshot(),
+            'write': dict(self.write_stats.snapshot(), queue_depth=self.write_queue.qsize()),
+            'publish': self.publisher.stats(),
+            'cycle_lag': self.last_cycle_lag,
+        }
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self.write_queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _wait_for_trigger(self, timeout):
+        trigger = self.service.trigger
+        if trigger is None:
+            self._stop.wait(timeout)
+            return
+        deadline = time.time() + self.service.max_idle
+        while not self._stop.is_set() and time.time() < deadline:
+            if trigger.wait(min(0.5, max(0.0, deadline - time.time()))):
+                return
+
+    def _extract_loop(self):
+        svc = self.service
+        cursor = svc._load_last_id()
+        db_ino = None
+        while not self._stop.is_set():
+            cycle_start = time.time()
+            try:
+                cursor, db_ino = svc._rewind_if_recreated(cursor, db_ino)
+                if svc._should_sync():
+                    t0 = time.time()
+                    for chunk in svc._iter_record_chunks(cursor):
+                        if self._rewind.is_set():
+                            break
+                        self.extract_stats.record(len(chunk), time.time() - t0)
+                        if not self._put(chunk):
+                            return
+                        cursor = chunk[-1]['id']
+                        t0 = time.time()
+                    if self._rewind.is_set():
+                        self._rewind.clear()
+                        cursor = svc._load_last_id()
+                        self._put(self._REWIND)
+            except Exception as e:
+                self.extract_stats.errors += 1
+                svc.log.error(f'extract stage error: {e}')
+            self.last_cycle_lag = time.time() - cycle_start
+            self._wait_for_trigger(max(0.0, svc.interval - (time.time() - cycle_start)))
+
+    def _write_loop(self):
+        svc = self.service
+        discarding = False
+        while not self._stop.is_set() or not self.write_queue.empty():
+            try:
+                chunk = self.write_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if chunk is self._REWIND:
+                discarding = False
+                continue
+            if discarding:
+                continue
+            t0 = time.time()
+            try:
+                with svc._write_lock:
+                    paths = svc._write_exports(chunk)
+            except Exception as e:
+                self.write_stats.errors += 1
+                svc.log.error(f'write stage error: {e}')
+                discarding = True
+                self._rewind.set()
+                continue
+            self.write_stats.record(len(chunk), time.time() - t0)
+            self.publisher.enqueue(paths, sum(len(r['data']) + len(r['ts']) + 12 for r in chunk))
+
 
 class SyncService:
-    def __init__(self, interval=5, db_path=None):
-        self.root = Path(__file__).parent
+    def __init__(self, interval=5, db_path=None, chunk_size=5000, archive_format='csv',
+                 commit_every=None, commit_max_mb=8, staged=False, queue_size=4,
+                 trigger='poll', debounce=0.5, max_idle=60, root=None):
+        self.root = Path(root) if root else Path(__file__).parent
         self.exports_dir = self.root / 'historical_data' / 'archives'
         self.logs_dir = self.root / 'historical_data' / 'logs'
         self.var_dir = self.root / 'real_time_monitoring' / 'temp'
         self.state_path = self.var_dir / 'sync_state.json'
         self.recording_flag = self.var_dir / 'recording.lock'
-        self.version_log = self.root / 'historical_data' / 'version_log.json'
+        self.version_log = self.root / 'historical_data' / 'version_log.jsonl'
+        self.write_journal = self.exports_dir / '.write_journal.json'
         self.interval = int(interval)
+        self.chunk_size = max(1, int(chunk_size))
+        self.archive_format = archive_format or 'csv'
+        self.archive_encoding = archive_index.archive_encoding()
+        self.index_block_rows = archive_index.BLOCK_ROWS
+        self._indexes = {}
+        self._db_ino = None
         self.db_path = db_path or os.environ.get('DB_PATH') or str(self.var_dir / 'ems.db')
         self.git_owner = os.environ.get('GIT_OWNER') or 'JungluChen'
         self.git_repo = os.environ.get('GIT_REPO') or 'EMS'
         self.git_branch = os.environ.get('GIT_BRANCH') or 'main'
+        self.staged = bool(staged)
+        self.queue_size = int(queue_size)
+        self.max_idle = float(max_idle)
+        self.version_log_compact_bytes = 8 * 1024 * 1024
+        self.version_log_retain_days = 7
+        self.trigger = None
+        if trigger == 'event':
+            self.trigger = ChangeTrigger(self.db_path, self.recording_flag, debounce=debounce)
+        self._state_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self.publisher = None
+        if commit_every:
+            self.publisher = CommitScheduler(self, max_age=commit_every,
+                                             max_bytes=int(float(commit_max_mb) * 1024 * 1024))
         self._prepare_dirs()
         self._setup_logging()
+        self.versions = VersionLog(self.version_log, legacy_path=self.version_log.with_suffix('.json'))
 
     def _prepare_dirs(self):
         for d in [self.exports_dir, self.logs_dir, self.var_dir]:
@@ -40,22 +501,76 @@ class SyncService:
         logger.addHandler(handler)
         self.log = logger
 
-    def _load_last_sync(self):
+    def _load_state(self):
         if self.state_path.exists():
             try:
                 with open(self.state_path, 'r', encoding='utf-8') as f:
                     obj = json.load(f)
-                    return obj.get('last_sync')
+                    if isinstance(obj, dict):
+                        return obj
             except Exception:
-                return None
-        return None
+                return {}
+        return {}
 
-    def _save_last_sync(self, ts_iso):
+    def _save_state(self, state):
+        tmp_path = self.state_path.with_suffix('.json.tmp')
         try:
-            with open(self.state_path, 'w', encoding='utf-8') as f:
-                json.dump({'last_sync': ts_iso}, f)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.state_path)
         except Exception as e:
-            self.log.error(f'save_last_sync failed: {e}')
+            self.log.error(f'save_state failed: {e}')
+
+    def _load_last_id(self):
+        state = self._load_state()
+        last_id = state.get('last_id')
+        if last_id is not None:
+            try:
+                return int(last_id)
+            except Exception:
+                return 0
+        # legacy state only stored a wall-clock last_sync; map it to an id once
+        since_iso = state.get('last_sync')
+        if not since_iso:
+            return 0
+        conn = self._connect_db()
+        if not conn:
+            return 0
+        try:
+            cur = conn.cursor()
+            if realtime_store.is_typed(conn):
+                cur.execute('SELECT MAX(id) FROM records WHERE timestamp <= ?', (realtime_store.iso_to_epoch(since_iso),))
+            else:
+                cur.execute('SELECT MAX(id) FROM records WHERE ts <= ?', (since_iso,))
+            row = cur.fetchone()
+            return int(row[0]) if row and row[0] is not None else 0
+        except Exception as e:
+            self.log.error(f'legacy state migration failed: {e}')
+            return 0
+        finally:
+            conn.close()
+
+    def _update_state(self, **fields):
+        with self._state_lock:
+            state = self._load_state()
+            state.update(fields)
+            state['last_sync'] = datetime.now(timezone.utc).isoformat()
+            self._save_state(state)
+
+    def _save_last_id(self, last_id, pending_paths=None):
+        with self._state_lock:
+            state = self._load_state()
+            state['last_id'] = int(last_id)
+            if pending_paths:
+                state['pending_paths'] = sorted(set(state.get('pending_paths') or []) | set(pending_paths))
+            state['last_sync'] = datetime.now(timezone.utc).isoformat()
+            self._save_state(state)
+
+    def _remove_pending_paths(self, paths):
+        with self._state_lock:
+            state = self._load_state()
+            state['pending_paths'] = sorted(set(state.get('pending_paths') or []) - set(paths))
+            self._save_state(state)
 
     def _connect_db(self):
         if not self.db_path or not Path(self.db_path).exists():
@@ -67,55 +582,208 @@ class SyncService:
             self.log.error(f'db connect failed: {e}')
             return None
 
-    def _extract_new_records(self, since_iso):
+    def _rewind_if_recreated(self, cursor, seen_ino):
+        # the GUI deletes ems.db on reset and the next one restarts its ids at 1,
+        # so a new inode or a cursor past the last id means start over
+        ino = self._db_inode()
+        if ino is None:
+            return cursor, seen_ino
+        last = self._max_record_id()
+        if (seen_ino is not None and ino != seen_ino) or (last is not None and last < cursor):
+            self.log.info(f'ems.db was recreated, rewinding extract cursor from {cursor}')
+            cursor = 0
+        return cursor, ino
+
+    def _db_inode(self):
+        try:
+            return os.stat(self.db_path).st_ino
+        except (OSError, TypeError):
+            return None
+
+    def _max_record_id(self):
         conn = self._connect_db()
         if not conn:
-            return []
+            return None
+        try:
+            return conn.execute('SELECT MAX(id) FROM records').fetchone()[0] or 0
+        except Exception:
+            return None
+        finally:
+            conn.close()
+
+    def _iter_record_chunks(self, since_id=0, chunk_size=None):
+        chunk_size = max(1, int(chunk_size or self.chunk_size))
+        conn = self._connect_db()
+        if not conn:
+            return
         try:
             cur = conn.cursor()
-            if since_iso:
-                cur.execute('SELECT id, ts, data FROM records WHERE ts > ? ORDER BY ts ASC', (since_iso,))
+            typed = realtime_store.is_typed(conn)
+            # id is the INTEGER PRIMARY KEY (rowid), so this is a range seek, not a scan
+            if typed:
+                cur.execute('SELECT id, timestamp, device, shift, work_order, temperature, current '
+                            'FROM records WHERE id > ? ORDER BY id ASC', (int(since_id or 0),))
             else:
-                cur.execute('SELECT id, ts, data FROM records ORDER BY ts ASC')
-            rows = cur.fetchall()
-            conn.close()
-            recs = []
-            for rid, ts, data in rows:
-                recs.append({'id': rid, 'ts': ts, 'data': data})
-            return recs
+                cur.execute('SELECT id, ts, data FROM records WHERE id > ? ORDER BY id ASC', (int(since_id or 0),))
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                if typed:
+                    yield self._typed_records(rows)
+                else:
+                    yield [{'id': rid, 'ts': ts, 'data': data} for rid, ts, data in rows]
         except Exception as e:
             self.log.error(f'db query failed: {e}')
+        finally:
+            conn.close()
+
+    def _typed_records(self, rows):
+        # rows of one tick share the second and most rows share line/shift/work_order,
+        # so the ISO stamp and the JSON prefix are built once and reused
+        stamps = {}
+        prefixes = {}
+        out = []
+        for rid, t, device, shift, work_order, temperature, current in rows:
+            sec = int(t)
+            ts = stamps.get(sec)
+            if ts is None:
+                ts = stamps[sec] = realtime_store.epoch_to_iso(sec)
+            key = (device, shift, work_order)
+            prefix = prefixes.get(key)
+            if prefix is None:
+                prefix = prefixes[key] = json.dumps({'line': device, 'shift': shift, 'work_order': work_order},
+                                                    ensure_ascii=False)[:-1] + ', "temperature": '
+            out.append({
+                'id': rid,
+                'ts': ts,
+                'data': f'{prefix}{_json_num(temperature)}, "current": {_json_num(current)}}}',
+                'line': device,
+                'shift': shift,
+                'work_order': work_order,
+                'temperature': temperature,
+                'current': current,
+            })
+        return out
+
+    def _extract_new_records(self, since_id=0):
+        recs = []
+        for chunk in self._iter_record_chunks(since_id):
+            recs.extend(chunk)
+        return recs
+
+    def _day_of(self, ts):
+        if ts and len(ts) >= 10 and ts[4] == '-' and ts[7] == '-':
+            return ts[:10]
+        try:
+            dt = datetime.fromisoformat(ts)
+        except Exception:
+            dt = datetime.now(timezone.utc)
+        return dt.strftime('%Y-%m-%d')
+
+    def _recover_exports(self):
+        if not self.write_journal.exists():
+            return
+        try:
+            with open(self.write_journal, 'r', encoding='utf-8') as f:
+                journal = json.load(f)
+            # journals from before last_id was recorded hold the offsets only
+            offsets = journal['offsets'] if 'offsets' in journal else journal
+            last_id = journal.get('last_id') if 'offsets' in journal else None
+        except Exception as e:
+            self.log.error(f'write journal unreadable, leaving archives as-is: {e}')
+            self.write_journal.unlink(missing_ok=True)
+            return
+        if last_id is not None and self._load_last_id() >= last_id:
+            # the watermark was saved before the crash: the append is complete, keep it
+            self.write_journal.unlink(missing_ok=True)
+            return
+        for path, size in offsets.items():
+            p = Path(path)
             try:
-                conn.close()
-            except Exception:
-                pass
-            return []
+                if size is None:
+                    p.unlink(missing_ok=True)
+                elif p.exists() and p.stat().st_size > size:
+                    with open(p, 'r+b') as f:
+                        f.truncate(size)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    self.log.warning(f'rolled back partial append: {p}')
+            except Exception as e:
+                self.log.error(f'rollback failed for {p}: {e}')
+        self.write_journal.unlink(missing_ok=True)
+
+    def _archive_index(self, csv_path):
+        # reuse the in-memory index while it still matches the archive; reload after
+        # a rollback, an external edit or a change of block size
+        key = str(csv_path)
+        index = self._indexes.get(key)
+        size = csv_path.stat().st_size if csv_path.exists() else 0
+        if index is None or index.block_rows != self.index_block_rows or index.indexed_to != size:
+            index = archive_index.BlockIndex(csv_path, self.index_block_rows)
+            self._indexes[key] = index
+        return index
 
     def _write_exports(self, records):
         if not records:
             return []
-        changed = set()
+        self._recover_exports()
+        groups = {}
         for r in records:
-            try:
-                dt = datetime.fromisoformat(r['ts'])
-            except Exception:
-                dt = datetime.now(timezone.utc)
-            fname = dt.strftime('%Y-%m-%d') + '.csv'
-            out_path = self.exports_dir / fname
-            tmp_path = out_path.with_suffix('.csv.tmp')
-            header = not out_path.exists()
-            with open(tmp_path, 'a', newline='') as f:
-                if header:
-                    f.write('id,ts,data\n')
-                f.write(f"{r['id']},{r['ts']},{r['data']}\n")
-            if out_path.exists():
-                with open(tmp_path, 'rb') as tf, open(out_path, 'ab') as of:
-                    of.write(tf.read())
-                tmp_path.unlink(missing_ok=True)
-            else:
-                tmp_path.rename(out_path)
-            changed.add(str(out_path))
-        return list(changed)
+            groups.setdefault(self._day_of(r['ts']), []).append(r)
+        suffixes = []
+        if self.archive_format in ('csv', 'both'):
+            suffixes.append('.csv')
+        if self.archive_format in ('columnar', 'both'):
+            suffixes.append(columnar_archive.SUFFIX)
+        offsets = {}
+        indexes = {}
+        for day in groups:
+            for suffix in suffixes:
+                out_path = self.exports_dir / (day + suffix)
+                offsets[str(out_path)] = out_path.stat().st_size if out_path.exists() else None
+                if suffix == '.csv':
+                    index = indexes[day] = self._archive_index(out_path)
+                    offsets[str(index.idx_path)] = index.rollback_offset() if index.idx_path.exists() else None
+        with open(self.write_journal, 'w', encoding='utf-8') as f:
+            json.dump({'last_id': records[-1]['id'], 'offsets': offsets}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        changed = []
+        for day, rows in groups.items():
+            if '.csv' in suffixes:
+                out_path = self.exports_dir / (day + '.csv')
+                start = offsets[str(out_path)]
+                head = b''
+                if start is None:
+                    head = archive_index.HEADER
+                    start = 0
+                lines = [f"{r['id']},{r['ts']},{r['data']}\n".encode(self.archive_encoding, errors='replace') for r in rows]
+                with open(out_path, 'ab') as f:
+                    f.write(head + b''.join(lines))
+                    f.flush()
+                    os.fsync(f.fileno())
+                indexes[day].append(lines, [r['ts'] for r in rows], start + len(head))
+                changed.append(str(out_path))
+            if columnar_archive.SUFFIX in suffixes:
+                out_path = self.exports_dir / (day + columnar_archive.SUFFIX)
+                with open(out_path, 'ab') as f:
+                    f.write(columnar_archive.encode_block(rows))
+                    f.flush()
+                    os.fsync(f.fileno())
+                changed.append(str(out_path))
+        # the journal goes only after the watermark is on disk; a crash in between is
+        # reconciled by _recover_exports against the journal's last_id
+        self._save_last_id(records[-1]['id'], pending_paths=changed)
+        self.write_journal.unlink(missing_ok=True)
+        return changed
+
+    def load_day_columns(self, day):
+        return columnar_archive.load_day(self.exports_dir, day)
+
+    def query_archives(self, start, end, line=None, work_order=None):
+        return archive_index.query(self.exports_dir, start, end, line=line, work_order=work_order,
+                                   encoding=self.archive_encoding)
 
     def _git(self, args):
         try:
@@ -126,62 +794,135 @@ class SyncService:
             self.log.warning(f'git {" ".join(args)} failed: {msg}')
             return False
 
+    def _has_staged_changes(self):
+        try:
+            res = subprocess.run(['git', 'diff', '--cached', '--quiet'], cwd=str(self.root), capture_output=True)
+            return res.returncode != 0
+        except Exception:
+            return True
+
+    def _has_unpushed_commits(self):
+        try:
+            res = subprocess.run(['git', 'rev-list', '--count', f'origin/{self.git_branch}..HEAD'],
+                                 cwd=str(self.root), capture_output=True, text=True)
+            if res.returncode != 0:
+                # no remote-tracking branch yet: never pushed
+                return True
+            return int(res.stdout.strip() or 0) > 0
+        except Exception:
+            return True
+
     def _commit_and_push(self, paths):
         if not paths:
-            return
-        ok_add = self._git(['add'] + paths)
+            return False
+        with self._write_lock:
+            ok_add = self._git(['add'] + paths)
         if not ok_add:
-            return
-        msg = f"sync: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-        ok_commit = self._git(['commit', '-m', msg])
-        if not ok_commit:
-            return
-        self._git(['push', 'origin', self.git_branch])
-        try:
-            self._update_version_log(paths)
-        except Exception as e:
-            self.log.warning(f'version log update failed: {e}')
+            return False
+        if self._has_staged_changes():
+            msg = f"sync: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+            ok_commit = self._git(['commit', '-m', msg])
+            if not ok_commit:
+                return False
+            try:
+                self._update_version_log(paths)
+            except Exception as e:
+                self.log.warning(f'version log update failed: {e}')
+        elif not self._has_unpushed_commits():
+            return True
+        # a commit whose push failed stays local; the paths stay pending and the retry,
+        # which finds nothing new to stage, pushes it
+        return self._git(['push', 'origin', self.git_branch])
 
     def _update_version_log(self, paths):
-        entry = {
-            'timestamp': datetime.now(timezone.utc).isoformat(),
-            'changed_files': paths,
-            'summary': f"synced {len(paths)} file(s)"
-        }
-        log = []
-        if self.version_log.exists():
-            try:
-                with open(self.version_log, 'r', encoding='utf-8') as f:
-                    log = json.load(f)
-            except Exception:
-                log = []
-        log.append(entry)
-        self.version_log.parent.mkdir(parents=True, exist_ok=True)
-        with open(self.version_log, 'w', encoding='utf-8') as f:
-            json.dump(log, f, ensure_ascii=False, indent=2)
+        self.versions.append(paths, f"synced {len(paths)} file(s)")
+        if self.version_log.stat().st_size > self.version_log_compact_bytes:
+            cutoff = datetime.now(timezone.utc) - timedelta(days=self.version_log_retain_days)
+            # only rewrite when something can be folded; otherwise a log that stays over
+            # the threshold would be rewritten in full on every sync
+            if not self.versions.needs_compaction(cutoff):
+                return
+            self.versions.compact(cutoff)
+            self.log.info(f'version log compacted up to {cutoff.isoformat()}')
 
     def run_once(self):
-        since = self._load_last_sync()
-        recs = self._extract_new_records(since)
-        if not recs:
+        last_id = self._load_last_id()
+        since_id, self._db_ino = self._rewind_if_recreated(last_id, self._db_ino)
+        if since_id != last_id:
+            self._save_last_id(since_id)
+        total = 0
+        for chunk in self._iter_record_chunks(since_id):
+            with self._write_lock:
+                paths = self._write_exports(chunk)
+            if self.publisher is not None:
+                self.publisher.enqueue(paths, sum(len(r['data']) + len(r['ts']) + 12 for r in chunk))
+            total += len(chunk)
+        if self.publisher is None:
+            pending = self._load_state().get('pending_paths') or []
+            if pending and self._commit_and_push(pending):
+                self._remove_pending_paths(pending)
+        if not total:
             self.log.info('no new records')
             return
-        paths = self._write_exports(recs)
-        self._commit_and_push(paths)
-        now_iso = datetime.now(timezone.utc).isoformat()
-        self._save_last_sync(now_iso)
-        self.log.info(f'synced {len(recs)} records')
+        self.log.info(f'synced {total} records')
+
+    def publish_stats(self):
+        if self.publisher is None:
+            return {'queue_depth': len(self._load_state().get('pending_paths') or [])}
+        return self.publisher.stats()
 
     def run_forever(self):
-        while True:
-            try:
-                if self._is_recording():
-                    self.run_once()
+        if self.staged:
+            return self._run_staged()
+        if self.publisher is not None:
+            self.publisher.enqueue(self._load_state().get('pending_paths') or [])
+            self.publisher.start()
+        try:
+            while True:
+                try:
+                    if self._should_sync():
+                        self.run_once()
+                    else:
+                        self.log.info('idle: recording not active, skip')
+                    if self.publisher is not None:
+                        st = self.publisher.stats()
+                        age = st['last_push_age']
+                        self.log.info(f"publish queue: {st['queue_depth']} file(s), {st['pending_bytes']} bytes, "
+                                      f"last push {'never' if age is None else f'{age:.0f}s ago'}")
+                except Exception as e:
+                    self.log.error(f'run_once error: {e}')
+                if self.trigger is not None:
+                    self.trigger.wait(self.max_idle)
                 else:
-                    self.log.info('idle: recording not active, skip')
-            except Exception as e:
-                self.log.error(f'run_once error: {e}')
-            time.sleep(self.interval)
+                    time.sleep(self.interval)
+        finally:
+            if self.publisher is not None:
+                self.publisher.stop(flush=True, timeout=60)
+            if self.trigger is not None:
+                self.trigger.close()
+
+    def _run_staged(self):
+        engine = StagedSyncEngine(self, queue_size=self.queue_size)
+        engine.start()
+        try:
+            while True:
+                time.sleep(max(self.interval, 30))
+                st = engine.stats()
+                ex, wr, pub = st['extract'], st['write'], st['publish']
+                self.log.info(f"stages: extract {ex['rows_per_sec']:.0f} rows/s, "
+                              f"write {wr['rows_per_sec']:.0f} rows/s (queue {wr['queue_depth']}), "
+                              f"publish queue {pub['queue_depth']} file(s)")
+        finally:
+            engine.stop(timeout=60)
+            if self.trigger is not None:
+                self.trigger.close()
+
+    def _should_sync(self):
+        # with a change trigger, wake-ups already mean rows were committed; this also
+        # picks up the tail written just before recording stopped
+        if self.trigger is not None:
+            return True
+        return self._is_recording()
 
     def _is_recording(self):
         try:
@@ -199,8 +940,27 @@ def main():
     parser.add_argument('--once', action='store_true')
     parser.add_argument('--interval', type=int, default=5)
     parser.add_argument('--db-path', type=str, default=None)
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--archive-format', choices=['csv', 'columnar', 'both'], default='csv')
+    parser.add_argument('--commit-every', type=float, default=300,
+                        help='seconds between coalesced git commit/push (0 = commit every cycle)')
+    parser.add_argument('--commit-max-mb', type=float, default=8,
+                        help='flush early once this many MB are pending')
+    parser.add_argument('--staged', action='store_true',
+                        help='run extract / write / publish as concurrent stages')
+    parser.add_argument('--queue-size', type=int, default=4,
+                        help='max chunks buffered between extract and write stages')
+    parser.add_argument('--trigger', choices=['poll', 'event'], default='poll',
+                        help='poll every interval, or sync when ems.db changes (inotify / PRAGMA data_version)')
+    parser.add_argument('--debounce', type=float, default=0.5,
+                        help='seconds to coalesce db writes into one sync in event mode')
     args = parser.parse_args()
-    svc = SyncService(interval=args.interval, db_path=args.db_path)
+    svc = SyncService(interval=args.interval, db_path=args.db_path, chunk_size=args.chunk_size,
+                      archive_format=args.archive_format,
+                      commit_every=None if args.once else args.commit_every,
+                      commit_max_mb=args.commit_max_mb,
+                      staged=args.staged, queue_size=args.queue_size,
+                      trigger=args.trigger, debounce=args.debounce)
     if args.once:
         svc.run_once()
     else:
@@ -0,0 +1,217 @@
+import os
+import json
+import bisect
+from pathlib import Path
+from datetime import datetime, timezone
+
+
+def _iso(t):
+    if t is None:
+        return None
+    if isinstance(t, (int, float)):
+        dt = datetime.fromtimestamp(t, timezone.utc)
+    elif isinstance(t, datetime):
+        dt = t
+    else:
+        dt = datetime.fromisoformat(str(t))
+    if dt.tzinfo is None:
+        dt = dt.astimezone()
+    return dt.astimezone(timezone.utc).isoformat()
+
+
+class VersionLog:
+    def __init__(self, path, stride=256, legacy_path=None):
+        self.path = Path(path)
+        self.index_path = self.path.with_name(self.path.name + '.idx')
+        self.legacy_path = Path(legacy_path) if legacy_path else None
+        self.stride = max(1, int(stride))
+        self._index = None
+        self._last_seq = None
+        self._migrate_legacy()
+
+    def _migrate_legacy(self):
+        if self.legacy_path is None or not self.legacy_path.exists() or self.path.exists():
+            return
+        try:
+            with open(self.legacy_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except Exception:
+            return
+        if not isinstance(entries, list):
+            return
+        self._rewrite(entries)
+        self.legacy_path.unlink(missing_ok=True)
+
+    def _load_index(self):
+        if self._index is not None:
+            return self._index
+        index = []
+        size = self.path.stat().st_size if self.path.exists() else 0
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    seq, ts, off = line.split()
+                    if int(off) >= size:
+                        raise ValueError('index past end of log')
+                    index.append((ts, int(seq), int(off)))
+        except FileNotFoundError:
+            if size:
+                index = self._rebuild_index()
+        except Exception:
+            index = self._rebuild_index()
+        self._index = index
+        return index
+
+    def _rebuild_index(self):
+        index = []
+        for n, (off, entry) in enumerate(self._scan(0)):
+            if n % self.stride == 0:
+                index.append((entry['timestamp'], entry['seq'], off))
+        tmp = self.index_path.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for ts, seq, off in index:
+                f.write(f'{seq} {ts} {off}\n')
+        os.replace(tmp, self.index_path)
+        return index
+
+    def _scan(self, offset):
+        if not self.path.exists():
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            while True:
+                off = f.tell()
+                line = f.readline()
+                if not line:
+                    return
+                try:
+                    entry = json.loads(line)
+                except Exception:
+                    # torn tail from an interrupted append
+                    continue
+                yield off, entry
+
+    def last_seq(self):
+        if self._last_seq is None:
+            index = self._load_index()
+            seq = 0
+            for _, entry in self._scan(index[-1][2] if index else 0):
+                seq = entry['seq']
+            self._last_seq = seq
+        return self._last_seq
+
+    def append(self, changed_files, summary, timestamp=None):
+        seq = self.last_seq() + 1
+        entry = {
+            'seq': seq,
+            'timestamp': _iso(timestamp) or datetime.now(timezone.utc).isoformat(),
+            'changed_files': list(changed_files),
+            'summary': summary,
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'a+b') as f:
+            f.seek(0, os.SEEK_END)
+            off = f.tell()
+            if off:
+                f.seek(off - 1)
+                if f.read(1) != b'\n':
+                    # terminate a torn line so it does not swallow this entry
+                    f.write(b'\n')
+                    off += 1
+            f.write(json.dumps(entry, ensure_ascii=False).encode('utf-8') + b'\n')
+        index = self._load_index()
+        if not index or seq - index[-1][1] >= self.stride:
+            with open(self.index_path, 'a', encoding='utf-8') as f:
+                f.write(f"{seq} {entry['timestamp']} {off}\n")
+            index.append((entry['timestamp'], seq, off))
+        self._last_seq = seq
+        return entry
+
+    def entries(self, start=None, end=None):
+        start, end = _iso(start), _iso(end)
+        index = self._load_index()
+        offset = 0
+        if start is not None and index:
+            i = bisect.bisect_left(index, (start,)) - 1
+            offset = index[i][2] if i >= 0 else 0
+        for _, entry in self._scan(offset):
+            ts = entry['timestamp']
+            if start is not None and ts < start:
+                continue
+            if end is not None and ts > end:
+                return
+            yield entry
+
+    def _offset_for_seq(self, seq):
+        index = self._load_index()
+        i = bisect.bisect_right([s for _, s, _ in index], seq) - 1
+        return index[i][2] if i >= 0 else 0
+
+    def entry(self, seq):
+        seq = int(seq)
+        for _, e in self._scan(self._offset_for_seq(seq)):
+            first = e.get('first_seq', e['seq'])
+            if first <= seq <= e['seq']:
+                return e
+            if first > seq:
+                return None
+        return None
+
+    def files_changed_since(self, seq):
+        seq = int(seq)
+        files = set()
+        for _, e in self._scan(self._offset_for_seq(seq)):
+            if e['seq'] > seq:
+                files.update(e.get('changed_files') or [])
+        return sorted(files)
+
+    def needs_compaction(self, older_than):
+        # compacted entries form a prefix with one line per day, so finding the
+        # first raw entry costs O(days), not O(syncs)
+        cutoff = _iso(older_than)
+        for _, e in self._scan(0):
+            if 'syncs' not in e:
+                return e['timestamp'] < cutoff
+        return False
+
+    def compact(self, older_than):
+        cutoff = _iso(older_than)
+        out = []
+        day_group = None
+        for _, e in self._scan(0):
+            if e['timestamp'] >= cutoff:
+                day_group = None
+                out.append(e)
+                continue
+            day = e['timestamp'][:10]
+            if day_group is None or day_group['timestamp'][:10] != day:
+                day_group = {
+                    'seq': e['seq'],
+                    'first_seq': e.get('first_seq', e['seq']),
+                    'timestamp': e['timestamp'],
+                    'changed_files': list(e.get('changed_files') or []),
+                    'syncs': e.get('syncs', 1),
+                }
+                out.append(day_group)
+                continue
+            day_group['seq'] = e['seq']
+            day_group['changed_files'] = sorted(set(day_group['changed_files']) | set(e.get('changed_files') or []))
+            day_group['syncs'] += e.get('syncs', 1)
+        for e in out:
+            if 'syncs' in e:
+                e['summary'] = f"compacted {e['syncs']} sync(s)"
+        self._rewrite(out)
+
+    def _rewrite(self, entries):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix('.tmp')
+        with open(tmp, 'wb') as f:
+            for seq, e in enumerate(entries, start=1):
+                row = {'seq': e.get('seq', seq)}
+                row.update(e)
+                f.write(json.dumps(row, ensure_ascii=False).encode('utf-8') + b'\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._index = self._rebuild_index()
+        self._last_seq = None